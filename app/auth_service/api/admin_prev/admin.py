@@ -0,0 +1,184 @@
+import base64
+import csv
+import io
+import json
+import os
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import String, or_, select, tuple_, type_coerce
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ....db_util.db_conn import AsyncSessionLocal, get_db
+from ....db_util.models import User
+from ..auth.user_auth import Principal, require_role
+
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", 50))
+ADMIN_PAGE_MAX = 500
+# Rows fetched per query while streaming an export; each batch uses its own
+# short-lived session, so a slow client never holds a pooled connection.
+ADMIN_EXPORT_BATCH_SIZE = int(os.getenv("ADMIN_EXPORT_BATCH_SIZE", 1000))
+
+EXPORT_FIELDS = ("id", "username", "email", "role", "active", "created_at")
+
+router = APIRouter()
+
+
+@dataclass
+class UserFilter:
+    role: Optional[str] = None
+    active: Optional[bool] = None
+    q: Optional[str] = None  # prefix of the username or email
+    order: str = "desc"  # by creation time
+
+
+def user_filter(
+    role: Optional[str] = Query(None, max_length=50),
+    active: Optional[bool] = None,
+    q: Optional[str] = Query(None, min_length=1, max_length=120),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+) -> UserFilter:
+    return UserFilter(role=role, active=active, q=q, order=order)
+
+
+def encode_cursor(created_at: datetime, user_id: uuid.UUID) -> str:
+    """Opaque cursor pointing just past the given row."""
+    raw = json.dumps([created_at.isoformat(), str(user_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, user_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), uuid.UUID(user_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def _like_prefix(q: str) -> str:
+    return q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def user_page_query(dialect: str, filters: UserFilter, after, limit: int):
+    """
+    One page of users in (created_at, id) order, starting after the `after`
+    position. The row comparison is answered by the (created_at, id) index,
+    so every page costs the same however deep it is, unlike OFFSET.
+    """
+    stmt = select(User.id, User.username, User.email, User.role, User.is_active, User.created_at)
+    if filters.role is not None:
+        stmt = stmt.where(User.role == filters.role)
+    if filters.active is not None:
+        stmt = stmt.where(User.is_active == filters.active)
+    if filters.q is not None:
+        pattern = _like_prefix(filters.q)
+        stmt = stmt.where(or_(
+            User.username.like(pattern, escape="\\"),
+            User.email.like(pattern, escape="\\"),
+        ))
+    if after is not None:
+        created_at, user_id = after
+        if dialect == "sqlite":
+            # SQLite keeps the server default timestamps as text without
+            # fractional seconds; compare in that format.
+            created_at = type_coerce(created_at.strftime("%Y-%m-%d %H:%M:%S"), String)
+        position = tuple_(User.created_at, User.id)
+        stmt = stmt.where(position < tuple_(created_at, user_id) if filters.order == "desc"
+                          else position > tuple_(created_at, user_id))
+    if filters.order == "desc":
+        stmt = stmt.order_by(User.created_at.desc(), User.id.desc())
+    else:
+        stmt = stmt.order_by(User.created_at, User.id)
+    return stmt.limit(limit)
+
+
+def user_dict(row) -> dict:
+    return {
+        "id": str(row.id),
+        "username": row.username,
+        "email": row.email,
+        "role": row.role,
+        "active": row.is_active,
+        "created_at": row.created_at.isoformat(),
+    }
+
+
+@router.get("/users")
+async def list_users(
+    limit: int = Query(ADMIN_PAGE_SIZE, ge=1, le=ADMIN_PAGE_MAX),
+    cursor: Optional[str] = None,
+    filters: UserFilter = Depends(user_filter),
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(require_role("admin")),
+):
+    """
+    Lists users newest first (order=asc for oldest first), filtered by role,
+    active and a username/email prefix (q). Pass next_cursor back as cursor
+    for the next page; it is null on the last page.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    # One extra row tells whether there is a next page.
+    stmt = user_page_query(db.bind.dialect.name, filters, after, limit + 1)
+    rows = (await db.execute(stmt)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return {"users": [user_dict(row) for row in rows], "next_cursor": next_cursor}
+
+
+async def iter_users(filters: UserFilter, batch_size: int = ADMIN_EXPORT_BATCH_SIZE):
+    """Yields every user matching filters, one keyset page per query."""
+    after = None
+    while True:
+        async with AsyncSessionLocal() as db:
+            stmt = user_page_query(db.bind.dialect.name, filters, after, batch_size)
+            rows = (await db.execute(stmt)).all()
+        for row in rows:
+            yield row
+        if len(rows) < batch_size:
+            return
+        after = (rows[-1].created_at, rows[-1].id)
+
+
+@router.get("/users/export")
+async def export_users(
+    format: str = Query("jsonl", pattern="^(jsonl|csv)$"),
+    filters: UserFilter = Depends(user_filter),
+    admin: Principal = Depends(require_role("admin")),
+):
+    """Streams all matching users as JSONL (default) or CSV, without loading them at once."""
+
+    async def lines():
+        if format == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            async for row in iter_users(filters):
+                writer.writerow(user_dict(row))
+                if buffer.tell() >= 64 * 1024:
+                    yield buffer.getvalue().encode()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue().encode()
+        else:
+            chunk = []
+            async for row in iter_users(filters):
+                chunk.append(json.dumps(user_dict(row)))
+                if len(chunk) >= 500:
+                    yield ("\n".join(chunk) + "\n").encode()
+                    chunk = []
+            if chunk:
+                yield ("\n".join(chunk) + "\n").encode()
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        lines(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'},
+    )
@@ -0,0 +1,6 @@
+from fastapi import APIRouter
+from . import admin
+
+router = APIRouter(prefix="/auth/admin", tags=["admin"],)
+
+router.include_router(admin.router)
@@ -0,0 +1,152 @@
+import csv
+import json
+import os
+import tempfile
+from typing import AsyncIterator, Iterable, Iterator
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+
+from ....auth_util.passwords import hash_passwords
+from ....db_util.db_conn import AsyncSessionLocal, insert_ignoring_conflicts
+from ....db_util.models import User
+from .user_auth import Principal, require_role
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_REGISTER_BATCH_SIZE", 500))
+SPOOL_MAX_MEMORY = 1024 * 1024
+
+router = APIRouter()
+
+
+def _decoded_lines(f: Iterable[bytes]) -> Iterator[str]:
+    for raw in f:
+        yield raw.decode("utf-8", errors="replace")
+
+
+async def parse_user_records(f: Iterable[bytes], fmt: str) -> AsyncIterator[tuple]:
+    """
+    Yields (line_no, record, None) for each JSONL object or CSV row of a
+    binary file, or (line_no, None, error) for one that can't be parsed. A
+    CSV stream must start with a header naming user_name (or username),
+    password and email; quoted CSV fields may span lines, and line_no is
+    where the row starts.
+    """
+    if fmt == "csv":
+        reader = csv.reader(_decoded_lines(f))
+        header = None
+        while True:
+            line_no = reader.line_num + 1
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                yield line_no, None, f"could not parse line: {e}"
+                continue
+            if not any(field.strip() for field in row):
+                continue
+            if header is None:
+                header = [name.strip() for name in row]
+                continue
+            yield line_no, dict(zip(header, row)), None
+
+    for line_no, line in enumerate(_decoded_lines(f), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            yield line_no, None, f"could not parse line: {e}"
+            continue
+        yield line_no, record, None
+
+
+def _validate(record: dict):
+    user_name = record.get("user_name") or record.get("username")
+    password = record.get("password")
+    email = record.get("email")
+    if not all(isinstance(value, str) and value for value in (user_name, password, email)):
+        return None, "user_name, password and email are required"
+    if len(user_name) > 50 or len(email) > 120:
+        return None, "user_name or email too long"
+    return {"username": user_name, "password": password, "email": email}, None
+
+
+async def _insert_batch(batch: list) -> AsyncIterator[dict]:
+    hashes = await hash_passwords([row["password"] for _, row in batch])
+    values = [
+        {
+            "username": row["username"],
+            "email": row["email"],
+            "password_hash": password_hash,
+            "role": "user",
+            "is_active": True,
+        }
+        for (_, row), password_hash in zip(batch, hashes)
+    ]
+
+    async with AsyncSessionLocal() as db:
+        # One multi-row INSERT per batch; rows that clash with an existing
+        # username/email (or with an earlier row of the batch) are skipped.
+        stmt = insert_ignoring_conflicts(db, User).values(values).returning(User.id, User.username)
+        result = await db.execute(stmt)
+        created = {username: user_id for user_id, username in result.all()}
+        await db.commit()
+
+    for line_no, row in batch:
+        user_id = created.pop(row["username"], None)
+        if user_id is None:
+            yield {"line": line_no, "username": row["username"], "status": "exists"}
+        else:
+            yield {"line": line_no, "username": row["username"], "status": "created", "id": str(user_id)}
+
+
+async def provision_users(records: AsyncIterator[tuple], batch_size: int = BULK_BATCH_SIZE) -> AsyncIterator[dict]:
+    """
+    Registers users from parse_user_records() in batches and yields one
+    result per input row. At most one batch is held in memory at a time.
+    """
+    batch = []
+    async for line_no, record, error in records:
+        if error is None:
+            row, error = _validate(record)
+        if error:
+            yield {"line": line_no, "status": "invalid", "error": error}
+            continue
+        batch.append((line_no, row))
+        if len(batch) >= batch_size:
+            async for result in _insert_batch(batch):
+                yield result
+            batch = []
+    if batch:
+        async for result in _insert_batch(batch):
+            yield result
+
+
+@router.post("/register/bulk")
+async def register_bulk(request: Request, admin: Principal = Depends(require_role("admin"))):
+    """
+    Registers users from a JSONL (default) or CSV (Content-Type: text/csv)
+    request body and streams one JSON result line per input row.
+    """
+    fmt = "csv" if request.headers.get("content-type", "").startswith("text/csv") else "jsonl"
+
+    # Spool the upload before responding: the streaming response competes for
+    # the same receive channel, and the spool file keeps memory flat anyway.
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+
+    async def results():
+        try:
+            records = parse_user_records(spool, fmt)
+            async for result in provision_users(records):
+                yield json.dumps(result).encode() + b"\n"
+        finally:
+            spool.close()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
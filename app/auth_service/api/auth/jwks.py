@@ -0,0 +1,25 @@
+import hashlib
+import os
+
+from fastapi import APIRouter, Request, Response
+
+from ....auth_util.signing_keys import key_ring
+
+# Keep this well below the time a new key is staged before it is activated,
+# so every JWKS cache has seen it before tokens signed with it show up.
+JWKS_MAX_AGE_SECONDS = int(os.getenv("JWKS_MAX_AGE_SECONDS", 300))
+
+router = APIRouter()
+
+
+@router.get("/.well-known/jwks.json")
+async def jwks(request: Request):
+    body = key_ring.jwks_json()
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    headers = {
+        "Cache-Control": f"public, max-age={JWKS_MAX_AGE_SECONDS}",
+        "ETag": etag,
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,6 +1,8 @@
 from fastapi import APIRouter
-from . import user_auth
+from . import bulk_register, jwks, user_auth
 
 router = APIRouter(prefix="/auth", tags=["auth"],)
 
 router.include_router(user_auth.router)
+router.include_router(jwks.router)
+router.include_router(bulk_register.router)
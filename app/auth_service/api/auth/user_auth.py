@@ -1,23 +1,64 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import ORJSONResponse
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import delete, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from passlib.context import CryptContext
 
-from typing import Optional
+import hashlib
+import os
+import secrets
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 from dataclasses import dataclass
 
-from ....db_util.db_conn import get_db
-
-from ....db_util.db_conn import get_db
-from ....db_util.models import User
-from ....auth_util.access_tokens import create_access_token, verify_access_token
+from ....db_util.db_conn import get_db, insert_ignoring_conflicts
+from ....db_util.models import RefreshToken, RevokedSession, User
+from ....auth_util.access_tokens import ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token, verify_access_token
+from ....auth_util.cache import TTLCache
+from ....auth_util.principal import Principal
+from ....auth_util.passwords import PasswordHasherBusy, hash_password, verify_password_and_update
+from ....auth_util.revocation import revocation_index
+from ....metrics_util.metrics import Counter, Gauge
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+
+# Per-process cache of resolved users keyed by user id. Anything that modifies
+# a user row must call invalidate_cached_user.
+user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_MAXSIZE", 10_000)),
+    ttl=float(os.getenv("USER_CACHE_TTL_SECONDS", 60)),
+)
+Gauge(
+    "user_cache",
+    "Size and cumulative hit/miss counts of the resolved-user cache.",
+    labelnames=("stat",),
+    callback=lambda: {(name,): value for name, value in user_cache.stats().items()},
+)
+
+# Refresh tokens renew access tokens without the password (and without an
+# argon2 verification). Each use rotates the token; a rotated token that is
+# used again revokes its whole session.
+REFRESH_TOKEN_EXPIRE_DAYS = float(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 14))
+
+refresh_requests = Counter(
+    "refresh_tokens_total",
+    "Refresh token uses by result (rotated, invalid, revoked).",
+    labelnames=("result",),
+)
 
 router = APIRouter()
 
+
+def hasher_busy_exception(e: PasswordHasherBusy) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server busy, try again later",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
 @dataclass
 class User_Data:
     user_name: str
@@ -25,31 +66,128 @@ class User_Data:
     email: Optional[str]
 
 
-@router.post("/register")
+# Response payloads. Endpoints return them as ORJSONResponse directly, so
+# orjson serializes the dataclass (UUIDs and datetimes included) without
+# FastAPI's validation and jsonable_encoder pass; response_model only
+# documents them.
+@dataclass(frozen=True)
+class User_Response:
+    id: uuid.UUID
+    username: str
+    email: str
+    role: str
+    is_active: bool
+    created_at: datetime
+
+    @classmethod
+    def from_row(cls, row) -> "User_Response":
+        return cls(row.id, row.username, row.email, row.role, row.is_active, row.created_at)
+
+
+# The only columns loaded for a User_Response; never the password hash.
+USER_RESPONSE_COLUMNS = (User.id, User.username, User.email, User.role, User.is_active, User.created_at)
+
+
+@dataclass(frozen=True)
+class Token_Response:
+    access_token: str
+    token_type: str
+    expires_in: int
+    refresh_token: str
+
+
+@dataclass
+class Refresh_Data:
+    refresh_token: str
+
+
+@dataclass
+class Logout_Data:
+    refresh_token: str
+    everywhere: bool = False  # end all of the user's sessions, not just this one
+
+
+def hash_refresh_token(token: str) -> str:
+    # Refresh tokens are 256 random bits, so a fast hash is enough to keep
+    # a database leak from handing out usable tokens.
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue_refresh_token(db: AsyncSession, user_id, session_id) -> str:
+    """Adds a new refresh token of the session to db (committed by the caller)."""
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        user_id=user_id,
+        session_id=session_id,
+        token_hash=hash_refresh_token(token),
+        expires_at=datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+
+def token_response(user_id, role: str, session_id, refresh_token: str) -> ORJSONResponse:
+    access_token = create_access_token({"user_id": user_id, "role": role, "sid": session_id})
+    return ORJSONResponse(Token_Response(
+        access_token=access_token,
+        token_type="bearer",
+        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        refresh_token=refresh_token,
+    ))
+
+
+async def revoke_sessions(db: AsyncSession, user_id, session_ids: List[uuid.UUID]) -> None:
+    """
+    Ends login sessions: their refresh tokens stop working and their access
+    tokens are rejected by every auth service process (immediately in this
+    one, within REVOCATION_SYNC_SECONDS in the others) until they expire.
+    """
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.session_id.in_(session_ids), RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now)
+    )
+    await db.execute(
+        insert_ignoring_conflicts(db, RevokedSession).values([
+            {"session_id": session_id, "user_id": user_id, "expires_at": expires_at}
+            for session_id in session_ids
+        ])
+    )
+    await db.execute(delete(RevokedSession).where(RevokedSession.expires_at <= now))
+    await db.commit()
+    for session_id in session_ids:
+        revocation_index.add(str(session_id), expires_at.timestamp())
+
+
+@router.post("/register", response_model=User_Response)
 async def register(user_payload: User_Data, db: AsyncSession = Depends(get_db)):
-    stmt = select(User).where(user_payload.user_name == User.username or user_payload.email == User.email)
-    result = await db.execute(stmt)
-    if(result.scalar_one_or_none()):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail = "Username or mail already exists"
+    try:
+        hashed_password = await hash_password(user_payload.password)
+    except PasswordHasherBusy as e:
+        raise hasher_busy_exception(e)
+
+    # One statement both checks uniqueness and inserts: a clash on username or
+    # email inserts nothing and returns no row.
+    stmt = (
+        insert_ignoring_conflicts(db, User)
+        .values(
+            username = user_payload.user_name,
+            email = user_payload.email,
+            password_hash = hashed_password,
+            role = 'user',
+            is_active = True,
         )
-    # print("ans =======================> " ,user_payload.password)
-    hashed_password = pwd_context.hash(user_payload.password)
-
-    new_user = User(
-        username = user_payload.user_name,
-        email = user_payload.email,
-        password_hash = hashed_password ,
-        role = 'user',
-        is_active = True,
+        .returning(*USER_RESPONSE_COLUMNS)
     )
 
-    db.add(new_user)
-
     try:
+        result = await db.execute(stmt)
+        new_user = result.one_or_none()
         await db.commit()
-        await db.refresh(new_user)
+    except IntegrityError:
+        await db.rollback()
+        new_user = None
     except Exception as e:
         print(e)
         await db.rollback()
@@ -58,17 +196,16 @@ async def register(user_payload: User_Data, db: AsyncSession = Depends(get_db)):
             detail = f"could not add user to db ecec {e}"
             
         )
-    
-    return {
-        "id": str(new_user.id),
-        "username" : new_user.username,
-        "email" : new_user.email,
-        "active" : new_user.is_active,
-        "role" : new_user.role,
-        "cerated_at" : new_user.created_at,      
-    }
-
-@router.post("/login")
+
+    if new_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail = "Username or mail already exists"
+        )
+
+    return ORJSONResponse(User_Response.from_row(new_user))
+
+@router.post("/login", response_model=Token_Response)
 async def login(user_payload: User_Data, db: AsyncSession = Depends(get_db)):
     if(not user_payload.email and not user_payload.user_name):
         raise HTTPException(
@@ -76,60 +213,199 @@ async def login(user_payload: User_Data, db: AsyncSession = Depends(get_db)):
             detail="Both username and email empty"
         )
 
+    stmt = select(User.id, User.role, User.password_hash)
     if user_payload.email:
-        stmt = select(User).where(User.email == user_payload.email)
+        stmt = stmt.where(User.email == user_payload.email)
     else:
-        stmt = select(User).where(User.username == user_payload.user_name)
+        stmt = stmt.where(User.username == user_payload.user_name)
 
     result = await db.execute(stmt)
-    user = result.scalar_one_or_none()
+    user = result.one_or_none()
 
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
-    
-    if not pwd_context.verify(user_payload.password, user.password_hash):
+
+    # Hand the pooled connection back before waiting on the hashing pool so
+    # queued logins can't starve other endpoints of DB connections.
+    await db.close()
+
+    try:
+        password_ok, new_hash = await verify_password_and_update(user_payload.password, user.password_hash)
+    except PasswordHasherBusy as e:
+        raise hasher_busy_exception(e)
+
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect password"
         )
-    
-    access_token = create_access_token({'user_id' : user.id, "role" : user.role})
-    return {"access_token": access_token, "token_type": "bearer"}
+    if new_hash is not None:
+        await store_rehashed_password(db, user, new_hash)
+
+    session_id = uuid.uuid4()
+    refresh_token = issue_refresh_token(db, user.id, session_id)
+    await db.commit()
+    return token_response(user.id, user.role, session_id, refresh_token)
+
+
+def invalid_refresh_token_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+    )
+
+
+@router.post("/refresh", response_model=Token_Response)
+async def refresh(payload: Refresh_Data, db: AsyncSession = Depends(get_db)):
+    """
+    Trades a refresh token for a new access token and a new refresh token,
+    with one indexed lookup instead of a password verification. The old
+    refresh token stops working.
+    """
+    now = datetime.now(timezone.utc)
+    result = await db.execute(
+        select(
+            RefreshToken.id, RefreshToken.user_id, RefreshToken.session_id, RefreshToken.revoked_at,
+            User.role, User.is_active,
+        )
+        .join(User, User.id == RefreshToken.user_id)
+        .where(RefreshToken.token_hash == hash_refresh_token(payload.refresh_token), RefreshToken.expires_at > now)
+    )
+    token = result.one_or_none()
+    if token is None or not token.is_active:
+        refresh_requests.labels("invalid").inc()
+        raise invalid_refresh_token_exception()
+
+    rotated = 0
+    if token.revoked_at is None:
+        # Only one of several concurrent uses of a token can win this update.
+        rotated = (await db.execute(
+            update(RefreshToken)
+            .where(RefreshToken.id == token.id, RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=now)
+        )).rowcount
+    if not rotated:
+        # Already rotated or revoked: either the session was logged out or
+        # the token leaked and someone else used it first. End the session.
+        await db.rollback()
+        await revoke_sessions(db, token.user_id, [token.session_id])
+        refresh_requests.labels("revoked").inc()
+        raise invalid_refresh_token_exception()
+
+    refresh_token = issue_refresh_token(db, token.user_id, token.session_id)
+    await db.commit()
+    refresh_requests.labels("rotated").inc()
+    return token_response(token.user_id, token.role, token.session_id, refresh_token)
+
+
+@router.post("/logout")
+async def logout(payload: Logout_Data, db: AsyncSession = Depends(get_db)):
+    """Ends the refresh token's session, or with everywhere all of its user's sessions."""
+    result = await db.execute(
+        select(RefreshToken.user_id, RefreshToken.session_id)
+        .where(RefreshToken.token_hash == hash_refresh_token(payload.refresh_token))
+    )
+    token = result.one_or_none()
+    if token is None:
+        raise invalid_refresh_token_exception()
+
+    session_ids = {token.session_id}
+    if payload.everywhere:
+        result = await db.execute(
+            select(RefreshToken.session_id).distinct()
+            .where(RefreshToken.user_id == token.user_id, RefreshToken.revoked_at.is_(None))
+        )
+        session_ids.update(result.scalars().all())
+    await revoke_sessions(db, token.user_id, list(session_ids))
+    return {"revoked_sessions": len(session_ids)}
     
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
-):
-    print("token aa gaya oye == > ", token)
+async def store_rehashed_password(db: AsyncSession, user, new_hash: str) -> None:
+    """
+    Replaces a hash made with outdated argon2 parameters. Only applies if the
+    stored hash is unchanged, so a password change in the meantime wins. A
+    failure here must not fail the login; the next login tries again.
+    """
     try:
-        payload = verify_access_token(token)
-        user_id: str = payload.get("user_id")
-        print(f"{payload=}")
-        print(f"{user_id=}")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token",
-            )
+        await db.execute(
+            update(User)
+            .where(User.id == user.id, User.password_hash == user.password_hash)
+            .values(password_hash=new_hash)
+        )
+        await db.commit()
     except Exception as e:
+        await db.rollback()
+        print(f"could not store rehashed password for user {user.id}: {e}")
+        return
+    invalidate_cached_user(user.id)
+
+
+def invalidate_cached_user(user_id) -> None:
+    user_cache.pop(str(user_id))
+
+
+async def get_current_principal(token: str = Depends(oauth2_scheme)) -> Principal:
+    """
+    Resolves the caller from the verified token alone, without touching the DB.
+    Use it for routes that only need the user id and role.
+    """
+    payload = verify_access_token(token)
+    if payload is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate token",
         )
+    if revocation_index.is_revoked(payload["sid"]):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Session has been revoked",
+        )
+    return Principal(user_id=payload["user_id"], role=payload["role"], session_id=payload["sid"])
+
+
+def require_role(role: str):
+    """Dependency factory that only lets principals with the given role through."""
+    async def check_role(principal: Principal = Depends(get_current_principal)) -> Principal:
+        if principal.role != role:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not enough permissions",
+            )
+        return principal
+    return check_role
+
+
+async def get_current_user(
+    principal: Principal = Depends(get_current_principal), db: AsyncSession = Depends(get_db)
+):
+    # The session only checks out a pooled connection on its first query, so
+    # cache hits never touch the pool.
+    user = user_cache.get(principal.user_id)
+    if user is not None:
+        return user
+
+    try:
+        user_id = uuid.UUID(principal.user_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token",
+        )
 
-    stmt = select(User).where(User.id == user_id)
+    stmt = select(*USER_RESPONSE_COLUMNS).where(User.id == user_id)
     result = await db.execute(stmt)
-    user = result.scalar_one_or_none()
-    if user is None:
+    row = result.one_or_none()
+    if row is None:
         raise HTTPException(status_code=404, detail="User not found")
-    print("user verified")
+    user = User_Response.from_row(row)
+    user_cache.set(principal.user_id, user)
     return user
 
-@router.get("/me")
-async def read_users_me(current_user: User = Depends(get_current_user)):
-    return current_user
+@router.get("/me", response_model=User_Response)
+async def read_users_me(current_user: User_Response = Depends(get_current_user)):
+    return ORJSONResponse(current_user)
 
 
@@ -2,14 +2,34 @@
 from datetime import datetime
 from fastapi import FastAPI, Request, Response
 
+from .api.admin_prev import router as admin_router
 from .api.auth import router as authentication_router
-from ..db_util.db_conn import Base, engine
+from ..auth_util.passwords import calibrate_password_hashing
+from ..auth_util.rate_limit import RateLimitMiddleware, create_bucket_store
+from ..auth_util.revocation import revocation_index
+from ..auth_util.signing_keys import key_ring
+from ..db_util.db_conn import dispose_engine
+from ..db_util.migrations import ensure_schema
+from ..metrics_util import router as metrics_router
+from ..metrics_util.middleware import MetricsMiddleware
 
 
 
+rate_limit_store = create_bucket_store()
+
 app = FastAPI(title="Video TO mp3 auth service")
+# Only the endpoints that hash passwords are throttled.
+app.add_middleware(
+    RateLimitMiddleware,
+    store=rate_limit_store,
+    paths=("/auth/login", "/auth/register"),
+    login_path="/auth/login",
+)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(authentication_router.router)
+app.include_router(admin_router.router)
+app.include_router(metrics_router.router)
 
 @app.get("/")
 async def root():
@@ -18,5 +38,16 @@ async def root():
 
 @app.on_event("startup")
 async def startup():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    await ensure_schema()
+    # Fails startup on missing keys rather than the first login.
+    key_ring.signing_key()
+    await revocation_index.load()
+    revocation_index.start()
+    await calibrate_password_hashing()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await revocation_index.stop()
+    await rate_limit_store.close()
+    await dispose_engine()
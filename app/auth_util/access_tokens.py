@@ -1,14 +1,39 @@
 import jwt  
 from jwt import ExpiredSignatureError, InvalidTokenError
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Callable, Optional, Tuple
+import hashlib
+import os
+import time
 import uuid
 
-# Secret key should be long, random, and stored in env variables
-SECRET_KEY = "YOUR_SUPER_SECRET_KEY_CHANGE_THIS"
-ALGORITHM = "HS256"
+from ..metrics_util.metrics import Gauge, Histogram
+from .cache import TTLCache
+from .signing_keys import key_ring
+
+token_seconds = Histogram(
+    "jwt_seconds",
+    "Time spent signing (encode) and verifying (decode, cache misses only) access tokens.",
+    labelnames=("op",),
+)
+
+# Tokens are signed with the active key of the key ring (EdDSA or RS256) and
+# carry its kid, so other services can verify them against the JWKS endpoint.
 ACCESS_TOKEN_EXPIRE_MINUTES = 15
 
+# Verified claims keyed by a digest of the raw token. Only tokens that passed
+# signature verification are ever stored, and each entry expires with its token.
+_verified_tokens = TTLCache(
+    maxsize=int(os.getenv("TOKEN_CACHE_MAXSIZE", 10_000)),
+    ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+)
+Gauge(
+    "jwt_cache",
+    "Size and cumulative hit/miss counts of the verified-token cache.",
+    labelnames=("stat",),
+    callback=lambda: {(name,): value for name, value in _verified_tokens.stats().items()},
+)
+
 def create_access_token(
     data: dict, 
     expires_delta: Optional[timedelta] = None
@@ -28,21 +53,64 @@ def create_access_token(
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
 
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    start = time.perf_counter()
+    key = key_ring.signing_key()
+    encoded_jwt = jwt.encode(to_encode, key.private_key, algorithm=key.algorithm, headers={"kid": key.kid})
+    token_seconds.labels("encode").observe(time.perf_counter() - start)
     return encoded_jwt
 
 
-def verify_access_token(token: str):
+def verify_claims(token: str, find_key: Callable[[str], Optional[Tuple[object, str]]], cache: TTLCache):
     """
-    Verifies JWT and returns payload dict if valid.
-    Returns None if invalid or expired.
+    Verifies a JWT against the public key returned by find_key(kid) as a
+    (key, algorithm) pair and returns its {"user_id", "role", "sid"} claims, or None
+    if the token is invalid or expired. Verified claims are memoized in cache,
+    keyed by a digest of the raw token, until the token expires.
     """
+    cache_key = hashlib.sha256(token.encode()).digest()
+    claims = cache.get(cache_key)
+    if claims is not None:
+        return dict(claims)
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        kid = jwt.get_unverified_header(token).get("kid")
+        found = find_key(kid) if kid else None
+        if found is None:
+            return None
+        public_key, algorithm = found
+        start = time.perf_counter()
+        try:
+            payload = jwt.decode(token, public_key, algorithms=[algorithm])
+        finally:
+            token_seconds.labels("decode").observe(time.perf_counter() - start)
         user_id: str = payload.get("user_id")
         role: str = payload.get("role")
         if not user_id:
             return None
-        return {"user_id": user_id, "role": role}
+        claims = {"user_id": user_id, "role": role, "sid": payload.get("sid")}
     except (ExpiredSignatureError, InvalidTokenError):
         return None
+
+    remaining = payload["exp"] - time.time() if "exp" in payload else None
+    if remaining is None or remaining > 0:
+        cache.set(cache_key, claims, ttl=remaining)
+    return dict(claims)
+
+
+def _find_local_key(kid: str):
+    key = key_ring.get(kid)
+    return None if key is None else (key.public_key, key.algorithm)
+
+
+def verify_access_token(token: str):
+    """
+    Verifies JWT and returns payload dict if valid.
+    Returns None if invalid or expired.
+    Tokens seen before are answered from a cache until they expire.
+    """
+    return verify_claims(token, _find_local_key, _verified_tokens)
+
+
+def token_cache_stats() -> dict:
+    """Returns size and hit/miss counters of the verified-token cache."""
+    return _verified_tokens.stats()
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import os
+import re
+import time
+import urllib.request
+from typing import Dict, Optional, Tuple
+
+import jwt
+
+from .access_tokens import verify_claims
+from .cache import TTLCache
+
+AUTH_JWKS_URL = os.getenv("AUTH_JWKS_URL", "http://localhost:8000/auth/.well-known/jwks.json")
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class JWKSVerifier:
+    """
+    Verifies access tokens issued by the auth service locally, using the
+    public keys published on its JWKS endpoint.
+
+    The key set is cached for the max-age the endpoint advertises and is
+    refetched early when a token names an unknown kid (at most once every
+    `min_refresh_seconds`). If a refresh fails, the previous keys stay in use.
+    Verified claims are memoized until the token expires, like
+    verify_access_token does in the auth service.
+    """
+
+    def __init__(
+        self,
+        jwks_url: str = AUTH_JWKS_URL,
+        default_ttl: float = 300,
+        min_refresh_seconds: float = 10,
+        timeout: float = 5,
+        cache_size: int = 10_000,
+    ):
+        self.jwks_url = jwks_url
+        self.default_ttl = default_ttl
+        self.min_refresh_seconds = min_refresh_seconds
+        self.timeout = timeout
+        self._keys: Dict[str, Tuple[object, str]] = {}
+        self._fetched_at = float("-inf")
+        self._expires_at = float("-inf")
+        self._claims = TTLCache(maxsize=cache_size, ttl=default_ttl)
+
+    def _fetch(self) -> None:
+        self._fetched_at = time.monotonic()
+        request = urllib.request.Request(self.jwks_url, headers={"Accept": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                jwk_set = jwt.PyJWKSet.from_dict(json.load(response))
+                cache_control = response.headers.get("Cache-Control", "")
+        except (OSError, ValueError, jwt.PyJWKSetError):
+            # Keep serving with the keys we already have.
+            self._expires_at = self._fetched_at + self.min_refresh_seconds
+            return
+
+        match = _MAX_AGE_RE.search(cache_control)
+        ttl = int(match.group(1)) if match else self.default_ttl
+        self._keys = {k.key_id: (k.key, k.algorithm_name) for k in jwk_set.keys if k.key_id}
+        self._expires_at = self._fetched_at + ttl
+
+    def _needs_fetch(self, kid: Optional[str]) -> bool:
+        now = time.monotonic()
+        if now >= self._expires_at:
+            return True
+        return kid not in self._keys and now - self._fetched_at >= self.min_refresh_seconds
+
+    def _find_key(self, kid: str) -> Optional[Tuple[object, str]]:
+        if self._needs_fetch(kid):
+            self._fetch()
+        return self._keys.get(kid)
+
+    def verify(self, token: str) -> Optional[dict]:
+        """
+        Returns the {"user_id", "role", "sid"} claims of a valid token, None otherwise.
+        May block on a JWKS fetch; use verify_async from async code.
+        """
+        return verify_claims(token, self._find_key, self._claims)
+
+    async def verify_async(self, token: str) -> Optional[dict]:
+        """Like verify, but runs JWKS fetches off the event loop."""
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except jwt.InvalidTokenError:
+            return None
+        if self._needs_fetch(kid):
+            await asyncio.to_thread(self._fetch)
+        return self.verify(token)
+
+    def stats(self) -> dict:
+        return {"keys": len(self._keys), **self._claims.stats()}
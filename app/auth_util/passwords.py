@@ -0,0 +1,235 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ..metrics_util.metrics import Counter, Gauge, Histogram
+
+# argon2 cost parameters; the defaults are passlib's. Hashes made with other
+# parameters (fewer passes, a different memory cost or parallelism) are
+# rehashed on the next successful login.
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 65536))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 4))
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 0)) or None
+# With ARGON2_TIME_COST unset, calibrate_password_hashing() picks the time
+# cost that makes one hash take about this long on this host.
+ARGON2_TARGET_MS = float(os.getenv("ARGON2_TARGET_MS", 0)) or None
+ARGON2_MAX_TIME_COST = int(os.getenv("ARGON2_MAX_TIME_COST", 10))
+DEFAULT_TIME_COST = 3
+
+
+def argon2_context(time_cost: int, memory_cost: int, parallelism: int):
+    # passlib is imported on first use, off the service's import path.
+    from passlib.context import CryptContext
+
+    return CryptContext(
+        schemes=["argon2"],
+        deprecated="auto",
+        argon2__default_rounds=time_cost,
+        # Only weaker hashes count as outdated. Hosts that calibrate to
+        # different time costs then converge on the highest instead of
+        # rehashing each other's hashes back and forth.
+        argon2__min_rounds=time_cost,
+        argon2__memory_cost=memory_cost,
+        argon2__parallelism=parallelism,
+    )
+
+
+argon2_params = {
+    "time_cost": ARGON2_TIME_COST or DEFAULT_TIME_COST,
+    "memory_cost": ARGON2_MEMORY_COST,
+    "parallelism": ARGON2_PARALLELISM,
+}
+# Built on first use by get_pwd_context().
+_pwd_context = None
+
+# argon2-cffi releases the GIL while hashing, so a thread pool spreads the work
+# across cores without the pickling overhead of a process pool.
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+# How many hash/verify calls may wait for a free worker before we shed load.
+HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", HASH_WORKERS * 4))
+HASH_RETRY_AFTER_SECONDS = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", 1))
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="pwd-hash")
+_in_flight = 0
+
+password_hash_seconds = Histogram(
+    "password_hash_seconds",
+    "Time spent computing argon2 hashes/verifications on a worker thread.",
+    labelnames=("op",),
+)
+password_hash_wait_seconds = Histogram(
+    "password_hash_queue_wait_seconds",
+    "Time hash/verify calls waited for a free worker thread.",
+)
+password_hash_rejected = Counter(
+    "password_hash_rejected_total",
+    "Hash/verify calls rejected with 503 because the queue was full.",
+)
+password_rehashed = Counter(
+    "password_rehash_total",
+    "Password hashes upgraded to the current argon2 parameters at login.",
+)
+Gauge(
+    "password_hash_params",
+    "argon2 parameters new hashes are made with.",
+    labelnames=("param",),
+    callback=lambda: {(name,): value for name, value in argon2_params.items()},
+)
+
+
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        _pwd_context = argon2_context(**argon2_params)
+    return _pwd_context
+
+
+def configure_password_hashing(time_cost: int, memory_cost: int, parallelism: int) -> None:
+    global _pwd_context
+    argon2_params.update(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+    _pwd_context = None
+
+
+def measure_hash_seconds(time_cost: int, memory_cost: int, parallelism: int, samples: int = 3) -> float:
+    """Median wall-clock time of one hash with the given parameters."""
+    context = argon2_context(time_cost, memory_cost, parallelism)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        context.hash("calibration password")
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def calibrate_time_cost(target_seconds: float, memory_cost: int, parallelism: int,
+                        max_time_cost: int = ARGON2_MAX_TIME_COST) -> int:
+    """Largest time cost (passes over memory) whose hash takes at most target_seconds, at least 1."""
+    # Hashing time is about linear in the number of passes, plus a fixed
+    # cost for allocating and filling the memory: estimate both from two runs.
+    one_pass = measure_hash_seconds(1, memory_cost, parallelism)
+    per_pass = max(1e-6, measure_hash_seconds(2, memory_cost, parallelism) - one_pass)
+    time_cost = max(1, min(max_time_cost, 1 + int((target_seconds - one_pass) / per_pass)))
+    # Then correct the estimate against measurements.
+    while time_cost > 1 and measure_hash_seconds(time_cost, memory_cost, parallelism) > target_seconds:
+        time_cost -= 1
+    while time_cost < max_time_cost and measure_hash_seconds(time_cost + 1, memory_cost, parallelism) <= target_seconds:
+        time_cost += 1
+    return time_cost
+
+
+async def calibrate_password_hashing() -> None:
+    """
+    Calibrates the argon2 time cost to ARGON2_TARGET_MS on this host, unless
+    ARGON2_TIME_COST pins it. Run once at startup, off the event loop.
+    """
+    if ARGON2_TARGET_MS is None or ARGON2_TIME_COST is not None:
+        return
+    time_cost = await asyncio.to_thread(
+        calibrate_time_cost, ARGON2_TARGET_MS / 1000, ARGON2_MEMORY_COST, ARGON2_PARALLELISM
+    )
+    configure_password_hashing(time_cost, ARGON2_MEMORY_COST, ARGON2_PARALLELISM)
+    print(f"argon2 calibrated to {ARGON2_TARGET_MS:g} ms: {argon2_params}")
+
+
+def needs_rehash(password_hash: str) -> bool:
+    from passlib.hash import argon2
+
+    if get_pwd_context().needs_update(password_hash):
+        return True
+    # passlib doesn't compare parallelism.
+    return argon2.from_string(password_hash).parallelism != argon2_params["parallelism"]
+
+
+def _verify_and_update(password: str, password_hash: str):
+    pwd_context = get_pwd_context()
+    if not pwd_context.verify(password, password_hash):
+        return False, None
+    if needs_rehash(password_hash):
+        return True, pwd_context.hash(password)
+    return True, None
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool is saturated and its queue is full."""
+
+    def __init__(self, retry_after: int = HASH_RETRY_AFTER_SECONDS):
+        super().__init__("password hashing queue is full")
+        self.retry_after = retry_after
+
+
+def _timed(fn, *args):
+    # Runs on a worker thread; the timings are recorded back on the event loop.
+    start = time.perf_counter()
+    result = fn(*args)
+    return start, time.perf_counter(), result
+
+
+async def _run_in_pool(op, fn, *args):
+    global _in_flight
+    if _in_flight >= HASH_WORKERS + HASH_QUEUE_LIMIT:
+        password_hash_rejected.inc()
+        raise PasswordHasherBusy()
+    _in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        queued_at = time.perf_counter()
+        started, finished, result = await loop.run_in_executor(_executor, _timed, fn, *args)
+        password_hash_wait_seconds.observe(started - queued_at)
+        password_hash_seconds.labels(op).observe(finished - started)
+        return result
+    finally:
+        _in_flight -= 1
+
+
+async def hash_password(password: str) -> str:
+    """
+    Hashes a password on the worker pool without blocking the event loop.
+    Raises PasswordHasherBusy if the pool queue is full.
+    """
+    return await _run_in_pool("hash", get_pwd_context().hash, password)
+
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    """
+    Verifies a password against its hash on the worker pool.
+    Raises PasswordHasherBusy if the pool queue is full.
+    """
+    return await _run_in_pool("verify", get_pwd_context().verify, password, password_hash)
+
+
+async def verify_password_and_update(password: str, password_hash: str):
+    """
+    Verifies a password and, if it matches a hash made with outdated argon2
+    parameters, rehashes it with the current ones in the same pool slot.
+    Returns (ok, new hash or None). Raises PasswordHasherBusy if the pool
+    queue is full.
+    """
+    ok, new_hash = await _run_in_pool("verify", _verify_and_update, password, password_hash)
+    if new_hash is not None:
+        password_rehashed.inc()
+    return ok, new_hash
+
+
+_bulk_executor = None
+
+
+async def hash_passwords(passwords: list) -> list:
+    """
+    Hashes a batch of passwords in parallel for bulk provisioning.
+    Uses its own pool so a large import doesn't queue ahead of interactive
+    logins, and is never rejected for being busy.
+    """
+    global _bulk_executor
+    if _bulk_executor is None:
+        _bulk_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="pwd-bulk-hash")
+    loop = asyncio.get_running_loop()
+    pwd_context = get_pwd_context()
+    timed_results = await asyncio.gather(
+        *(loop.run_in_executor(_bulk_executor, _timed, pwd_context.hash, password) for password in passwords)
+    )
+    hashes = []
+    for started, finished, password_hash in timed_results:
+        password_hash_seconds.labels("bulk_hash").observe(finished - started)
+        hashes.append(password_hash)
+    return hashes
@@ -0,0 +1,10 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Caller identity taken from a verified access token."""
+    user_id: str
+    role: str
+    session_id: Optional[str] = None  # sid claim, set by the auth service
@@ -0,0 +1,117 @@
+"""
+Local stand-in for the Redis server behind RATE_LIMIT_BACKEND=redis, so the
+shared rate limit can be run and tested across worker processes without
+Redis. It speaks enough of the protocol for redis-py (HELLO, PING, CLIENT,
+SELECT, SCRIPT LOAD, EVAL, EVALSHA, QUIT) and runs only the rate limiter's
+script, with take_token() standing in for the Lua.
+
+Usage: python -m app.auth_util.redis_stand_in --port 6390
+then run the auth service with RATE_LIMIT_BACKEND=redis
+RATE_LIMIT_REDIS_URL=redis://localhost:6390/0
+"""
+import argparse
+import asyncio
+import hashlib
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .rate_limit import _REDIS_TAKE, RateLimit, take_token
+
+
+class RedisStandIn:
+    def __init__(self):
+        self.commands = 0
+        self.connections = 0
+        self._scripts: Dict[str, str] = {}
+        # key -> (tokens, updated, expires at)
+        self._buckets: Dict[bytes, Tuple[float, float, float]] = {}
+
+    def _take(self, key: bytes, rate: float, burst: float, cost: float) -> bytes:
+        now = time.time()
+        tokens, updated, expires_at = self._buckets.get(key, (burst, now, now))
+        if expires_at < now:
+            tokens, updated = burst, now
+        tokens, wait = take_token(tokens, now - updated, RateLimit(rate * 60, burst), cost)
+        self._buckets[key] = (tokens, now, now + burst / rate + 1)
+        return repr(wait).encode()
+
+    def _run_script(self, sha: str, args: List[bytes]) -> Optional[bytes]:
+        if self._scripts.get(sha) != _REDIS_TAKE:
+            return None
+        keys = int(args[0])
+        key, (rate, burst, cost) = args[1], (float(arg) for arg in args[1 + keys:4 + keys])
+        return self._take(key, rate, burst, cost)
+
+    def _execute(self, command: List[bytes]) -> bytes:
+        name = command[0].upper()
+        if name == b"PING":
+            return b"+PONG\r\n"
+        if name == b"HELLO":
+            # Every reply sent here reads the same in RESP2 and RESP3.
+            proto = int(command[1]) if len(command) > 1 else 2
+            if proto == 3:
+                return b"%1\r\n$5\r\nproto\r\n:3\r\n"
+            return b"*2\r\n$5\r\nproto\r\n:2\r\n"
+        if name in (b"CLIENT", b"SELECT"):
+            return b"+OK\r\n"
+        if name == b"SCRIPT" and len(command) == 3 and command[1].upper() == b"LOAD":
+            script = command[2].decode()
+            sha = hashlib.sha1(command[2]).hexdigest()
+            self._scripts[sha] = script
+            return f"${len(sha)}\r\n{sha}\r\n".encode()
+        if name in (b"EVAL", b"EVALSHA"):
+            sha = command[1].decode()
+            if name == b"EVAL":
+                sha = hashlib.sha1(command[1]).hexdigest()
+                self._scripts[sha] = command[1].decode()
+            result = self._run_script(sha, command[2:])
+            if result is None:
+                return b"-NOSCRIPT No matching script. Please use EVAL.\r\n"
+            return b"$%d\r\n%s\r\n" % (len(result), result)
+        return b"-ERR unknown command '%s'\r\n" % command[0]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while header := await reader.readline():
+                if not header.startswith(b"*"):
+                    break
+                command = []
+                for _ in range(int(header[1:])):
+                    length = int((await reader.readline())[1:])
+                    command.append((await reader.readexactly(length + 2))[:-2])
+                self.commands += 1
+                if command[0].upper() == b"QUIT":
+                    writer.write(b"+OK\r\n")
+                    await writer.drain()
+                    break
+                writer.write(self._execute(command))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def start_stand_in(port: int, host: str = "127.0.0.1"):
+    """Starts the stand-in on the running loop; returns (stand-in, server)."""
+    stand_in = RedisStandIn()
+    server = await asyncio.start_server(stand_in.handle, host, port)
+    return stand_in, server
+
+
+async def main(args) -> None:
+    stand_in, server = await start_stand_in(args.port, args.host)
+    print(f"Redis stand-in on {args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline Redis stand-in for the shared rate limit backend.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
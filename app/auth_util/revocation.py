@@ -0,0 +1,83 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from sqlalchemy.future import select
+
+from ..db_util.db_conn import AsyncSessionLocal
+from ..db_util.models import RevokedSession
+from ..metrics_util.metrics import Gauge
+
+# How often each process reloads the sessions revoked by other processes;
+# the longest a logout elsewhere takes to apply here.
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", 5))
+
+
+def _timestamp(value: datetime) -> float:
+    # SQLite hands timestamps back without their (UTC) zone.
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class RevocationIndex:
+    """
+    Login sessions (the sid claim) revoked while access tokens issued for
+    them may still be valid, kept in a dict so checking a request costs one
+    lookup. Sessions revoked by this process are added immediately; the
+    revoked_sessions table is the source of truth and is reloaded every
+    REVOCATION_SYNC_SECONDS. If a reload fails the last known index stays.
+    """
+
+    def __init__(self):
+        self._revoked: Dict[str, float] = {}  # sid -> when its last access token expires
+        self._syncer: Optional[asyncio.Task] = None
+
+    def add(self, session_id: str, expires_at: float) -> None:
+        self._revoked[session_id] = expires_at
+
+    def is_revoked(self, session_id: Optional[str]) -> bool:
+        if session_id is None:
+            return False
+        expires_at = self._revoked.get(session_id)
+        return expires_at is not None and expires_at > time.time()
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    async def load(self) -> None:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(RevokedSession.session_id, RevokedSession.expires_at)
+                .where(RevokedSession.expires_at > datetime.now(timezone.utc))
+            )
+            rows = result.all()
+        self._revoked = {str(session_id): _timestamp(expires_at) for session_id, expires_at in rows}
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(REVOCATION_SYNC_SECONDS)
+            try:
+                await self.load()
+            except Exception as e:
+                print(f"revocation index reload failed: {e}")
+
+    def start(self) -> None:
+        self._syncer = asyncio.create_task(self._sync_loop())
+
+    async def stop(self) -> None:
+        if self._syncer is not None:
+            self._syncer.cancel()
+            await asyncio.gather(self._syncer, return_exceptions=True)
+            self._syncer = None
+
+
+revocation_index = RevocationIndex()
+
+Gauge(
+    "revoked_sessions",
+    "Revoked login sessions in this process's revocation index.",
+    callback=lambda: {(): len(revocation_index)},
+)
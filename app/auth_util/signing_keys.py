@@ -0,0 +1,193 @@
+import json
+import os
+import secrets
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from jwt.algorithms import OKPAlgorithm, RSAAlgorithm
+
+# Directory of PEM private keys, one file per key named "<kid>.pem".
+# Rotation without downtime:
+#   1. drop the new key file in the directory; it is published in the JWKS
+#      on the next reload but not used for signing yet
+#   2. once downstream JWKS caches have picked it up, write its kid into the
+#      "active_kid" file (or set JWT_ACTIVE_KID) to start signing with it
+#   3. delete the old key file after ACCESS_TOKEN_EXPIRE_MINUTES have passed
+# Every replica of the auth service must see the same directory (e.g. one
+# Kubernetes Secret mounted into all pods): a token signed by one replica is
+# only accepted by replicas that have its key.
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR", ".jwt_keys")
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID")
+# Generate a key when the directory is empty; only safe for a single
+# replica (or replicas sharing a writable directory), so set it to 0 with
+# mounted keys to fail at startup instead of each pod signing with a key
+# of its own.
+JWT_GENERATE_KEY = os.getenv("JWT_GENERATE_KEY", "1") == "1"
+JWT_KEYS_RELOAD_SECONDS = float(os.getenv("JWT_KEYS_RELOAD_SECONDS", 60))
+
+ACTIVE_KID_FILE = "active_kid"
+
+
+@dataclass(frozen=True)
+class SigningKey:
+    kid: str
+    algorithm: str
+    private_key: object
+    public_key: object
+
+    def public_jwk(self) -> dict:
+        if self.algorithm == "EdDSA":
+            jwk = OKPAlgorithm.to_jwk(self.public_key, as_dict=True)
+        else:
+            jwk = RSAAlgorithm.to_jwk(self.public_key, as_dict=True)
+        jwk.update({"kid": self.kid, "alg": self.algorithm, "use": "sig"})
+        return jwk
+
+
+def _load_key(kid: str, pem: bytes) -> SigningKey:
+    private_key = serialization.load_pem_private_key(pem, password=None)
+    if isinstance(private_key, ed25519.Ed25519PrivateKey):
+        algorithm = "EdDSA"
+    elif isinstance(private_key, rsa.RSAPrivateKey):
+        algorithm = "RS256"
+    else:
+        raise ValueError(f"unsupported key type for kid {kid!r}: {type(private_key).__name__}")
+    return SigningKey(kid, algorithm, private_key, private_key.public_key())
+
+
+def generate_key_file(keys_dir: str = JWT_KEYS_DIR) -> str:
+    """
+    Writes a new Ed25519 private key into keys_dir and returns its kid.
+    The file is created atomically so concurrent workers never read half a key.
+    """
+    os.makedirs(keys_dir, exist_ok=True)
+    kid = f"{time.strftime('%Y%m%d')}-{secrets.token_hex(4)}"
+    pem = ed25519.Ed25519PrivateKey.generate().private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    tmp_path = os.path.join(keys_dir, f".{kid}.tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(pem)
+    os.replace(tmp_path, os.path.join(keys_dir, f"{kid}.pem"))
+    return kid
+
+
+def claim_active_kid(kid: str, keys_dir: str = JWT_KEYS_DIR) -> bool:
+    """
+    Makes kid the active key unless an active_kid file already exists.
+    Workers bootstrapping an empty directory at once may each generate a
+    key, but only the first one's is activated, so they all sign alike.
+    Returns whether kid was activated.
+    """
+    tmp_path = os.path.join(keys_dir, f".{ACTIVE_KID_FILE}.{kid}.tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    with os.fdopen(fd, "w") as f:
+        f.write(kid + "\n")
+    try:
+        # Unlike O_EXCL on the file itself, the link appears with its content.
+        os.link(tmp_path, os.path.join(keys_dir, ACTIVE_KID_FILE))
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(tmp_path)
+
+
+class KeyRing:
+    """
+    Signing keys loaded from JWT_KEYS_DIR and reloaded periodically, so keys
+    can be added, activated and retired without restarting the service.
+    """
+
+    def __init__(self, keys_dir: str = JWT_KEYS_DIR, reload_seconds: float = JWT_KEYS_RELOAD_SECONDS,
+                 generate: bool = JWT_GENERATE_KEY):
+        self.keys_dir = keys_dir
+        self.reload_seconds = reload_seconds
+        self.generate = generate
+        self._keys: Dict[str, SigningKey] = {}
+        self._active_kid: Optional[str] = None
+        self._loaded_at = float("-inf")
+        self._jwks: Optional[bytes] = None
+
+    def _reload(self) -> None:
+        if self.generate:
+            os.makedirs(self.keys_dir, exist_ok=True)
+        elif not os.path.isdir(self.keys_dir):
+            raise RuntimeError(f"JWT_KEYS_DIR {self.keys_dir!r} does not exist and JWT_GENERATE_KEY is off")
+        if not any(name.endswith(".pem") for name in os.listdir(self.keys_dir)):
+            if not self.generate:
+                raise RuntimeError(f"no signing keys in {self.keys_dir!r} and JWT_GENERATE_KEY is off")
+            kid = generate_key_file(self.keys_dir)
+            if not claim_active_kid(kid, self.keys_dir):
+                with open(os.path.join(self.keys_dir, ACTIVE_KID_FILE)) as f:
+                    winner = f.read().strip()
+                # Another worker bootstrapped first; its key is the one in use.
+                if os.path.exists(os.path.join(self.keys_dir, f"{winner}.pem")):
+                    os.remove(os.path.join(self.keys_dir, f"{kid}.pem"))
+
+        keys = {}
+        oldest = None
+        for name in sorted(os.listdir(self.keys_dir)):
+            if not name.endswith(".pem"):
+                continue
+            kid = name[: -len(".pem")]
+            try:
+                with open(os.path.join(self.keys_dir, name), "rb") as f:
+                    keys[kid] = _load_key(kid, f.read())
+                    mtime = os.fstat(f.fileno()).st_mtime
+            except FileNotFoundError:
+                # A losing bootstrap key, removed since the listing.
+                continue
+            if oldest is None or mtime < oldest[0]:
+                oldest = (mtime, kid)
+
+        active_kid = JWT_ACTIVE_KID
+        active_path = os.path.join(self.keys_dir, ACTIVE_KID_FILE)
+        if active_kid is None and os.path.exists(active_path):
+            with open(active_path) as f:
+                active_kid = f.read().strip() or None
+        if active_kid not in keys:
+            # Without an explicit choice keep signing with the oldest key: a
+            # newly added one is only published until it is activated.
+            active_kid = oldest[1]
+
+        self._keys = keys
+        self._active_kid = active_kid
+        self._jwks = None
+        self._loaded_at = time.monotonic()
+
+    def _maybe_reload(self, force: bool = False) -> None:
+        age = time.monotonic() - self._loaded_at
+        # A forced reload (unknown kid) is still throttled so that garbage kids
+        # can't turn every request into a directory scan.
+        if age >= self.reload_seconds or (force and age >= 1):
+            self._reload()
+
+    def signing_key(self) -> SigningKey:
+        self._maybe_reload()
+        return self._keys[self._active_kid]
+
+    def get(self, kid: str) -> Optional[SigningKey]:
+        self._maybe_reload()
+        key = self._keys.get(kid)
+        if key is None:
+            self._maybe_reload(force=True)
+            key = self._keys.get(kid)
+        return key
+
+    def jwks_json(self) -> bytes:
+        """Returns the serialized public key set, rebuilt only after a reload."""
+        self._maybe_reload()
+        if self._jwks is None:
+            jwks = {"keys": [key.public_jwk() for key in self._keys.values()]}
+            self._jwks = json.dumps(jwks, separators=(",", ":"), sort_keys=True).encode()
+        return self._jwks
+
+
+key_ring = KeyRing()
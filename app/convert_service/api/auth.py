@@ -0,0 +1,58 @@
+from typing import Optional
+
+from fastapi import Depends, HTTPException, WebSocketException, status
+from fastapi.security import OAuth2PasswordBearer
+from starlette.requests import HTTPConnection
+
+from ...auth_util.jwks_verifier import JWKSVerifier
+from ...auth_util.principal import Principal
+from ...auth_util.revocation import revocation_index
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+
+# Tokens are verified locally against the auth service's published keys, so
+# authenticating a request costs no call to the auth service.
+verifier = JWKSVerifier()
+
+
+async def principal_from_token(token: Optional[str]) -> Optional[Principal]:
+    """
+    None for an invalid token, or one whose session was logged out or
+    revoked; revocations are read from the shared database every
+    REVOCATION_SYNC_SECONDS.
+    """
+    payload = await verifier.verify_async(token) if token else None
+    if payload is None or revocation_index.is_revoked(payload["sid"]):
+        return None
+    return Principal(user_id=payload["user_id"], role=payload["role"], session_id=payload["sid"])
+
+
+async def get_current_principal(token: str = Depends(oauth2_scheme)) -> Principal:
+    principal = await principal_from_token(token)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate token",
+        )
+    return principal
+
+
+async def get_stream_principal(connection: HTTPConnection) -> Principal:
+    """
+    Like get_current_principal, for SSE and WebSocket endpoints. Browsers
+    can't set headers on EventSource or WebSocket, so the token may also
+    come as the access_token query parameter.
+    """
+    scheme, _, token = connection.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer":
+        token = connection.query_params.get("access_token")
+    principal = await principal_from_token(token)
+    if principal is None:
+        if connection.scope["type"] == "websocket":
+            raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Could not validate token")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
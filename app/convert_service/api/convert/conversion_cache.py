@@ -0,0 +1,225 @@
+import asyncio
+import contextlib
+import datetime
+import os
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from sqlalchemy import delete, func, update
+from sqlalchemy.exc import IntegrityError
+
+from ....db_util.db_conn import AsyncSessionLocal
+from ....db_util.models import ConversionLock
+from ....metrics_util.metrics import Counter, Gauge
+from ....storage_util.storage import content_key
+from .storage import scratch_path, storage
+
+CONVERT_CACHE_MAX_BYTES = int(os.getenv("CONVERT_CACHE_MAX_BYTES", 1024 ** 3))
+# A conversion lock is refreshed while its holder converts; one not refreshed
+# for this long (the process died) is taken over by the next claimant.
+CONVERT_CACHE_LOCK_TIMEOUT_SECONDS = float(os.getenv("CONVERT_CACHE_LOCK_TIMEOUT_SECONDS", 120))
+# How often a process waiting on another one's conversion checks for it.
+CONVERT_CACHE_LOCK_POLL_SECONDS = float(os.getenv("CONVERT_CACHE_LOCK_POLL_SECONDS", 1))
+
+cache_requests = Counter(
+    "convert_cache_requests_total",
+    "Conversion cache lookups by result (hit, miss, or coalesced onto an in-flight conversion).",
+    labelnames=("result",),
+)
+cache_evictions = Counter("convert_cache_evictions_total", "Entries evicted from the conversion cache.")
+
+
+def cache_key(digest: str, bitrate: str, fmt: str = "mp3") -> str:
+    """Cache key of a converted output: source content hash plus output settings."""
+    return content_key("cache", digest, f"-{bitrate}.{fmt}")
+
+
+class ConversionCache:
+    """
+    Converted outputs in storage under content keys (cache_key()), evicted
+    least-recently-used first once they add up to more than max_bytes.
+    Jobs get their own copy of the entry (a hard link on local storage, a
+    server-side copy on S3), so evicting it never breaks an output that was
+    already handed out.
+
+    fetch() coalesces concurrent conversions of the same key: within this
+    process the first caller converts and the others wait for its result;
+    across processes and hosts the converting one holds a row in
+    conversion_locks and the others poll storage until the entry appears.
+    Each process keeps its own LRU index of the entries it has converted or
+    used; with several processes sharing the storage the bound is enforced
+    per process.
+    """
+
+    def __init__(self, max_bytes: int = CONVERT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._inflight = {}
+
+    async def load(self) -> None:
+        """Rebuilds the LRU index from storage, oldest first."""
+        objects = sorted(await storage.list("cache/"), key=lambda info: info.modified)
+        self._entries.clear()
+        self._bytes = 0
+        for info in objects:
+            self._entries[info.key] = info.size
+            self._bytes += info.size
+        await self._evict()
+
+    async def link(self, key: str, dest: str) -> bool:
+        """
+        Copies the cached output for key to the dest key; False if there is
+        none. An entry missing from this process's index may still be in
+        storage, put there by another process; it is used and adopted.
+        """
+        if not await storage.copy(key, dest):
+            if key in self._entries:
+                # Removed behind our back (another process evicted it).
+                self._bytes -= self._entries.pop(key)
+            return False
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        else:
+            info = await storage.stat(key)
+            if info is not None:
+                await self._add(key, info.size)
+        # Keeps the LRU order that load() rebuilds after a restart.
+        await storage.touch(key)
+        cache_requests.labels("hit").inc()
+        return True
+
+    async def _add(self, key: str, size: int) -> None:
+        self._bytes += size - self._entries.pop(key, 0)
+        self._entries[key] = size
+        await self._evict()
+
+    async def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            await storage.delete(key)
+            cache_evictions.inc()
+
+    async def _lock(self, key: str, owner: uuid.UUID) -> bool:
+        """Claims the conversion of key for all processes; False if another one holds it."""
+        stale = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+            seconds=CONVERT_CACHE_LOCK_TIMEOUT_SECONDS
+        )
+        async with AsyncSessionLocal() as db:
+            # Takes over a lock whose holder stopped refreshing it.
+            await db.execute(
+                delete(ConversionLock).where(ConversionLock.cache_key == key, ConversionLock.locked_at < stale)
+            )
+            db.add(ConversionLock(cache_key=key, owner=owner))
+            try:
+                await db.commit()
+            except IntegrityError:
+                return False
+        return True
+
+    async def _hold(self, key: str, owner: uuid.UUID) -> None:
+        """Refreshes a held lock until cancelled."""
+        while True:
+            await asyncio.sleep(CONVERT_CACHE_LOCK_TIMEOUT_SECONDS / 4)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(ConversionLock)
+                        .where(ConversionLock.cache_key == key, ConversionLock.owner == owner)
+                        .values(locked_at=func.now())
+                    )
+                    await db.commit()
+            except Exception as e:
+                print(f"refreshing the conversion lock of {key} failed: {e}")
+
+    async def _unlock(self, key: str, owner: uuid.UUID) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    delete(ConversionLock).where(ConversionLock.cache_key == key, ConversionLock.owner == owner)
+                )
+                await db.commit()
+        except Exception as e:
+            # It goes stale and is taken over after the timeout.
+            print(f"releasing the conversion lock of {key} failed: {e}")
+
+    async def fetch(self, key: str, dest: str, convert: Callable[[str], Awaitable[None]]) -> None:
+        """
+        Places the output for key at the dest key, calling convert(path) to
+        produce it as a local file on a miss. Concurrent fetches of a key
+        share one conversion; if it fails they all raise its error. While
+        another process converts the key this waits for its entry, and
+        converts itself if that one fails.
+        """
+        while True:
+            if await self.link(key, dest):
+                return
+            flight = self._inflight.get(key)
+            if flight is None:
+                break
+            cache_requests.labels("coalesced").inc()
+            await asyncio.wait([flight])
+            if not flight.cancelled() and flight.exception() is not None:
+                raise flight.exception()
+            # Normally a hit now; if the conversion was cancelled or its
+            # entry already evicted, the next round converts again.
+
+        flight = self._inflight[key] = asyncio.get_running_loop().create_future()
+        owner = uuid.uuid4()
+        locked = False
+        tmp = scratch_path(".mp3")
+        try:
+            waited = False
+            while not await self._lock(key, owner):
+                if not waited:
+                    cache_requests.labels("coalesced").inc()
+                    waited = True
+                await asyncio.sleep(CONVERT_CACHE_LOCK_POLL_SECONDS)
+                if await self.link(key, dest):
+                    flight.set_result(None)
+                    return
+            locked = True
+            # Another process may have put the entry between our miss and the lock.
+            if await self.link(key, dest):
+                flight.set_result(None)
+                return
+            cache_requests.labels("miss").inc()
+            hold = asyncio.create_task(self._hold(key, owner))
+            try:
+                await convert(tmp)
+                info = await storage.put_file(key, tmp)
+            finally:
+                hold.cancel()
+            if not await storage.copy(key, dest):
+                await storage.put_file(dest, tmp)
+            await self._add(key, info.size)
+            flight.set_result(None)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                flight.cancel()
+            else:
+                flight.set_exception(e)
+                # Mark the exception retrieved in case nobody was waiting.
+                flight.exception()
+            raise
+        finally:
+            del self._inflight[key]
+            if locked:
+                await self._unlock(key, owner)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp)
+
+conversion_cache = ConversionCache()
+
+Gauge(
+    "convert_cache",
+    "Conversion cache size.",
+    labelnames=("stat",),
+    callback=lambda: {
+        ("entries",): len(conversion_cache._entries),
+        ("bytes",): conversion_cache._bytes,
+        ("max_bytes",): conversion_cache.max_bytes,
+    },
+)
@@ -0,0 +1,248 @@
+import asyncio
+import os
+import sys
+from typing import AsyncIterator, Callable, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+
+from ....auth_util.principal import Principal
+from ..auth import get_current_principal
+
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+# "ffmpeg" for real conversions, "stub" for the pass-through stand-in used in
+# offline tests (same pipe behaviour, no ffmpeg needed).
+CONVERT_TRANSCODER = os.getenv("CONVERT_TRANSCODER", "ffmpeg")
+STUB_TRANSCODER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_transcoder.py")
+CONVERT_DATA_DIR = os.getenv("CONVERT_DATA_DIR", "data/convert")
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_BITRATE = "192k"
+ALLOWED_BITRATES = ("64k", "96k", "128k", "160k", "192k", "256k", "320k")
+STDERR_TAIL_BYTES = 4096
+
+
+class TranscodeError(Exception):
+    """Raised when the transcoder exits with an error."""
+
+
+def transcoder_command(
+    bitrate: str = DEFAULT_BITRATE, source: str = "pipe:0", dest: str = "pipe:1", progress: bool = False
+) -> List[str]:
+    """
+    Command line of a transcoder converting source to MP3 at dest. Either may
+    be a file path or pipe:0 / pipe:1 for stdin / stdout. With progress set
+    (file output only) ffmpeg reports its position on stdout.
+    """
+    if bitrate not in ALLOWED_BITRATES:
+        raise ValueError(f"unsupported bitrate {bitrate!r}")
+    if CONVERT_TRANSCODER == "stub":
+        return [sys.executable, STUB_TRANSCODER, source, dest]
+    return [
+        FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+        *(["-progress", "pipe:1", "-nostats"] if progress else []),
+        "-i", source,
+        "-vn", "-map", "0:a:0",
+        "-codec:a", "libmp3lame", "-b:a", bitrate,
+        "-f", "mp3", dest,
+    ]
+
+
+async def transcode_file(
+    source: str, dest: str, bitrate: str = DEFAULT_BITRATE, on_progress: Optional[Callable[[float], None]] = None
+) -> None:
+    """
+    Converts a source file to an MP3 file. Reading from a file rather than a
+    pipe lets ffmpeg seek, so MP4s without faststart work too. The output is
+    written next to dest and renamed into place only on success.
+    on_progress is called with the seconds of audio converted so far.
+    """
+    tmp_dest = dest + ".part"
+    try:
+        await run_transcoder(transcoder_command(bitrate, source, tmp_dest, on_progress is not None), on_progress)
+    except BaseException:
+        if os.path.exists(tmp_dest):
+            os.remove(tmp_dest)
+        raise
+    os.replace(tmp_dest, dest)
+
+
+async def run_transcoder(cmd: List[str], on_progress: Optional[Callable[[float], None]] = None) -> None:
+    """
+    Runs a file-to-file transcoder command, raising TranscodeError on failure.
+    If on_progress is given, "-progress pipe:1" output on stdout is parsed
+    and the converted position in seconds passed to it.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE if on_progress else asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        if on_progress:
+            stderr, _ = await asyncio.gather(_tail(process.stderr), _read_progress(process.stdout, on_progress))
+        else:
+            stderr = await _tail(process.stderr)
+        returncode = await process.wait()
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    if returncode != 0:
+        message = stderr.decode(errors="replace").strip()
+        raise TranscodeError(message or f"transcoder exited with status {returncode}")
+
+
+async def _feed(chunks: AsyncIterator[bytes], stdin: asyncio.StreamWriter) -> None:
+    try:
+        async for chunk in chunks:
+            stdin.write(chunk)
+            # drain() blocks while the pipe buffer is full, so a slow
+            # transcoder throttles how fast we read the upload.
+            await stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # The transcoder exited early; its exit status tells why.
+        pass
+    finally:
+        stdin.close()
+
+
+async def _read_progress(stream: asyncio.StreamReader, on_progress: Callable[[float], None]) -> None:
+    # ffmpeg writes key=value blocks; out_time_us is the output position.
+    # (out_time_ms is the same value despite its name.)
+    while line := await stream.readline():
+        key, _, value = line.decode(errors="replace").strip().partition("=")
+        if key == "out_time_us" and value.isdigit():
+            on_progress(int(value) / 1_000_000)
+
+
+async def _tail(stream: asyncio.StreamReader, limit: int = STDERR_TAIL_BYTES) -> bytes:
+    tail = b""
+    while chunk := await stream.read(CHUNK_SIZE):
+        tail = (tail + chunk)[-limit:]
+    return tail
+
+
+async def transcode_stream(chunks: AsyncIterator[bytes], bitrate: str = DEFAULT_BITRATE) -> AsyncIterator[bytes]:
+    """
+    Pipes the source video through the transcoder and yields MP3 chunks as
+    they are produced. Input and output go through the OS pipe buffers and one
+    CHUNK_SIZE read at a time, so memory per job stays bounded whatever the
+    video size.
+
+    MP4s whose moov atom sits at the end of the file (not "faststart") can't be
+    demuxed from a pipe; those must be converted from a file instead.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *transcoder_command(bitrate),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    feeder = asyncio.create_task(_feed(chunks, process.stdin))
+    stderr = asyncio.create_task(_tail(process.stderr))
+    try:
+        while chunk := await process.stdout.read(CHUNK_SIZE):
+            yield chunk
+        await feeder
+        returncode = await process.wait()
+        if returncode != 0:
+            message = (await stderr).decode(errors="replace").strip()
+            raise TranscodeError(message or f"transcoder exited with status {returncode}")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        feeder.cancel()
+        stderr.cancel()
+
+
+CONVERT_MAX_STREAMS = int(os.getenv("CONVERT_MAX_STREAMS", os.cpu_count() or 1))
+_active_streams = 0
+
+router = APIRouter()
+
+
+class PipeStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse for endpoints that keep reading the request body while
+    the response streams. The stock class listens for disconnects on the same
+    receive channel on ASGI < 2.4 servers and would steal body messages; here
+    a disconnect surfaces through request.stream() instead. on_close always
+    runs, even if the response never got to start.
+    """
+
+    def __init__(self, content, on_close=None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        finally:
+            if self.on_close is not None:
+                await self.on_close()
+        if self.background is not None:
+            await self.background()
+
+
+@router.post("/mp3")
+async def convert_to_mp3(
+    request: Request,
+    bitrate: str = DEFAULT_BITRATE,
+    principal: Principal = Depends(get_current_principal),
+):
+    """
+    Converts the video sent as the raw request body and streams the MP3 back
+    while the upload is still coming in.
+    """
+    global _active_streams
+    if bitrate not in ALLOWED_BITRATES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"bitrate must be one of {', '.join(ALLOWED_BITRATES)}",
+        )
+    if _active_streams >= CONVERT_MAX_STREAMS:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many conversions in progress, try again later",
+            headers={"Retry-After": "5"},
+        )
+
+    _active_streams += 1
+    output = transcode_stream(request.stream(), bitrate)
+
+    async def release():
+        global _active_streams
+        _active_streams -= 1
+        await output.aclose()
+
+    try:
+        # Wait for the first MP3 bytes so that unreadable input still gets a
+        # proper error status instead of a truncated 200.
+        first_chunk = await anext(output, b"")
+    except TranscodeError as e:
+        await release()
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Could not convert video: {e}",
+        )
+    except BaseException:
+        await release()
+        raise
+
+    async def body():
+        yield first_chunk
+        async for chunk in output:
+            yield chunk
+
+    return PipeStreamingResponse(
+        body(),
+        on_close=release,
+        media_type="audio/mpeg",
+        headers={"Content-Disposition": 'attachment; filename="audio.mp3"'},
+    )
@@ -0,0 +1,85 @@
+import json
+import os
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, WebSocketException, status
+from fastapi.responses import StreamingResponse
+
+from ....auth_util.principal import Principal
+from ....db_util.db_conn import AsyncSessionLocal
+from ..auth import get_stream_principal
+from .jobs import load_job
+from .progress import FINAL_STATUSES, progress_broker
+
+# Idle connections get a keepalive this often so proxies don't time them out
+# and closed clients are noticed.
+PROGRESS_KEEPALIVE_SECONDS = float(os.getenv("PROGRESS_KEEPALIVE_SECONDS", 15))
+
+router = APIRouter()
+
+
+async def current_event(job_id: uuid.UUID, principal: Principal) -> dict:
+    # A short-lived session: subscriptions can stay open for hours and must
+    # not hold a pooled connection.
+    async with AsyncSessionLocal() as db:
+        job = await load_job(db, job_id, principal)
+    progress = 1.0 if job.status == "done" else None
+    return {"job_id": str(job.id), "status": job.status, "progress": progress, "error": job.error}
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: uuid.UUID, principal: Principal = Depends(get_stream_principal)):
+    """
+    Server-Sent Events stream of the job's state: one `data:` JSON event per
+    change, ending after the job is done or failed.
+    """
+    current = await current_event(job_id, principal)
+
+    async def stream():
+        # Subscribing here rather than above ties the subscription's lifetime
+        # to the generator, which always runs its finally.
+        subscription = progress_broker.subscribe(str(job_id), current)
+        try:
+            event = subscription.event
+            while True:
+                if event is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"data: {json.dumps(event)}\n\n"
+                    if event["status"] in FINAL_STATUSES:
+                        return
+                event = await subscription.next(PROGRESS_KEEPALIVE_SECONDS)
+        finally:
+            progress_broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/jobs/{job_id}/ws")
+async def job_events_ws(websocket: WebSocket, job_id: uuid.UUID, principal: Principal = Depends(get_stream_principal)):
+    """The same events as /events, as JSON WebSocket messages."""
+    try:
+        current = await current_event(job_id, principal)
+    except HTTPException as e:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+    await websocket.accept()
+    subscription = progress_broker.subscribe(str(job_id), current)
+    try:
+        event = subscription.event
+        while True:
+            if event is None:
+                await websocket.send_json({"type": "keepalive"})
+            else:
+                await websocket.send_json(event)
+                if event["status"] in FINAL_STATUSES:
+                    break
+            event = await subscription.next(PROGRESS_KEEPALIVE_SECONDS)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        progress_broker.unsubscribe(subscription)
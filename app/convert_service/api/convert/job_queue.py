@@ -0,0 +1,164 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass
+
+CONVERT_QUEUE_BACKEND = os.getenv("CONVERT_QUEUE_BACKEND", "memory")  # memory or redis
+CONVERT_QUEUE_MAXSIZE = int(os.getenv("CONVERT_QUEUE_MAXSIZE", 1000))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+@dataclass
+class QueuedJob:
+    job_id: str
+    user_id: str
+    attempt: int = 0
+
+
+class QueueFull(Exception):
+    """Raised by put() when the queue holds maxsize jobs."""
+
+
+class InMemoryFairQueue:
+    """
+    In-process job queue for local runs and tests. Jobs are kept per user and
+    handed out round-robin across users, so one user's backlog can't starve
+    everyone else. The job rows in the database (SQLite locally) are the
+    durable record; pending jobs are re-enqueued from there on startup.
+    """
+
+    def __init__(self, maxsize: int = CONVERT_QUEUE_MAXSIZE):
+        self.maxsize = maxsize
+        self._per_user: "OrderedDict[str, deque]" = OrderedDict()
+        self._size = 0
+        self._ready = asyncio.Condition()
+
+    def qsize(self) -> int:
+        return self._size
+
+    async def put(self, job: QueuedJob, force: bool = False) -> None:
+        """Enqueues a job; raises QueueFull unless force is set (used for retries and recovery)."""
+        if not force and self._size >= self.maxsize:
+            raise QueueFull()
+        async with self._ready:
+            self._per_user.setdefault(job.user_id, deque()).append(job)
+            self._size += 1
+            self._ready.notify()
+
+    async def get(self) -> QueuedJob:
+        async with self._ready:
+            while not self._size:
+                await self._ready.wait()
+            user_id, jobs = next(iter(self._per_user.items()))
+            job = jobs.popleft()
+            # Move the user to the back of the rotation (or drop them if done).
+            del self._per_user[user_id]
+            if jobs:
+                self._per_user[user_id] = jobs
+            self._size -= 1
+            return job
+
+    async def retry_later(self, job: QueuedJob, delay: float) -> None:
+        async def requeue():
+            await asyncio.sleep(delay)
+            await self.put(job, force=True)
+
+        asyncio.get_running_loop().create_task(requeue())
+
+    async def close(self) -> None:
+        pass
+
+
+# Atomically takes the next job: pops the user at the head of the ring, takes
+# their oldest job and, if they have more, puts them back at the tail.
+_REDIS_GET = """
+local user = redis.call('LPOP', KEYS[1])
+if not user then return nil end
+local job = redis.call('LPOP', KEYS[2] .. user)
+if redis.call('LLEN', KEYS[2] .. user) > 0 then
+    redis.call('RPUSH', KEYS[1], user)
+end
+if job then redis.call('DECR', KEYS[3]) end
+return job
+"""
+
+# Enqueues a job unless the queue is full; adds the user to the ring when
+# they had nothing queued.
+_REDIS_PUT = """
+if tonumber(ARGV[3]) == 0 and tonumber(redis.call('GET', KEYS[3]) or '0') >= tonumber(ARGV[2]) then
+    return 0
+end
+if redis.call('RPUSH', KEYS[2] .. ARGV[1], ARGV[4]) == 1 then
+    redis.call('RPUSH', KEYS[1], ARGV[1])
+end
+redis.call('INCR', KEYS[3])
+return 1
+"""
+
+
+class RedisJobQueue:
+    """
+    Broker-backed queue shared by every worker process and host, with the
+    same per-user round-robin as InMemoryFairQueue. Delayed retries wait in
+    a sorted set until they are due. Needs the optional `redis` package.
+    """
+
+    def __init__(self, url: str = REDIS_URL, maxsize: int = CONVERT_QUEUE_MAXSIZE,
+                 prefix: str = "convert", poll_interval: float = 0.5):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("CONVERT_QUEUE_BACKEND=redis needs the 'redis' package") from e
+        self._redis = redis.from_url(url)
+        self.maxsize = maxsize
+        self.poll_interval = poll_interval
+        self._ring = f"{prefix}:ring"
+        self._user_prefix = f"{prefix}:user:"
+        self._size_key = f"{prefix}:size"
+        self._delayed = f"{prefix}:delayed"
+        self._get_script = self._redis.register_script(_REDIS_GET)
+        self._put_script = self._redis.register_script(_REDIS_PUT)
+        self._size = 0
+
+    def qsize(self) -> int:
+        # Last size seen by this process; exact enough for backpressure and metrics.
+        return self._size
+
+    async def put(self, job: QueuedJob, force: bool = False) -> None:
+        added = await self._put_script(
+            keys=[self._ring, self._user_prefix, self._size_key],
+            args=[job.user_id, self.maxsize, int(force), json.dumps(asdict(job))],
+        )
+        if not added:
+            raise QueueFull()
+
+    async def _promote_due_retries(self) -> None:
+        due = await self._redis.zrangebyscore(self._delayed, 0, time.time())
+        for payload in due:
+            if await self._redis.zrem(self._delayed, payload):
+                await self.put(QueuedJob(**json.loads(payload)), force=True)
+
+    async def get(self) -> QueuedJob:
+        while True:
+            await self._promote_due_retries()
+            payload = await self._get_script(keys=[self._ring, self._user_prefix, self._size_key])
+            if payload:
+                self._size = int(await self._redis.get(self._size_key) or 0)
+                return QueuedJob(**json.loads(payload))
+            await asyncio.sleep(self.poll_interval)
+
+    async def retry_later(self, job: QueuedJob, delay: float) -> None:
+        await self._redis.zadd(self._delayed, {json.dumps(asdict(job)): time.time() + delay})
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def create_job_queue(backend: str = CONVERT_QUEUE_BACKEND):
+    if backend == "redis":
+        return RedisJobQueue()
+    if backend == "memory":
+        return InMemoryFairQueue()
+    raise ValueError(f"unknown CONVERT_QUEUE_BACKEND {backend!r}")
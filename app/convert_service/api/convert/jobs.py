@@ -0,0 +1,262 @@
+import datetime
+import os
+import uuid
+from email.utils import format_datetime
+from typing import Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from ....auth_util.principal import Principal
+from ....db_util.db_conn import get_db
+from ....db_util.models import ConversionJob
+from ..auth import get_current_principal
+from .conversion_cache import cache_key, conversion_cache
+from .convert_mp4 import ALLOWED_BITRATES, DEFAULT_BITRATE
+from .job_queue import QueuedJob, QueueFull, create_job_queue
+from .notify import event_publisher
+from .storage import output_key, source_key, storage
+from .workers import ConversionWorkerPool
+
+QUEUE_RETRY_AFTER_SECONDS = 30
+DOWNLOAD_MAX_AGE_SECONDS = int(os.getenv("DOWNLOAD_MAX_AGE_SECONDS", 86400))
+
+job_queue = create_job_queue()
+worker_pool = ConversionWorkerPool(job_queue)
+
+router = APIRouter()
+
+
+def job_response(job: ConversionJob) -> dict:
+    return {
+        "job_id": str(job.id),
+        "status": job.status,
+        "bitrate": job.bitrate,
+        "attempts": job.attempts,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def check_bitrate(bitrate: str) -> None:
+    if bitrate not in ALLOWED_BITRATES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"bitrate must be one of {', '.join(ALLOWED_BITRATES)}",
+        )
+
+
+def queue_full_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Conversion queue is full, try again later",
+        headers={"Retry-After": str(QUEUE_RETRY_AFTER_SECONDS)},
+    )
+
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_job(
+    request: Request,
+    response: Response,
+    bitrate: str = DEFAULT_BITRATE,
+    principal: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Stores the uploaded video and queues its conversion. Returns the job id
+    right away; poll GET /convert/jobs/{job_id} for the result. If the same
+    video was already converted at this bitrate the job is done immediately
+    (200 instead of 202).
+    """
+    check_bitrate(bitrate)
+    # Reject before accepting a possibly huge upload.
+    if job_queue.qsize() >= job_queue.maxsize:
+        raise queue_full_exception()
+
+    job_id = uuid.uuid4()
+    # Streamed into storage chunk by chunk, hashed on the way.
+    source = await storage.write(source_key(job_id), request.stream())
+    if not source.size:
+        await storage.delete(source.key)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty upload")
+    try:
+        result = await submit_job(db, job_id, principal, source.key, source.sha256, bitrate)
+    except QueueFull:
+        await storage.delete(source.key)
+        raise queue_full_exception()
+    if result["status"] == "done":
+        response.status_code = status.HTTP_200_OK
+    return result
+
+
+async def submit_job(
+    db: AsyncSession, job_id: uuid.UUID, principal: Principal, source: str, digest: str, bitrate: str
+) -> dict:
+    """
+    Records a conversion job for an upload already in storage (under the
+    source key) and queues it, or completes it on the spot from the
+    conversion cache. From here on the job owns the source object, except
+    when QueueFull is raised.
+    """
+    job = ConversionJob(
+        id=job_id,
+        user_id=uuid.UUID(principal.user_id),
+        status="queued",
+        bitrate=bitrate,
+        source_path=source,
+        source_sha256=digest,
+        attempts=0,
+    )
+    output = output_key(job_id)
+    if await conversion_cache.link(cache_key(digest, bitrate), output):
+        job.status = "done"
+        job.output_path = output
+        job.finished_at = datetime.datetime.now(datetime.timezone.utc)
+    db.add(job)
+    # Raises IntegrityError if the job id is taken (a concurrent submit of
+    # the same upload), before the source is touched.
+    await db.commit()
+    if job.status == "done":
+        await storage.delete(source)
+        event_publisher.publish(str(job_id), principal.user_id, "done")
+        return {"job_id": str(job_id), "status": "done"}
+
+    try:
+        await job_queue.put(QueuedJob(str(job_id), principal.user_id))
+    except QueueFull:
+        await db.execute(delete(ConversionJob).where(ConversionJob.id == job_id))
+        await db.commit()
+        raise
+
+    return {"job_id": str(job_id), "status": "queued"}
+
+
+async def load_job(db: AsyncSession, job_id: uuid.UUID, principal: Principal) -> ConversionJob:
+    result = await db.execute(select(ConversionJob).where(ConversionJob.id == job_id))
+    job = result.scalar_one_or_none()
+    if job is None or (str(job.user_id) != principal.user_id and principal.role != "admin"):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: uuid.UUID,
+    principal: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    return job_response(await load_job(db, job_id, principal))
+
+
+def http_date(value: datetime.datetime) -> str:
+    if value.tzinfo is None:
+        # SQLite hands back naive datetimes; they are stored as UTC.
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return format_datetime(value.astimezone(datetime.timezone.utc), usegmt=True)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    [start, end) of a single-range Range header; None to send the whole
+    object (no header, or one this endpoint doesn't serve: other units,
+    several ranges, malformed).
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start, end = int(first), min(size, int(last) + 1) if last else size
+        else:
+            start, end = max(0, size - int(last)), size
+    except ValueError:
+        return None
+    if start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+@router.api_route("/jobs/{job_id}/download", methods=["GET", "HEAD"])
+async def download_job_output(
+    job_id: uuid.UUID,
+    request: Request,
+    principal: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Serves the converted MP3. Supports Range / If-Range so interrupted
+    downloads can resume, and If-None-Match for revalidation. On local
+    storage the file is handed to the server as a path where it supports
+    that (zero-copy); otherwise the requested range is streamed from
+    storage in chunks.
+    """
+    job = await load_job(db, job_id, principal)
+    # Release the connection before a potentially long transfer.
+    await db.close()
+    if job.status != "done":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job is {job.status}")
+    gone = HTTPException(status_code=status.HTTP_410_GONE, detail="Output is no longer available")
+    if job.output_path is None:
+        raise gone
+    local_path = storage.local_path(job.output_path)
+    if local_path is not None:
+        try:
+            stat_result = os.stat(local_path)
+        except FileNotFoundError:
+            raise gone
+    else:
+        output = await storage.stat(job.output_path)
+        if output is None:
+            raise gone
+
+    # A job's output never changes once done, so the job id is a strong
+    # validator. The file's own mtime isn't: cache hits share the inode.
+    etag = f'"{job.id.hex}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(job.finished_at),
+        "Cache-Control": f"private, max-age={DOWNLOAD_MAX_AGE_SECONDS}",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if local_path is not None:
+        return FileResponse(
+            local_path,
+            headers=headers,
+            media_type="audio/mpeg",
+            filename=f"{job.id}.mp3",
+            stat_result=stat_result,
+        )
+
+    headers["Accept-Ranges"] = "bytes"
+    headers["Content-Disposition"] = f'attachment; filename="{job.id}.mp3"'
+    start, end, status_code = 0, output.size, status.HTTP_200_OK
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range in (etag, headers["Last-Modified"]):
+        requested = byte_range(request.headers.get("range"), output.size)
+        if requested is not None:
+            start, end = requested
+            status_code = status.HTTP_206_PARTIAL_CONTENT
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{output.size}"
+    headers["Content-Length"] = str(end - start)
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type="audio/mpeg")
+    return StreamingResponse(
+        storage.read(job.output_path, start, end), status_code=status_code, headers=headers, media_type="audio/mpeg"
+    )
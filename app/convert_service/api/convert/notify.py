@@ -0,0 +1,108 @@
+import asyncio
+import os
+import random
+from collections import deque
+from typing import Optional
+
+import httpx
+
+from ....metrics_util.metrics import Counter
+
+# Base URL of the notification service; unset disables notifications.
+NOTIFICATION_URL = os.getenv("NOTIFICATION_URL")
+NOTIFY_API_KEY = os.getenv("NOTIFY_API_KEY")
+NOTIFY_PUBLISH_BATCH = int(os.getenv("NOTIFY_PUBLISH_BATCH", 200))
+NOTIFY_PUBLISH_INTERVAL_SECONDS = float(os.getenv("NOTIFY_PUBLISH_INTERVAL_SECONDS", 0.5))
+NOTIFY_PUBLISH_MAX_BUFFER = int(os.getenv("NOTIFY_PUBLISH_MAX_BUFFER", 10_000))
+
+published = Counter(
+    "convert_notify_events_total",
+    "Conversion-finished events for the notification service, by result (sent, dropped).",
+    labelnames=("result",),
+)
+
+
+class EventPublisher:
+    """
+    Buffers conversion-finished events and POSTs them to the notification
+    service in batches over one keep-alive connection. While the service is
+    unreachable events stay buffered (up to max_buffer, oldest dropped
+    first) and sending is retried with jittered backoff.
+    """
+
+    def __init__(self, url: Optional[str] = NOTIFICATION_URL, batch_size: int = NOTIFY_PUBLISH_BATCH,
+                 max_buffer: int = NOTIFY_PUBLISH_MAX_BUFFER):
+        self.url = url
+        self.batch_size = batch_size
+        self._buffer = deque(maxlen=max_buffer)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def publish(self, job_id: str, user_id: str, status: str, error: Optional[str] = None) -> None:
+        if not self.url:
+            return
+        if len(self._buffer) == self._buffer.maxlen:
+            published.labels("dropped").inc()
+        self._buffer.append({"job_id": job_id, "user_id": user_id, "status": status, "error": error})
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _send_buffered(self) -> None:
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            try:
+                response = await self._client.post(
+                    f"{self.url}/notify/events",
+                    json=batch,
+                    headers={"X-Api-Key": NOTIFY_API_KEY} if NOTIFY_API_KEY else None,
+                )
+                response.raise_for_status()
+            except BaseException:
+                # Put the batch back in order (also when cancelled by stop(),
+                # which sends the buffer once more). Events published in the
+                # meantime may leave too little room; then the oldest of
+                # the batch are dropped, as publish() would.
+                overflow = len(self._buffer) + len(batch) - self._buffer.maxlen
+                if overflow > 0:
+                    published.labels("dropped").inc(overflow)
+                    batch = batch[overflow:]
+                self._buffer.extendleft(reversed(batch))
+                raise
+            published.labels("sent").inc(len(batch))
+
+    async def _loop(self) -> None:
+        failures = 0
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), NOTIFY_PUBLISH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._send_buffered()
+                failures = 0
+            except httpx.HTTPError as e:
+                failures += 1
+                print(f"publishing notification events failed: {e}")
+                await asyncio.sleep(random.uniform(0, min(30, 2 ** failures)))
+
+    def start(self) -> None:
+        if self.url:
+            self._client = httpx.AsyncClient(timeout=10)
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        try:
+            await self._send_buffered()
+        except httpx.HTTPError:
+            pass
+        await self._client.aclose()
+        self._task = None
+
+
+event_publisher = EventPublisher()
@@ -0,0 +1,236 @@
+import asyncio
+import os
+import re
+import shutil
+import tempfile
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from .convert_mp4 import (
+    CONVERT_TRANSCODER,
+    DEFAULT_BITRATE,
+    FFMPEG_BIN,
+    TranscodeError,
+    run_transcoder,
+    transcode_file,
+)
+
+# Off by default: the worker pool already runs CONVERT_WORKERS conversions at
+# once, and splitting only pays off when cores would otherwise sit idle.
+CONVERT_PARALLEL = os.getenv("CONVERT_PARALLEL", "0") == "1"
+CONVERT_SEGMENT_SECONDS = float(os.getenv("CONVERT_SEGMENT_SECONDS", 120))
+CONVERT_SEGMENT_WORKERS = int(os.getenv("CONVERT_SEGMENT_WORKERS", os.cpu_count() or 1))
+# Inputs shorter than this are converted by a single process.
+CONVERT_PARALLEL_MIN_SECONDS = float(os.getenv("CONVERT_PARALLEL_MIN_SECONDS", 600))
+
+# Frames each segment encodes before its own start and after its end, then
+# drops. They prime the encoder (delay, psychoacoustic state, MDCT overlap)
+# with the real neighbouring audio so the joined stream has no seams.
+OVERLAP_FRAMES = 4
+MP3_SAMPLE_RATES = (8000, 11025, 12000, 16000, 22050, 24000, 32000, 44100, 48000)
+
+_DURATION = re.compile(rb"Duration: (\d+):(\d\d):(\d\d(?:\.\d+)?)")
+_AUDIO = re.compile(rb"Stream #\S+.*?: Audio: .*?(\d+) Hz")
+
+
+async def probe_audio(source: str) -> Tuple[Optional[float], Optional[int]]:
+    """Duration in seconds and sample rate of the first audio stream, or None when unknown."""
+    process = await asyncio.create_subprocess_exec(
+        FFMPEG_BIN, "-hide_banner", "-nostdin", "-i", source,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    # No output file given, so ffmpeg prints the input info and exits 1.
+    _, info = await process.communicate()
+    duration = sample_rate = None
+    if match := _DURATION.search(info):
+        hours, minutes, seconds = match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    if match := _AUDIO.search(info):
+        sample_rate = int(match.group(1))
+    return duration, sample_rate
+
+
+def frame_samples(sample_rate: int) -> int:
+    # MPEG-1 Layer III frames hold 1152 samples, MPEG-2/2.5 ones 576.
+    return 1152 if sample_rate >= 32000 else 576
+
+
+def plan_segments(duration: float, sample_rate: int, segment_seconds: float) -> List[Tuple[int, int]]:
+    """
+    Splits [0, duration) into (first_frame, frame_count) segments, with every
+    boundary on an MP3 frame boundary; the last segment runs to the end
+    (frame_count -1).
+    """
+    frame = frame_samples(sample_rate)
+    per_segment = max(1, round(segment_seconds * sample_rate / frame))
+    total = int(duration * sample_rate / frame) + 1
+    segments = [(first, per_segment) for first in range(0, total, per_segment)]
+    # Fold a short tail into the previous segment.
+    if len(segments) > 1 and total - segments[-1][0] < per_segment // 2:
+        segments.pop()
+    first, _ = segments[-1]
+    segments[-1] = (first, -1)
+    return segments
+
+
+_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def iter_mp3_frames(data: bytes) -> Iterator[Tuple[int, int]]:
+    """(offset, length) of each Layer III frame in a bare MP3 stream."""
+    pos = 0
+    while pos + 4 <= len(data):
+        b1, b2 = data[pos + 1], data[pos + 2]
+        version = (b1 >> 3) & 3
+        if data[pos] != 0xFF or (b1 & 0xE0) != 0xE0 or version == 1 or (b1 >> 1) & 3 != 1:
+            raise TranscodeError(f"unexpected data in MP3 segment at byte {pos}")
+        bitrate = _BITRATES[1 if version == 3 else 2][b2 >> 4] * 1000
+        sample_rate = _SAMPLE_RATES[version][(b2 >> 2) & 3]
+        padding = (b2 >> 1) & 1
+        length = (144 if version == 3 else 72) * bitrate // sample_rate + padding
+        if not length:
+            raise TranscodeError("free-format MP3 frames are not supported")
+        yield pos, length
+        pos += length
+
+
+def segment_command(source: str, dest: str, bitrate: str, sample_rate: int,
+                    first_frame: int, frame_count: int, progress: bool = False) -> List[str]:
+    frame = frame_samples(sample_rate)
+    start_frame = max(0, first_frame - OVERLAP_FRAMES)
+    cmd = [FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-nostdin", "-y"]
+    if progress:
+        cmd += ["-progress", "pipe:1", "-nostats"]
+    if start_frame:
+        cmd += ["-ss", f"{start_frame * frame / sample_rate:.6f}"]
+    if frame_count >= 0:
+        end_frame = first_frame + frame_count + OVERLAP_FRAMES
+        cmd += ["-t", f"{(end_frame - start_frame) * frame / sample_rate:.6f}"]
+    return cmd + [
+        "-i", source,
+        "-vn", "-map", "0:a:0",
+        "-ar", str(sample_rate),
+        # Without the bit reservoir every frame decodes on its own, so frames
+        # from different segments can be spliced byte for byte.
+        "-codec:a", "libmp3lame", "-b:a", bitrate, "-reservoir", "0",
+        "-write_xing", "0", "-id3v2_version", "0",
+        "-f", "mp3", dest,
+    ]
+
+
+async def _run_limited(semaphore: asyncio.Semaphore, cmd: List[str], on_progress=None) -> None:
+    async with semaphore:
+        await run_transcoder(cmd, on_progress)
+
+
+def join_segments(paths: List[str], segments: List[Tuple[int, int]], dest) -> None:
+    """
+    Writes the frames each segment owns to dest: its overlap frames are
+    dropped, which leaves one contiguous frame sequence.
+    """
+    for path, (first_frame, frame_count) in zip(paths, segments):
+        with open(path, "rb") as f:
+            data = f.read()
+        frames = list(iter_mp3_frames(data))
+        skip = min(first_frame, OVERLAP_FRAMES)
+        keep = frames[skip:] if frame_count < 0 else frames[skip:skip + frame_count]
+        if not keep:
+            continue
+        start, _ = keep[0]
+        end = sum(keep[-1])
+        dest.write(data[start:end])
+
+
+async def transcode_file_parallel(
+    source: str,
+    dest: str,
+    bitrate: str = DEFAULT_BITRATE,
+    duration: Optional[float] = None,
+    sample_rate: Optional[int] = None,
+    segment_seconds: float = CONVERT_SEGMENT_SECONDS,
+    workers: int = CONVERT_SEGMENT_WORKERS,
+    on_progress: Optional[Callable[[float], None]] = None,
+) -> None:
+    """
+    Converts source to an MP3 at dest by encoding time segments in up to
+    `workers` ffmpeg processes at once and splicing their frames into one
+    gapless stream. Needs the real ffmpeg (it seeks in the source).
+    on_progress gets the seconds converted so far, summed over segments.
+    """
+    if duration is None or sample_rate is None:
+        duration, sample_rate = await probe_audio(source)
+    if not duration or not sample_rate:
+        raise TranscodeError(f"could not determine duration and sample rate of {source}")
+    if sample_rate not in MP3_SAMPLE_RATES:
+        sample_rate = 44100
+
+    segments = plan_segments(duration, sample_rate, segment_seconds)
+    workdir = tempfile.mkdtemp(prefix=".segments-", dir=os.path.dirname(os.path.abspath(dest)))
+    try:
+        paths = [os.path.join(workdir, f"{i}.mp3") for i in range(len(segments))]
+        semaphore = asyncio.Semaphore(max(1, workers))
+        done = [0.0] * len(segments)
+
+        def segment_progress(index: int):
+            if on_progress is None:
+                return None
+
+            def report(seconds: float) -> None:
+                done[index] = seconds
+                on_progress(sum(done))
+            return report
+
+        tasks = [
+            asyncio.create_task(_run_limited(
+                semaphore,
+                segment_command(source, path, bitrate, sample_rate, first, count, on_progress is not None),
+                segment_progress(i),
+            ))
+            for i, (path, (first, count)) in enumerate(zip(paths, segments))
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        joined = os.path.join(workdir, "joined.mp3")
+        with open(joined, "wb") as f:
+            await asyncio.to_thread(join_segments, paths, segments, f)
+        # Remux to add the Xing/Info header (duration, seek table) for the
+        # whole stream.
+        await run_transcoder([
+            FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+            "-i", joined, "-c", "copy", "-f", "mp3", dest + ".part",
+        ])
+        os.replace(dest + ".part", dest)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+async def convert_file(
+    source: str, dest: str, bitrate: str = DEFAULT_BITRATE, on_progress: Optional[Callable[[float], None]] = None
+) -> None:
+    """
+    Converts a source file to MP3, splitting long inputs across processes
+    when CONVERT_PARALLEL is on. on_progress is called with the fraction
+    done (0 to 1) when the input duration is known.
+    """
+    duration = sample_rate = None
+    if CONVERT_TRANSCODER == "ffmpeg" and (CONVERT_PARALLEL or on_progress is not None):
+        duration, sample_rate = await probe_audio(source)
+    report = None
+    if on_progress is not None and duration:
+        def report(seconds: float) -> None:
+            on_progress(min(1.0, seconds / duration))
+
+    if CONVERT_PARALLEL and duration and sample_rate and duration >= CONVERT_PARALLEL_MIN_SECONDS:
+        await transcode_file_parallel(source, dest, bitrate, duration, sample_rate, on_progress=report)
+    else:
+        await transcode_file(source, dest, bitrate, on_progress=report)
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import uuid
+from typing import Dict, Optional, Set
+
+from sqlalchemy.future import select
+
+from ....db_util.db_conn import AsyncSessionLocal
+from ....db_util.models import ConversionJob
+from ....metrics_util.metrics import Gauge
+
+# Subscribed jobs that aren't converting in this process (e.g. another
+# worker process took them) are checked in one query this often.
+PROGRESS_POLL_SECONDS = float(os.getenv("PROGRESS_POLL_SECONDS", 5))
+FINAL_STATUSES = ("done", "failed")
+
+
+class Subscription:
+    """
+    One subscriber's view of a job. It holds only the latest event: every
+    event carries the job's full state, so an idle or slow subscriber skips
+    intermediate progress instead of queueing it, and costs the same small
+    constant memory however long it stays connected.
+    """
+
+    __slots__ = ("job_id", "event", "_changed")
+
+    def __init__(self, job_id: str, event: dict):
+        self.job_id = job_id
+        self.event = event
+        self._changed = asyncio.Event()
+
+    def push(self, event: dict) -> None:
+        self.event = event
+        self._changed.set()
+
+    async def next(self, timeout: float) -> Optional[dict]:
+        """Waits for a newer event; None if there was none within timeout."""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._changed.clear()
+        return self.event
+
+
+class ProgressBroker:
+    """In-process pub/sub of per-job progress events."""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        # Latest event of jobs converting in this process.
+        self._active: Dict[str, dict] = {}
+        self._poller: Optional[asyncio.Task] = None
+
+    def publish(self, job_id: str, status: str, progress: Optional[float] = None, error: Optional[str] = None) -> None:
+        event = {"job_id": job_id, "status": status, "progress": progress, "error": error}
+        if status == "running":
+            previous = self._active.get(job_id)
+            # ffmpeg reports twice a second; only whole percents go out.
+            if previous is not None and progress is not None and previous["progress"] is not None \
+                    and int(progress * 100) == int(previous["progress"] * 100):
+                return
+            self._active[job_id] = event
+        else:
+            self._active.pop(job_id, None)
+        for subscription in self._subscribers.get(job_id, ()):
+            subscription.push(event)
+
+    def subscribe(self, job_id: str, current: dict) -> Subscription:
+        """current is the job's state as read from the database."""
+        subscription = Subscription(job_id, self._active.get(job_id, current))
+        self._subscribers.setdefault(job_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.job_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.job_id]
+
+    def subscriber_count(self) -> int:
+        return sum(len(s) for s in self._subscribers.values())
+
+    async def _poll_remote(self) -> None:
+        remote = [job_id for job_id in self._subscribers if job_id not in self._active]
+        if not remote:
+            return
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ConversionJob.id, ConversionJob.status, ConversionJob.error)
+                .where(ConversionJob.id.in_([uuid.UUID(job_id) for job_id in remote]))
+            )
+            rows = result.all()
+        for job_id, status, error in rows:
+            job_id = str(job_id)
+            subscribers = self._subscribers.get(job_id, ())
+            if any(s.event["status"] != status for s in subscribers):
+                event = {"job_id": job_id, "status": status, "progress": None, "error": error}
+                for subscription in subscribers:
+                    subscription.push(event)
+
+    async def _poll_loop(self) -> None:
+        while True:
+            await asyncio.sleep(PROGRESS_POLL_SECONDS)
+            try:
+                await self._poll_remote()
+            except Exception as e:
+                print(f"progress poll failed: {e}")
+
+    def start(self) -> None:
+        self._poller = asyncio.create_task(self._poll_loop())
+
+    async def stop(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+
+
+progress_broker = ProgressBroker()
+
+Gauge(
+    "convert_progress_subscribers",
+    "Open progress subscriptions (SSE and WebSocket) in this process.",
+    callback=lambda: {(): progress_broker.subscriber_count()},
+)
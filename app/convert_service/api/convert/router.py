@@ -0,0 +1,9 @@
+from fastapi import APIRouter
+from . import convert_mp4, events, jobs, uploads
+
+router = APIRouter(prefix="/convert", tags=["convert"],)
+
+router.include_router(convert_mp4.router)
+router.include_router(jobs.router)
+router.include_router(uploads.router)
+router.include_router(events.router)
@@ -0,0 +1,43 @@
+import os
+import shutil
+import time
+import uuid
+
+from ....storage_util.storage import create_storage
+from .convert_mp4 import CONVERT_DATA_DIR
+
+# Local working space for the transcoder, which reads and writes files.
+SCRATCH_DIR = os.path.join(CONVERT_DATA_DIR, "scratch")
+SCRATCH_MAX_AGE_SECONDS = 24 * 3600
+
+# Sources, outputs and the conversion cache. With the local backend (the
+# default) objects live under $CONVERT_DATA_DIR/objects unless STORAGE_ROOT
+# is set.
+storage = create_storage(os.path.join(CONVERT_DATA_DIR, "objects"), scratch_dir=SCRATCH_DIR)
+
+
+def source_key(job_id) -> str:
+    return f"sources/{job_id}.src"
+
+
+def output_key(job_id) -> str:
+    return f"outputs/{job_id}.mp3"
+
+
+def scratch_path(suffix: str = "") -> str:
+    os.makedirs(SCRATCH_DIR, exist_ok=True)
+    return os.path.join(SCRATCH_DIR, f"{uuid.uuid4().hex}{suffix}")
+
+
+def purge_scratch() -> None:
+    """Deletes scratch files left behind by conversions that never finished."""
+    if not os.path.isdir(SCRATCH_DIR):
+        return
+    cutoff = time.time() - SCRATCH_MAX_AGE_SECONDS
+    for entry in os.scandir(SCRATCH_DIR):
+        if entry.stat().st_mtime >= cutoff:
+            continue
+        if entry.is_dir():
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            os.remove(entry.path)
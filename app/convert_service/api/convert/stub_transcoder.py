@@ -0,0 +1,34 @@
+"""
+Stand-in for ffmpeg in offline tests. Like the real command built by
+convert_mp4.transcoder_command it reads the source from stdin in chunks,
+writes the "converted" stream to stdout as it goes, reports errors on stderr
+and exits non-zero on empty input. The output is an ID3 header followed by
+the input bytes.
+
+Usage: stub_transcoder.py [source] [dest], where pipe:0 / pipe:1 (the
+defaults) mean stdin / stdout.
+"""
+import sys
+
+CHUNK_SIZE = 64 * 1024
+ID3_HEADER = b"ID3\x04\x00\x00\x00\x00\x00\x00"
+
+
+def main(source: str = "pipe:0", dest: str = "pipe:1") -> int:
+    stdin = sys.stdin.buffer if source == "pipe:0" else open(source, "rb")
+    stdout = sys.stdout.buffer if dest == "pipe:1" else open(dest, "wb")
+    total = 0
+    while chunk := stdin.read1(CHUNK_SIZE):
+        if total == 0:
+            stdout.write(ID3_HEADER)
+        total += len(chunk)
+        stdout.write(chunk)
+        stdout.flush()
+    if total == 0:
+        sys.stderr.write("pipe:0: Invalid data found when processing input\n")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:3]))
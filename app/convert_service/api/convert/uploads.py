@@ -0,0 +1,353 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ....auth_util.principal import Principal
+from ....db_util.db_conn import get_db
+from ..auth import get_current_principal
+from .convert_mp4 import CONVERT_DATA_DIR, DEFAULT_BITRATE
+from .job_queue import QueueFull
+from .jobs import check_bitrate, job_queue, load_job, queue_full_exception, submit_job
+from .storage import source_key, storage
+
+CHUNKED_UPLOADS_DIR = os.path.join(CONVERT_DATA_DIR, "chunked")
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 20 * 1024 ** 3))
+UPLOAD_MAX_CHUNK_BYTES = int(os.getenv("UPLOAD_MAX_CHUNK_BYTES", 64 * 1024 ** 2))
+# Unfinished uploads are deleted this long after they were created, checked
+# every UPLOAD_PURGE_INTERVAL_SECONDS.
+UPLOAD_TTL_SECONDS = float(os.getenv("UPLOAD_TTL_SECONDS", 24 * 3600))
+UPLOAD_PURGE_INTERVAL_SECONDS = float(os.getenv("UPLOAD_PURGE_INTERVAL_SECONDS", 600))
+
+router = APIRouter()
+
+
+@dataclass
+class UploadRequest:
+    size: int
+    bitrate: str = DEFAULT_BITRATE
+
+
+def upload_paths(upload_id: uuid.UUID):
+    """
+    Data file, metadata and chunk log of an upload. The chunk log is
+    append-only ("start end sha256" per line) so concurrent chunk writes,
+    even from different processes, never clobber each other's records.
+    """
+    base = os.path.join(CHUNKED_UPLOADS_DIR, str(upload_id))
+    return base + ".part", base + ".json", base + ".chunks"
+
+
+def read_meta(upload_id: uuid.UUID, principal: Principal) -> dict:
+    _, meta_path, _ = upload_paths(upload_id)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        meta = None
+    if meta is None or meta["user_id"] != principal.user_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    return meta
+
+
+def read_chunk_log(log_path: str) -> List[Tuple[int, int, str]]:
+    """Distinct (start, end, sha256) records of a chunk log, in offset order."""
+    try:
+        with open(log_path) as f:
+            records = {(int(start), int(end), sha256) for start, end, sha256 in (line.split() for line in f if line.strip())}
+    except FileNotFoundError:
+        return []
+    return sorted(records)
+
+
+def merge_ranges(chunks: Iterable[Tuple[int, int]]) -> List[List[int]]:
+    ranges: List[List[int]] = []
+    for start, end in sorted(chunks):
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return ranges
+
+
+def received_ranges(log_path: str) -> List[List[int]]:
+    """Merged [start, end) byte ranges recorded in a chunk log."""
+    return merge_ranges((start, end) for start, end, _ in read_chunk_log(log_path))
+
+
+def verified_ranges(data_path: str, log_path: str) -> List[List[int]]:
+    """
+    Like received_ranges, but only counting chunks whose bytes in the spool
+    file still match the digest logged for them, so a range overwritten
+    since it was recorded shows up as missing.
+    """
+    good = []
+    with open(data_path, "rb") as f:
+        for start, end, sha256 in read_chunk_log(log_path):
+            f.seek(start)
+            digest, remaining = hashlib.sha256(), end - start
+            while remaining:
+                block = f.read(min(remaining, 1024 * 1024))
+                if not block:
+                    break
+                digest.update(block)
+                remaining -= len(block)
+            if not remaining and digest.hexdigest() == sha256:
+                good.append((start, end))
+    return merge_ranges(good)
+
+
+def missing_ranges(ranges: List[List[int]], size: int) -> List[List[int]]:
+    missing, pos = [], 0
+    for start, end in ranges:
+        if start > pos:
+            missing.append([pos, start])
+        pos = max(pos, end)
+    if pos < size:
+        missing.append([pos, size])
+    return missing
+
+
+def remove_upload(upload_id: uuid.UUID) -> None:
+    for path in upload_paths(upload_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def copy_into(src_fd: int, dst_fd: int, count: int, offset: int) -> None:
+    """Copies count bytes from the start of src_fd to offset in dst_fd, in the kernel where it can."""
+    src_pos = 0
+    try:
+        while src_pos < count:
+            copied = os.copy_file_range(src_fd, dst_fd, count - src_pos, src_pos, offset + src_pos)
+            if not copied:
+                break
+            src_pos += copied
+    except (AttributeError, OSError):
+        # No copy_file_range here, or not between these files.
+        pass
+    while src_pos < count:
+        block = os.pread(src_fd, min(count - src_pos, 1024 * 1024), src_pos)
+        if not block:
+            raise OSError(f"chunk file ended after {src_pos} of {count} bytes")
+        view = memoryview(block)
+        while view:
+            written = os.pwrite(dst_fd, view, offset + src_pos)
+            view, src_pos = view[written:], src_pos + written
+
+
+def purge_expired_uploads() -> None:
+    """Deletes chunked uploads that were never finalized."""
+    if not os.path.isdir(CHUNKED_UPLOADS_DIR):
+        return
+    cutoff = time.time() - UPLOAD_TTL_SECONDS
+    for name in os.listdir(CHUNKED_UPLOADS_DIR):
+        path = os.path.join(CHUNKED_UPLOADS_DIR, name)
+        if name.endswith(".json") and os.path.getmtime(path) < cutoff:
+            remove_upload(uuid.UUID(name[: -len(".json")]))
+        elif name.endswith(".chunk") and os.path.getmtime(path) < cutoff:
+            # Left behind by a process that died mid-chunk.
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+
+class UploadPurger:
+    """Runs purge_expired_uploads() at startup and then every interval."""
+
+    def __init__(self, interval: float = UPLOAD_PURGE_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(purge_expired_uploads)
+            except Exception as e:
+                print(f"purging expired uploads failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+upload_purger = UploadPurger()
+
+
+@router.post("/uploads", status_code=status.HTTP_201_CREATED)
+async def create_upload(payload: UploadRequest, principal: Principal = Depends(get_current_principal)):
+    """
+    Starts a chunked upload of `size` bytes. Send the bytes with
+    PUT /convert/uploads/{upload_id}?offset=N in any order, then call
+    POST /convert/uploads/{upload_id}/finalize.
+    """
+    check_bitrate(payload.bitrate)
+    if not 0 < payload.size <= UPLOAD_MAX_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"size must be between 1 and {UPLOAD_MAX_BYTES} bytes",
+        )
+    upload_id = uuid.uuid4()
+    data_path, meta_path, _ = upload_paths(upload_id)
+    os.makedirs(CHUNKED_UPLOADS_DIR, exist_ok=True)
+    # Sparse file of the final size; chunks are written in place.
+    with open(data_path, "wb") as f:
+        f.truncate(payload.size)
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump({"user_id": principal.user_id, "size": payload.size, "bitrate": payload.bitrate}, f)
+    os.replace(meta_path + ".tmp", meta_path)
+    return {"upload_id": str(upload_id), "size": payload.size, "max_chunk_bytes": UPLOAD_MAX_CHUNK_BYTES}
+
+
+@router.get("/uploads/{upload_id}")
+async def get_upload(upload_id: uuid.UUID, principal: Principal = Depends(get_current_principal)):
+    """Byte ranges received so far; a resuming client sends the missing ones."""
+    meta = read_meta(upload_id, principal)
+    ranges = received_ranges(upload_paths(upload_id)[2])
+    return {
+        "upload_id": str(upload_id),
+        "size": meta["size"],
+        "bitrate": meta["bitrate"],
+        "received": ranges,
+        "missing": missing_ranges(ranges, meta["size"]),
+    }
+
+
+@router.put("/uploads/{upload_id}")
+async def put_chunk(
+    upload_id: uuid.UUID,
+    offset: int,
+    request: Request,
+    principal: Principal = Depends(get_current_principal),
+):
+    """
+    Writes the request body at `offset`. The chunk is streamed to a file of
+    its own first and, if the client sends an X-Chunk-SHA256 header,
+    checked before it is copied into the spool file, so a bad or cut-off
+    re-send never overwrites data already received, and memory per request
+    stays at one network read. The response carries the digest the server
+    computed.
+    """
+    meta = read_meta(upload_id, principal)
+    data_path, _, log_path = upload_paths(upload_id)
+    limit = min(meta["size"], offset + UPLOAD_MAX_CHUNK_BYTES)
+    if not 0 <= offset < meta["size"]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="offset is outside the upload")
+
+    digest = hashlib.sha256()
+    pos = offset
+    chunk_path = f"{data_path[: -len('.part')]}.{uuid.uuid4().hex}.chunk"
+    chunk_fd = os.open(chunk_path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        async for chunk in request.stream():
+            if pos + len(chunk) > limit:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail="Chunk runs past the end of the upload or exceeds max_chunk_bytes",
+                )
+            os.write(chunk_fd, chunk)
+            digest.update(chunk)
+            pos += len(chunk)
+        if pos == offset:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty chunk")
+
+        expected = request.headers.get("x-chunk-sha256")
+        if expected is not None and expected.lower() != digest.hexdigest():
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Chunk checksum mismatch")
+        # Positioned copy into the spool file; no seek state is shared
+        # between concurrent chunks.
+        fd = os.open(data_path, os.O_WRONLY)
+        try:
+            await asyncio.to_thread(copy_into, chunk_fd, fd, pos - offset, offset)
+        finally:
+            os.close(fd)
+    finally:
+        os.close(chunk_fd)
+        os.remove(chunk_path)
+
+    fd = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, f"{offset} {pos} {digest.hexdigest()}\n".encode())
+    finally:
+        os.close(fd)
+    return {"offset": offset, "length": pos - offset, "sha256": digest.hexdigest()}
+
+
+def file_sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+async def finalized_job(db: AsyncSession, upload_id: uuid.UUID, principal: Principal) -> dict:
+    job = await load_job(db, upload_id, principal)
+    return {"job_id": str(job.id), "status": job.status}
+
+
+@router.post("/uploads/{upload_id}/finalize", status_code=status.HTTP_202_ACCEPTED)
+async def finalize_upload(
+    upload_id: uuid.UUID,
+    response: Response,
+    principal: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Turns a complete upload into a conversion job whose id is the upload id.
+    Safe to retry: once finalized it returns the job's status.
+    """
+    data_path, meta_path, log_path = upload_paths(upload_id)
+    if not os.path.exists(meta_path):
+        return await finalized_job(db, upload_id, principal)
+    meta = read_meta(upload_id, principal)
+    try:
+        ranges = await asyncio.to_thread(verified_ranges, data_path, log_path)
+    except FileNotFoundError:
+        # A concurrent finalize got there first and removed the upload.
+        return await finalized_job(db, upload_id, principal)
+    missing = missing_ranges(ranges, meta["size"])
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Upload is incomplete", "missing": missing},
+        )
+    if job_queue.qsize() >= job_queue.maxsize:
+        raise queue_full_exception()
+
+    try:
+        # Content hash for the conversion cache, read in blocks off the event loop.
+        digest = await asyncio.to_thread(file_sha256, data_path)
+        # Chunks are assembled in place on local disk; the finished file then
+        # goes to storage (a hard link with the local backend).
+        source = await storage.put_file(source_key(upload_id), data_path)
+    except FileNotFoundError:
+        return await finalized_job(db, upload_id, principal)
+    try:
+        result = await submit_job(db, upload_id, principal, source.key, digest, meta["bitrate"])
+    except QueueFull:
+        # Keep the upload so the client can retry finalize later.
+        await storage.delete(source.key)
+        raise queue_full_exception()
+    except IntegrityError:
+        # Lost a race with a concurrent finalize of the same upload; the
+        # source key is the winner's now.
+        await db.rollback()
+        return await finalized_job(db, upload_id, principal)
+    remove_upload(upload_id)
+    if result["status"] == "done":
+        response.status_code = status.HTTP_200_OK
+    return result
@@ -0,0 +1,225 @@
+import asyncio
+import contextlib
+import datetime
+import os
+import random
+import uuid
+
+from sqlalchemy import func, update
+from sqlalchemy.future import select
+
+from ....db_util.db_conn import AsyncSessionLocal
+from ....db_util.models import ConversionJob
+from ....metrics_util.metrics import Counter, Gauge, Histogram
+from ....storage_util.storage import StorageError
+from .conversion_cache import cache_key, conversion_cache
+from .convert_mp4 import TranscodeError
+from .job_queue import QueuedJob
+from .notify import event_publisher
+from .parallel_transcode import convert_file
+from .progress import progress_broker
+from .storage import output_key, scratch_path, storage
+
+# Each worker runs one transcoder process at a time, so this caps the number
+# of concurrent ffmpeg processes per service process.
+CONVERT_WORKERS = int(os.getenv("CONVERT_WORKERS", os.cpu_count() or 1))
+CONVERT_MAX_ATTEMPTS = int(os.getenv("CONVERT_MAX_ATTEMPTS", 3))
+CONVERT_RETRY_BASE_SECONDS = float(os.getenv("CONVERT_RETRY_BASE_SECONDS", 2))
+CONVERT_RETRY_MAX_SECONDS = float(os.getenv("CONVERT_RETRY_MAX_SECONDS", 60))
+# A running job's updated_at is bumped this often while it converts; jobs
+# left "running" without a heartbeat for CONVERT_HEARTBEAT_TIMEOUT_SECONDS
+# (their process died) are requeued by recover().
+CONVERT_HEARTBEAT_SECONDS = float(os.getenv("CONVERT_HEARTBEAT_SECONDS", 30))
+CONVERT_HEARTBEAT_TIMEOUT_SECONDS = float(os.getenv("CONVERT_HEARTBEAT_TIMEOUT_SECONDS", 120))
+
+job_seconds = Histogram(
+    "convert_job_seconds",
+    "Wall-clock time of conversion attempts by outcome.",
+    labelnames=("outcome",),
+)
+jobs_finished = Counter(
+    "convert_jobs_total",
+    "Conversion jobs that reached a final state.",
+    labelnames=("status",),
+)
+
+
+def retry_delay(attempt: int) -> float:
+    """Exponential backoff with jitter for the given (1-based) failed attempt."""
+    delay = min(CONVERT_RETRY_MAX_SECONDS, CONVERT_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class ConversionWorkerPool:
+    """
+    Pulls jobs off the queue and converts them, `concurrency` at a time.
+    A job is claimed with a conditional UPDATE, so a job enqueued twice
+    (e.g. by recovery in several processes) is still converted only once.
+    """
+
+    def __init__(self, queue, concurrency: int = CONVERT_WORKERS):
+        self.queue = queue
+        self.concurrency = concurrency
+        self._tasks = []
+        self._busy = 0
+        Gauge(
+            "convert_workers",
+            "Conversion workers and queue depth of this process.",
+            labelnames=("state",),
+            callback=lambda: {
+                ("busy",): self._busy,
+                ("idle",): len(self._tasks) - self._busy,
+                ("queued",): self.queue.qsize(),
+            },
+        )
+
+    async def start(self) -> None:
+        await self.recover()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.queue.close()
+
+    async def recover(self) -> None:
+        """Re-enqueues jobs that were pending when the service last stopped."""
+        stale = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=CONVERT_HEARTBEAT_TIMEOUT_SECONDS)
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(ConversionJob)
+                .where(ConversionJob.status == "running", ConversionJob.updated_at < stale)
+                .values(status="queued")
+            )
+            await db.commit()
+            result = await db.execute(
+                select(ConversionJob.id, ConversionJob.user_id, ConversionJob.attempts)
+                .where(ConversionJob.status == "queued")
+                .order_by(ConversionJob.created_at)
+            )
+            for job_id, user_id, attempts in result.all():
+                await self.queue.put(QueuedJob(str(job_id), str(user_id), attempts), force=True)
+
+    async def _claim(self, db, job_id: uuid.UUID):
+        result = await db.execute(
+            update(ConversionJob)
+            .where(ConversionJob.id == job_id, ConversionJob.status == "queued")
+            .values(status="running", attempts=ConversionJob.attempts + 1)
+            .returning(
+                ConversionJob.source_path, ConversionJob.source_sha256, ConversionJob.bitrate, ConversionJob.attempts
+            )
+        )
+        row = result.one_or_none()
+        await db.commit()
+        return row
+
+    async def _heartbeat(self, job_id: uuid.UUID) -> None:
+        """Marks a claimed job as alive until cancelled, so recover() leaves it alone."""
+        while True:
+            await asyncio.sleep(CONVERT_HEARTBEAT_SECONDS)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(ConversionJob)
+                        .where(ConversionJob.id == job_id, ConversionJob.status == "running")
+                        .values(updated_at=func.now())
+                    )
+                    await db.commit()
+            except Exception as e:
+                print(f"heartbeat of job {job_id} failed: {e}")
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self.queue.get()
+            self._busy += 1
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # A DB hiccup must not kill the worker; the job stays in the
+                # DB and is picked up again by recovery.
+                print(f"conversion worker error on job {job.job_id}: {e}")
+            finally:
+                self._busy -= 1
+
+    async def _run(self, job: QueuedJob) -> None:
+        job_id = uuid.UUID(job.job_id)
+        async with AsyncSessionLocal() as db:
+            claimed = await self._claim(db, job_id)
+        if claimed is None:
+            return
+        source, digest, bitrate, attempts = claimed
+        dest = output_key(job_id)
+        progress_broker.publish(job.job_id, "running", 0.0)
+
+        def on_progress(fraction: float) -> None:
+            progress_broker.publish(job.job_id, "running", fraction)
+
+        async def convert(path: str) -> None:
+            # The transcoder needs the source as a local file; remote
+            # storage downloads it to scratch space for the duration.
+            async with storage.local_file(source) as source_path:
+                await convert_file(source_path, path, bitrate, on_progress)
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            if digest:
+                await conversion_cache.fetch(cache_key(digest, bitrate), dest, convert)
+            else:
+                tmp = scratch_path(".mp3")
+                try:
+                    await convert(tmp)
+                    await storage.put_file(dest, tmp)
+                finally:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(tmp)
+        except (TranscodeError, StorageError, OSError) as e:
+            outcome = await self._failed(job, attempts, str(e))
+        else:
+            outcome = "done"
+            await self._finish(job_id, status="done", output_path=dest, error=None)
+            jobs_finished.labels("done").inc()
+            progress_broker.publish(job.job_id, "done", 1.0)
+            event_publisher.publish(job.job_id, job.user_id, "done")
+        finally:
+            heartbeat.cancel()
+        job_seconds.labels(outcome).observe(loop.time() - start)
+        if outcome != "retry":
+            await storage.delete(source)
+
+    async def _failed(self, job: QueuedJob, attempts: int, error: str) -> str:
+        if attempts >= CONVERT_MAX_ATTEMPTS:
+            await self._finish(uuid.UUID(job.job_id), status="failed", output_path=None, error=error)
+            jobs_finished.labels("failed").inc()
+            progress_broker.publish(job.job_id, "failed", error=error)
+            event_publisher.publish(job.job_id, job.user_id, "failed", error)
+            return "failed"
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(ConversionJob)
+                .where(ConversionJob.id == uuid.UUID(job.job_id))
+                .values(status="queued", error=error)
+            )
+            await db.commit()
+        await self.queue.retry_later(QueuedJob(job.job_id, job.user_id, attempts), retry_delay(attempts))
+        progress_broker.publish(job.job_id, "queued", error=error)
+        return "retry"
+
+    async def _finish(self, job_id: uuid.UUID, status: str, output_path, error) -> None:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(ConversionJob)
+                .where(ConversionJob.id == job_id)
+                .values(
+                    status=status,
+                    output_path=output_path,
+                    error=error,
+                    finished_at=datetime.datetime.now(datetime.timezone.utc),
+                )
+            )
+            await db.commit()
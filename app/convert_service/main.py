@@ -0,0 +1,51 @@
+
+from fastapi import FastAPI
+
+from .api.convert import router as convert_router
+from .api.convert.conversion_cache import conversion_cache
+from .api.convert.jobs import worker_pool
+from .api.convert.notify import event_publisher
+from .api.convert.progress import progress_broker
+from .api.convert.storage import purge_scratch, storage
+from .api.convert.uploads import upload_purger
+from ..auth_util.revocation import revocation_index
+from ..db_util.db_conn import dispose_engine
+from ..db_util.migrations import ensure_schema
+from ..metrics_util import router as metrics_router
+from ..metrics_util.middleware import MetricsMiddleware
+
+
+
+app = FastAPI(title="Video TO mp3 convert service")
+app.add_middleware(MetricsMiddleware)
+
+app.include_router(convert_router.router)
+app.include_router(metrics_router.router)
+
+@app.get("/")
+async def root():
+    return {"message": "Hello from our video to mp3 convert service"}
+
+
+@app.on_event("startup")
+async def startup():
+    await ensure_schema()
+    await revocation_index.load()
+    revocation_index.start()
+    await conversion_cache.load()
+    upload_purger.start()
+    purge_scratch()
+    await worker_pool.start()
+    progress_broker.start()
+    event_publisher.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await upload_purger.stop()
+    await progress_broker.stop()
+    await worker_pool.stop()
+    await event_publisher.stop()
+    await revocation_index.stop()
+    await storage.close()
+    await dispose_engine()
@@ -1,27 +1,98 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.dialects import postgresql, sqlite
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+from .pool import InstrumentedQueuePool, register_pool_gauges
+from ..metrics_util.metrics import Histogram
 
+# main.py has already loaded .env into the environment.
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-# Async engine with connection pool
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=False,  # turn True for debugging SQL queries
-    pool_size=5,
-    max_overflow=10,
-    pool_timeout=30,
-    pool_recycle=1800,  # recycle every 30 min to avoid stale connections
-)
+# Set per worker by main.py so that all workers together stay within
+# DB_MAX_CONNECTIONS.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # recycle every 30 min to avoid stale connections
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))  # 0 disables it
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")  # log SQL queries
+
+
+def _connect_args(url: str) -> dict:
+    if not DB_STATEMENT_TIMEOUT_MS:
+        return {}
+    driver = make_url(url).drivername
+    if driver == "postgresql+asyncpg":
+        return {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+    if driver.startswith("postgresql"):
+        return {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return {}
+
 
-# Session factory
-AsyncSessionLocal = async_sessionmaker(
-    engine, expire_on_commit=False, autoflush=False, autocommit=False
+db_query_seconds = Histogram(
+    "db_query_seconds",
+    "Time spent executing SQL statements, including the network round trip.",
 )
 
+
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_start"] = time.perf_counter()
+
+
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    db_query_seconds.observe(time.perf_counter() - conn.info["query_start"])
+
+
+# The engine (and with it the DB driver import) is created on first use, so
+# importing the services and CLI commands stays cheap.
+_engine = None
+_sessionmaker = None
+
+
+def get_engine() -> AsyncEngine:
+    """The async engine with its connection pool, created on first call."""
+    global _engine
+    if _engine is None:
+        if not DATABASE_URL:
+            raise RuntimeError("DATABASE_URL is not set")
+        _engine = create_async_engine(
+            DATABASE_URL,
+            echo=DB_ECHO,
+            poolclass=InstrumentedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            connect_args=_connect_args(DATABASE_URL),
+        )
+        register_pool_gauges(_engine)
+        event.listen(_engine.sync_engine, "before_cursor_execute", _start_query_timer)
+        event.listen(_engine.sync_engine, "after_cursor_execute", _stop_query_timer)
+    return _engine
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    """A new session on the engine; used like the sessionmaker it wraps."""
+    global _sessionmaker
+    if _sessionmaker is None:
+        _sessionmaker = async_sessionmaker(
+            get_engine(), expire_on_commit=False, autoflush=False, autocommit=False
+        )
+    return _sessionmaker()
+
+
+async def dispose_engine() -> None:
+    """Closes the pool's connections, if the engine was ever created."""
+    if _engine is not None:
+        await _engine.dispose()
+
 # Base class for models
 Base = declarative_base()
 
@@ -35,3 +106,15 @@ async def get_db():
             raise
         finally:
             await session.close()
+
+
+def insert_ignoring_conflicts(session, model):
+    """
+    INSERT ... ON CONFLICT DO NOTHING for the session's dialect (Postgres, or
+    SQLite for local runs). Conflicting rows are skipped, so with RETURNING
+    only the rows actually inserted come back.
+    """
+    dialect = session.bind.dialect.name
+    if dialect == "sqlite":
+        return sqlite.insert(model).on_conflict_do_nothing()
+    return postgresql.insert(model).on_conflict_do_nothing()
@@ -0,0 +1,208 @@
+"""
+Versioned schema migrations.
+
+The schema is changed by `python main.py migrate`, run once per deploy
+before the new services start; the services themselves only check that
+the database is at the latest version (ensure_schema()), which is one
+cheap query instead of create_all's table-by-table checks on every boot.
+
+Migrations are applied in order in a single transaction, and each version
+is recorded in the schema_migrations table. Applied migrations must never
+change: add a new one to MIGRATIONS instead. Each describes its tables as
+they were at that version, not the current models. The first ones skip
+whatever already exists, so databases created by the old create_all
+startup are adopted as they are.
+"""
+import os
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text,
+    inspect, select, text,
+)
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql import func
+
+from .db_conn import get_engine
+
+SCHEMA_TABLE = "schema_migrations"
+# Lets local runs and tests migrate a throwaway database at startup. With
+# several workers or replicas, run `main.py migrate` as a deploy step instead.
+DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+# Key of the Postgres advisory lock that serializes concurrent migrate runs.
+MIGRATION_LOCK_ID = 72_410_001
+
+
+@dataclass
+class Migration:
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+_metadata = MetaData()
+
+schema_migrations = Table(
+    SCHEMA_TABLE, _metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("description", String(200), nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+)
+
+_users_v1 = Table(
+    "users", _metadata,
+    Column("id", UUID(as_uuid=True), primary_key=True, unique=True, nullable=False),
+    Column("username", String(50), unique=True, nullable=False, index=True),
+    Column("email", String(120), unique=True, nullable=False, index=True),
+    Column("password_hash", String(255), nullable=False),
+    Column("role", String(50), nullable=False),
+    Column("is_active", Boolean, nullable=False),
+    Column("created_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+)
+
+_conversion_jobs_v2 = Table(
+    "conversion_jobs", _metadata,
+    Column("id", UUID(as_uuid=True), primary_key=True, nullable=False),
+    Column("user_id", UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True),
+    Column("status", String(20), nullable=False, index=True),
+    Column("bitrate", String(10), nullable=False),
+    Column("source_path", String(500), nullable=False),
+    Column("output_path", String(500), nullable=True),
+    Column("attempts", Integer, nullable=False),
+    Column("error", Text, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+    Column("updated_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+    Column("finished_at", DateTime(timezone=True), nullable=True),
+)
+
+_refresh_tokens_v5 = Table(
+    "refresh_tokens", _metadata,
+    Column("id", UUID(as_uuid=True), primary_key=True, nullable=False),
+    Column("user_id", UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True),
+    Column("session_id", UUID(as_uuid=True), nullable=False, index=True),
+    Column("token_hash", String(64), unique=True, nullable=False, index=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+    Column("expires_at", DateTime(timezone=True), nullable=False),
+    Column("revoked_at", DateTime(timezone=True), nullable=True),
+)
+
+_revoked_sessions_v5 = Table(
+    "revoked_sessions", _metadata,
+    Column("session_id", UUID(as_uuid=True), primary_key=True, nullable=False),
+    Column("user_id", UUID(as_uuid=True), nullable=False),
+    Column("revoked_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+    Column("expires_at", DateTime(timezone=True), nullable=False, index=True),
+)
+
+_conversion_locks_v6 = Table(
+    "conversion_locks", _metadata,
+    Column("cache_key", String(255), primary_key=True, nullable=False),
+    Column("owner", UUID(as_uuid=True), nullable=False),
+    Column("locked_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+)
+
+
+def _create_users(conn: Connection) -> None:
+    _users_v1.create(conn, checkfirst=True)
+
+
+def _create_conversion_jobs(conn: Connection) -> None:
+    _conversion_jobs_v2.create(conn, checkfirst=True)
+
+
+def _add_source_sha256(conn: Connection) -> None:
+    columns = {column["name"] for column in inspect(conn).get_columns("conversion_jobs")}
+    if "source_sha256" not in columns:
+        conn.execute(text("ALTER TABLE conversion_jobs ADD COLUMN source_sha256 VARCHAR(64)"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_conversion_jobs_source_sha256 ON conversion_jobs (source_sha256)"
+    ))
+
+
+def _add_user_listing_indexes(conn: Connection) -> None:
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_created_at_id ON users (created_at, id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_role_created_at_id ON users (role, created_at, id)"))
+    if conn.dialect.name == "postgresql":
+        # LIKE 'prefix%' can only use a btree index with these operator
+        # classes unless the database collation is C.
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_users_username_pattern ON users (username varchar_pattern_ops)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_users_email_pattern ON users (email varchar_pattern_ops)"
+        ))
+
+
+def _create_refresh_tokens(conn: Connection) -> None:
+    _refresh_tokens_v5.create(conn)
+    _revoked_sessions_v5.create(conn)
+
+
+def _create_conversion_locks(conn: Connection) -> None:
+    _conversion_locks_v6.create(conn)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "users", _create_users),
+    Migration(2, "conversion_jobs", _create_conversion_jobs),
+    Migration(3, "conversion_jobs.source_sha256", _add_source_sha256),
+    Migration(4, "users listing indexes", _add_user_listing_indexes),
+    Migration(5, "refresh_tokens and revoked_sessions", _create_refresh_tokens),
+    Migration(6, "conversion_locks", _create_conversion_locks),
+]
+HEAD = MIGRATIONS[-1].version
+
+
+def _current_version(conn: Connection) -> int:
+    if not inspect(conn).has_table(SCHEMA_TABLE):
+        return 0
+    return conn.execute(select(func.max(schema_migrations.c.version))).scalar() or 0
+
+
+def _upgrade(conn: Connection, target: int) -> List[Migration]:
+    schema_migrations.create(conn, checkfirst=True)
+    current = _current_version(conn)
+    applied = []
+    for migration in MIGRATIONS:
+        if current < migration.version <= target:
+            migration.upgrade(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=migration.version, description=migration.description,
+            ))
+            applied.append(migration)
+    return applied
+
+
+async def current_version() -> int:
+    """Schema version of the database, 0 if it was never migrated."""
+    async with get_engine().connect() as conn:
+        return await conn.run_sync(_current_version)
+
+
+async def migrate(target: Optional[int] = None) -> List[Migration]:
+    """
+    Applies the pending migrations up to target (default: all of them) in
+    one transaction and returns them. Concurrent runs against Postgres wait
+    for each other, so a deploy may start it from every replica.
+    """
+    async with get_engine().begin() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_ID})
+        return await conn.run_sync(_upgrade, HEAD if target is None else target)
+
+
+async def ensure_schema() -> None:
+    """
+    Startup check: raises RuntimeError unless the database is migrated to
+    HEAD. With DB_MIGRATE_ON_STARTUP set it migrates instead.
+    """
+    if DB_MIGRATE_ON_STARTUP:
+        await migrate()
+        return
+    version = await current_version()
+    if version < HEAD:
+        raise RuntimeError(
+            f"database schema is at version {version}, this code needs {HEAD}: run `python main.py migrate`"
+        )
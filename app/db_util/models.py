@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, Boolean, DateTime
+from sqlalchemy import Column, String, Boolean, DateTime, Integer, Text, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from .db_conn import Base
@@ -14,3 +14,62 @@ class User(Base):
     role = Column(String(50), default="user", nullable=False)  # e.g. 'user', 'admin'
     is_active = Column(Boolean, default=True, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    # Keyset pagination of the admin listing, optionally by role. On Postgres
+    # the migrations also add varchar_pattern_ops indexes for prefix search.
+    __table_args__ = (
+        Index("ix_users_created_at_id", "created_at", "id"),
+        Index("ix_users_role_created_at_id", "role", "created_at", "id"),
+    )
+
+
+class ConversionJob(Base):
+    __tablename__ = "conversion_jobs"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
+    status = Column(String(20), default="queued", nullable=False, index=True)  # queued, running, done, failed
+    bitrate = Column(String(10), nullable=False)
+    # Storage keys (see app/storage_util) of the uploaded video and the MP3.
+    source_path = Column(String(500), nullable=False)
+    source_sha256 = Column(String(64), nullable=True, index=True)
+    output_path = Column(String(500), nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
+    # Login session the token belongs to; it is kept across rotations and
+    # carried by the access tokens as the sid claim.
+    session_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    token_hash = Column(String(64), unique=True, nullable=False, index=True)  # sha256 of the token
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)  # set when rotated or revoked
+
+
+class RevokedSession(Base):
+    __tablename__ = "revoked_sessions"
+
+    session_id = Column(UUID(as_uuid=True), primary_key=True, nullable=False)
+    user_id = Column(UUID(as_uuid=True), nullable=False)
+    revoked_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # Once the session's last access token has expired the row is obsolete.
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class ConversionLock(Base):
+    __tablename__ = "conversion_locks"
+
+    # A conversion cache key (see conversion_cache.py) being converted right
+    # now, so other processes wait for the result instead of converting too.
+    cache_key = Column(String(255), primary_key=True, nullable=False)
+    owner = Column(UUID(as_uuid=True), nullable=False)  # random per fetch, for the conditional release
+    locked_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)  # refreshed while held
@@ -0,0 +1,49 @@
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from ..metrics_util.metrics import Counter, Gauge, Histogram
+
+pool_checkout_seconds = Histogram(
+    "db_pool_checkout_seconds",
+    "Time spent waiting for a pooled DB connection, including connect and pre-ping.",
+)
+pool_checkout_timeouts = Counter(
+    "db_pool_checkout_timeouts_total",
+    "Checkouts that gave up after pool_timeout because the pool was exhausted.",
+)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited and how often it timed out."""
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            pool_checkout_timeouts.inc()
+            raise
+        finally:
+            pool_checkout_seconds.observe(time.perf_counter() - start)
+
+
+def register_pool_gauges(engine) -> None:
+    """Exports in-use/idle/overflow connection counts of the engine's current pool."""
+
+    def pool_state():
+        pool = engine.sync_engine.pool
+        return {
+            ("in_use",): pool.checkedout(),
+            ("idle",): pool.checkedin(),
+            ("overflow",): max(0, pool.overflow()),
+            ("size",): pool.size(),
+        }
+
+    Gauge(
+        "db_pool_connections",
+        "Connections of the DB pool by state; in_use near size + max_overflow means starvation.",
+        labelnames=("state",),
+        callback=pool_state,
+    )
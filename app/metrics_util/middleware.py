@@ -0,0 +1,48 @@
+import time
+
+from .metrics import Counter, Histogram
+
+http_requests = Counter(
+    "http_requests_total",
+    "HTTP requests by method, route template and status code.",
+    labelnames=("method", "route", "status"),
+)
+http_request_seconds = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by method and route template, until the response is fully sent.",
+    labelnames=("method", "route"),
+)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording request counts and latency per route.
+    Routes are labelled with their path template (e.g. /auth/me), and
+    unmatched paths share one label so that scanners can't blow up the
+    number of series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_request_seconds.labels(method, route_path).observe(time.perf_counter() - start)
+            http_requests.labels(method, route_path, status_code).inc()
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import smtplib
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from typing import List, Optional
+
+import httpx
+
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 25))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "false").lower() == "true"
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", 10))
+NOTIFY_FROM = os.getenv("NOTIFY_FROM", "Video to MP3 <no-reply@localhost>")
+NOTIFY_WEBHOOK_URL = os.getenv("NOTIFY_WEBHOOK_URL")
+NOTIFY_WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("NOTIFY_WEBHOOK_TIMEOUT_SECONDS", 10))
+# Base URL of the convert service, used for download links in messages.
+CONVERT_PUBLIC_URL = os.getenv("CONVERT_PUBLIC_URL", "http://localhost:5001")
+
+
+@dataclass
+class Notification:
+    """One message to a user, covering every event coalesced for them."""
+    user_id: str
+    email: Optional[str]
+    events: List[dict]
+    attempt: int = 0
+    # Channels that already delivered it, so a retry doesn't repeat them.
+    delivered: set = field(default_factory=set)
+
+
+def render_email(notification: Notification) -> EmailMessage:
+    done = [e for e in notification.events if e["status"] == "done"]
+    failed = [e for e in notification.events if e["status"] != "done"]
+    if len(notification.events) == 1:
+        subject = "Your MP3 is ready" if done else "Your conversion failed"
+    else:
+        subject = f"{len(done)} conversions finished" + (f", {len(failed)} failed" if failed else "")
+    lines = [f"{CONVERT_PUBLIC_URL}/convert/jobs/{e['job_id']}/download" for e in done]
+    lines += [f"Job {e['job_id']} failed: {e.get('error') or 'unknown error'}" for e in failed]
+
+    message = EmailMessage()
+    message["From"] = NOTIFY_FROM
+    message["To"] = notification.email
+    message["Subject"] = subject
+    message.set_content("\n".join(lines) + "\n")
+    return message
+
+
+class SmtpChannel:
+    """
+    Sends emails over a pool of persistent SMTP connections. smtplib is
+    blocking, so each batch runs in a thread on one connection; a batch
+    reuses its connection for every message and the connection goes back to
+    the pool afterwards.
+    """
+
+    name = "email"
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, pool_size: int = 8):
+        self.host = host
+        self.port = port
+        self._idle: List[smtplib.SMTP] = []
+        self._slots = asyncio.Semaphore(pool_size)
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT_SECONDS)
+        if SMTP_STARTTLS:
+            connection.starttls()
+        if SMTP_USERNAME:
+            connection.login(SMTP_USERNAME, SMTP_PASSWORD or "")
+        return connection
+
+    def _send_all(self, connection: Optional[smtplib.SMTP], notifications: List[Notification]):
+        failed = []
+        if connection is not None:
+            # Pooled connections may have been dropped by the server's idle timeout.
+            try:
+                connection.noop()
+            except (smtplib.SMTPException, OSError):
+                connection.close()
+                connection = None
+        for index, notification in enumerate(notifications):
+            try:
+                if connection is None:
+                    connection = self._connect()
+                connection.send_message(render_email(notification))
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, smtplib.SMTPSenderRefused):
+                # The server rejected this message; the connection is fine.
+                failed.append(notification)
+            except (smtplib.SMTPException, OSError):
+                # Connection-level failure: drop it, retry the rest later.
+                if connection is not None:
+                    connection.close()
+                return None, failed + notifications[index:]
+        return connection, failed
+
+    async def send(self, notifications: List[Notification]) -> List[Notification]:
+        """Sends the batch; returns the notifications that failed."""
+        deliverable = [n for n in notifications if n.email]
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else None
+            connection, failed = await asyncio.to_thread(self._send_all, connection, deliverable)
+            if connection is not None:
+                self._idle.append(connection)
+        return failed
+
+    async def close(self) -> None:
+        for connection in self._idle:
+            try:
+                await asyncio.to_thread(connection.quit)
+            except (smtplib.SMTPException, OSError):
+                connection.close()
+        self._idle.clear()
+
+
+class WebhookChannel:
+    """
+    POSTs each batch as one JSON request ({"notifications": [...]}) through
+    a keep-alive connection pool.
+    """
+
+    name = "webhook"
+
+    def __init__(self, url: str = NOTIFY_WEBHOOK_URL, pool_size: int = 8):
+        self.url = url
+        self._client = httpx.AsyncClient(
+            timeout=NOTIFY_WEBHOOK_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def send(self, notifications: List[Notification]) -> List[Notification]:
+        body = {"notifications": [{"user_id": n.user_id, "events": n.events} for n in notifications]}
+        try:
+            response = await self._client.post(self.url, json=body)
+        except httpx.HTTPError:
+            return notifications
+        return notifications if response.status_code >= 300 else []
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+def create_channels(names: List[str], pool_size: int):
+    channels = []
+    for name in names:
+        if name == "email":
+            channels.append(SmtpChannel(pool_size=pool_size))
+        elif name == "webhook":
+            if not NOTIFY_WEBHOOK_URL:
+                raise ValueError("the webhook channel needs NOTIFY_WEBHOOK_URL")
+            channels.append(WebhookChannel(pool_size=pool_size))
+        else:
+            raise ValueError(f"unknown notification channel {name!r}")
+    return channels
@@ -0,0 +1,237 @@
+import asyncio
+import os
+import random
+import time
+import uuid
+from typing import Dict, List, Tuple
+
+from sqlalchemy.future import select
+
+from ....auth_util.cache import TTLCache
+from ....db_util.db_conn import AsyncSessionLocal
+from ....db_util.models import User
+from ....metrics_util.metrics import Counter, Gauge, Histogram
+from .channels import Notification
+
+# Events for the same user that arrive within this window go out as one message.
+NOTIFY_COALESCE_SECONDS = float(os.getenv("NOTIFY_COALESCE_SECONDS", 10))
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", 8))
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", 100))
+NOTIFY_MAX_PENDING = int(os.getenv("NOTIFY_MAX_PENDING", 100_000))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", 5))
+NOTIFY_RETRY_BASE_SECONDS = float(os.getenv("NOTIFY_RETRY_BASE_SECONDS", 1))
+NOTIFY_RETRY_MAX_SECONDS = float(os.getenv("NOTIFY_RETRY_MAX_SECONDS", 60))
+
+events_received = Counter(
+    "notify_events_total",
+    "Conversion events received, by result (accepted, rejected, dropped for an invalid user id).",
+    labelnames=("result",),
+)
+messages_total = Counter(
+    "notify_messages_total",
+    "Notification deliveries by channel and result (sent, retried, dropped).",
+    labelnames=("channel", "result"),
+)
+delivery_seconds = Histogram(
+    "notify_delivery_batch_seconds",
+    "Time to deliver one batch, by channel.",
+    labelnames=("channel",),
+)
+
+
+class DispatcherFull(Exception):
+    """Raised by submit() when NOTIFY_MAX_PENDING events are waiting."""
+
+
+def retry_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter, so retries of a failed batch spread out."""
+    return random.uniform(0, min(NOTIFY_RETRY_MAX_SECONDS, NOTIFY_RETRY_BASE_SECONDS * 2 ** (attempt - 1)))
+
+
+async def lookup_emails(user_ids: List[str]) -> Dict[str, str]:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(User.id, User.email).where(User.id.in_([uuid.UUID(user_id) for user_id in user_ids]))
+        )
+        return {str(user_id): email for user_id, email in result.all()}
+
+
+class NotificationDispatcher:
+    """
+    Coalesces events per user, then delivers the resulting notifications in
+    batches through every channel, with `concurrency` batches in flight.
+
+    Events wait in a per-user buffer until the user's coalescing window
+    (opened by their first event) closes. Due users are flushed together,
+    with their addresses looked up in one query, and the notifications are
+    handed to delivery workers in batches of up to batch_size. A channel
+    that fails a notification gets it back after a jittered backoff; the
+    others aren't repeated.
+    """
+
+    def __init__(
+        self,
+        channels,
+        coalesce_seconds: float = NOTIFY_COALESCE_SECONDS,
+        concurrency: int = NOTIFY_CONCURRENCY,
+        batch_size: int = NOTIFY_BATCH_SIZE,
+        max_pending: int = NOTIFY_MAX_PENDING,
+        resolve_emails=lookup_emails,
+    ):
+        self.channels = channels
+        self.coalesce_seconds = coalesce_seconds
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.resolve_emails = resolve_emails
+        self._emails = TTLCache(maxsize=100_000, ttl=300)
+        # user id -> (flush deadline, events keyed by job id)
+        self._coalescing: Dict[str, Tuple[float, Dict[str, dict]]] = {}
+        self._outbox: asyncio.Queue = asyncio.Queue()
+        self._pending = 0
+        self._retrying = 0
+        self._tasks: List[asyncio.Task] = []
+
+    def pending(self) -> Dict[str, int]:
+        return {"coalescing": len(self._coalescing), "outbox": self._outbox.qsize(), "retrying": self._retrying}
+
+    def submit(self, events: List[dict]) -> None:
+        if self._pending + len(events) > self.max_pending:
+            events_received.labels("rejected").inc(len(events))
+            raise DispatcherFull()
+        deadline = time.monotonic() + self.coalesce_seconds
+        for event in events:
+            _, by_job = self._coalescing.setdefault(event["user_id"], (deadline, {}))
+            if event["job_id"] not in by_job:
+                self._pending += 1
+            # A job reported twice (e.g. a retried POST) is notified once.
+            by_job[event["job_id"]] = event
+        events_received.labels("accepted").inc(len(events))
+
+    def _drop_user(self, user_id: str) -> None:
+        _, by_job = self._coalescing.pop(user_id)
+        events_received.labels("dropped").inc(len(by_job))
+        self._pending -= len(by_job)
+
+    async def _flush_due(self, everything: bool = False) -> None:
+        now = time.monotonic()
+        due = [user_id for user_id, (deadline, _) in self._coalescing.items() if everything or deadline <= now]
+        if not due:
+            return
+        for user_id in due:
+            try:
+                uuid.UUID(user_id)
+            except (TypeError, ValueError):
+                # Can never be resolved; don't let it hold up everyone else.
+                print(f"dropping notifications for invalid user id {user_id!r}")
+                self._drop_user(user_id)
+        due = [user_id for user_id in due if user_id in self._coalescing]
+        missing = [user_id for user_id in due if self._emails.get(user_id) is None]
+        unresolved = set()
+        for start in range(0, len(missing), self.batch_size):
+            chunk = missing[start:start + self.batch_size]
+            try:
+                emails = await self.resolve_emails(chunk)
+            except Exception as e:
+                # These users stay buffered and are tried again next tick.
+                print(f"notification address lookup failed: {e}")
+                unresolved.update(chunk)
+                continue
+            for user_id, email in emails.items():
+                self._emails.set(user_id, email)
+        for user_id in due:
+            if user_id in unresolved:
+                continue
+            _, by_job = self._coalescing.pop(user_id)
+            await self._outbox.put(Notification(user_id, self._emails.get(user_id), list(by_job.values())))
+
+    async def _flush_loop(self) -> None:
+        tick = min(0.5, max(0.01, self.coalesce_seconds / 4))
+        while True:
+            await asyncio.sleep(tick)
+            try:
+                await self._flush_due()
+            except Exception as e:
+                # The events stay buffered and are tried again next tick.
+                print(f"notification flush failed: {e}")
+
+    async def _next_batch(self) -> List[Notification]:
+        batch = [await self._outbox.get()]
+        while len(batch) < self.batch_size and not self._outbox.empty():
+            batch.append(self._outbox.get_nowait())
+        return batch
+
+    async def _deliver(self, batch: List[Notification]) -> None:
+        loop = asyncio.get_running_loop()
+        for channel in self.channels:
+            todo = [n for n in batch if channel.name not in n.delivered]
+            if not todo:
+                continue
+            start = loop.time()
+            failed = await channel.send(todo)
+            delivery_seconds.labels(channel.name).observe(loop.time() - start)
+            failed_ids = {id(n) for n in failed}
+            for notification in todo:
+                if id(notification) not in failed_ids:
+                    notification.delivered.add(channel.name)
+            messages_total.labels(channel.name, "sent").inc(len(todo) - len(failed))
+
+        for notification in batch:
+            undelivered = [c.name for c in self.channels if c.name not in notification.delivered]
+            if not undelivered:
+                self._pending -= len(notification.events)
+                continue
+            notification.attempt += 1
+            if notification.attempt >= NOTIFY_MAX_ATTEMPTS:
+                for name in undelivered:
+                    messages_total.labels(name, "dropped").inc()
+                self._pending -= len(notification.events)
+                continue
+            for name in undelivered:
+                messages_total.labels(name, "retried").inc()
+            self._retrying += 1
+            loop.create_task(self._retry_later(notification))
+
+    async def _retry_later(self, notification: Notification) -> None:
+        await asyncio.sleep(retry_delay(notification.attempt))
+        self._retrying -= 1
+        await self._outbox.put(notification)
+
+    async def _worker(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._deliver(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"notification delivery failed: {e}")
+                self._pending -= sum(len(n.events) for n in batch)
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._flush_loop())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def drain(self, timeout: float) -> None:
+        """Flushes every buffered event and waits for delivery, up to timeout."""
+        await self._flush_due(everything=True)
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for channel in self.channels:
+            await channel.close()
+
+
+def register_dispatcher_gauges(dispatcher: NotificationDispatcher) -> None:
+    Gauge(
+        "notify_pending",
+        "Notifications waiting, by stage (coalescing users, outbox, retry backoff).",
+        labelnames=("stage",),
+        callback=lambda: {(stage,): count for stage, count in dispatcher.pending().items()},
+    )
@@ -0,0 +1,51 @@
+import hmac
+import os
+import uuid
+from dataclasses import asdict, dataclass
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+
+from .channels import create_channels
+from .dispatcher import NOTIFY_CONCURRENCY, DispatcherFull, NotificationDispatcher, register_dispatcher_gauges
+
+NOTIFY_CHANNELS = [c.strip() for c in os.getenv("NOTIFY_CHANNELS", "email").split(",") if c.strip()]
+# Shared secret the convert service sends as X-Api-Key. Unset disables the
+# check, for local runs only.
+NOTIFY_API_KEY = os.getenv("NOTIFY_API_KEY")
+NOTIFY_RETRY_AFTER_SECONDS = 5
+
+dispatcher = NotificationDispatcher(create_channels(NOTIFY_CHANNELS, pool_size=NOTIFY_CONCURRENCY))
+register_dispatcher_gauges(dispatcher)
+
+router = APIRouter()
+
+
+@dataclass
+class ConversionEvent:
+    job_id: str
+    user_id: uuid.UUID
+    status: str  # done or failed
+    error: Optional[str] = None
+
+
+async def check_api_key(x_api_key: Optional[str] = Header(default=None)) -> None:
+    if NOTIFY_API_KEY and not hmac.compare_digest(x_api_key or "", NOTIFY_API_KEY):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key")
+
+
+@router.post("/events", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(check_api_key)])
+async def receive_events(events: List[ConversionEvent]):
+    """
+    Accepts a batch of "conversion finished" events. Delivery happens in the
+    background; events for the same user are coalesced into one message.
+    """
+    try:
+        dispatcher.submit([{**asdict(event), "user_id": str(event.user_id)} for event in events])
+    except DispatcherFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many undelivered notifications, try again later",
+            headers={"Retry-After": str(NOTIFY_RETRY_AFTER_SECONDS)},
+        )
+    return {"accepted": len(events)}
@@ -0,0 +1,6 @@
+from fastapi import APIRouter
+from . import events
+
+router = APIRouter(prefix="/notify", tags=["notify"],)
+
+router.include_router(events.router)
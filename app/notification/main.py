@@ -0,0 +1,31 @@
+from fastapi import FastAPI
+
+from .api.notify import router as notify_router
+from .api.notify.events import dispatcher
+from ..metrics_util import router as metrics_router
+from ..metrics_util.middleware import MetricsMiddleware
+
+# How long shutdown waits for buffered notifications to go out.
+SHUTDOWN_DRAIN_SECONDS = 10
+
+
+app = FastAPI(title="Notification service")
+app.add_middleware(MetricsMiddleware)
+
+app.include_router(notify_router.router)
+app.include_router(metrics_router.router)
+
+@app.get("/")
+async def root():
+    return {"message": "Hello from our notification service"}
+
+
+@app.on_event("startup")
+async def startup():
+    dispatcher.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await dispatcher.drain(SHUTDOWN_DRAIN_SECONDS)
+    await dispatcher.stop()
@@ -0,0 +1,140 @@
+"""
+Local stand-ins for an SMTP relay and a webhook receiver, so the
+notification service can be run and benchmarked offline. They accept and
+count messages; with --fail-rate they reject that share of them (SMTP 451,
+HTTP 503) to exercise retries.
+
+Usage: python -m app.notification.stand_in --smtp-port 2525 --http-port 8025
+then run the service with SMTP_HOST=localhost SMTP_PORT=2525
+NOTIFY_CHANNELS=email,webhook NOTIFY_WEBHOOK_URL=http://localhost:8025/hook
+"""
+import argparse
+import asyncio
+import json
+import random
+from typing import Optional
+
+
+class SmtpSink:
+    """Speaks just enough SMTP for smtplib: EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT."""
+
+    def __init__(self, fail_rate: float = 0.0):
+        self.fail_rate = fail_rate
+        self.messages = 0
+        self.rejected = 0
+        self.connections = 0
+        self.recipients = set()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        writer.write(b"220 stand-in ESMTP\r\n")
+        recipients = []
+        try:
+            while line := await reader.readline():
+                command = line.decode(errors="replace").strip()
+                verb = command[:4].upper()
+                if verb in ("EHLO", "HELO"):
+                    writer.write(b"250-stand-in\r\n250 8BITMIME\r\n" if verb == "EHLO" else b"250 stand-in\r\n")
+                elif verb == "MAIL":
+                    recipients = []
+                    writer.write(b"250 OK\r\n")
+                elif verb == "RCPT":
+                    recipients.append(command.partition(":")[2].strip(" <>"))
+                    writer.write(b"250 OK\r\n")
+                elif verb == "DATA":
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    await writer.drain()
+                    while (await reader.readline()) not in (b".\r\n", b".\n", b""):
+                        pass
+                    if random.random() < self.fail_rate:
+                        self.rejected += 1
+                        writer.write(b"451 Try again later\r\n")
+                    else:
+                        self.messages += 1
+                        self.recipients.update(recipients)
+                        writer.write(b"250 OK\r\n")
+                elif verb in ("RSET", "NOOP"):
+                    writer.write(b"250 OK\r\n")
+                elif verb == "QUIT":
+                    writer.write(b"221 Bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b"502 Command not implemented\r\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+class WebhookSink:
+    """Minimal HTTP/1.1 server with keep-alive that counts the notifications POSTed to it."""
+
+    def __init__(self, fail_rate: float = 0.0):
+        self.fail_rate = fail_rate
+        self.requests = 0
+        self.notifications = 0
+        self.rejected = 0
+        self.connections = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while request_line := await reader.readline():
+                length = 0
+                while (header := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = header.decode(errors="replace").partition(":")
+                    if name.strip().lower() == "content-length":
+                        length = int(value.strip())
+                body = await reader.readexactly(length) if length else b""
+                self.requests += 1
+                if random.random() < self.fail_rate:
+                    self.rejected += 1
+                    writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n")
+                else:
+                    try:
+                        self.notifications += len(json.loads(body).get("notifications", []))
+                    except ValueError:
+                        pass
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def start_stand_ins(smtp_port: Optional[int], http_port: Optional[int], fail_rate: float = 0.0,
+                          host: str = "127.0.0.1"):
+    """Starts the sinks on the running loop; returns (smtp sink, webhook sink, servers)."""
+    smtp, webhook, servers = SmtpSink(fail_rate), WebhookSink(fail_rate), []
+    if smtp_port is not None:
+        servers.append(await asyncio.start_server(smtp.handle, host, smtp_port))
+    if http_port is not None:
+        servers.append(await asyncio.start_server(webhook.handle, host, http_port))
+    return smtp, webhook, servers
+
+
+async def main(args) -> None:
+    smtp, webhook, servers = await start_stand_ins(args.smtp_port, args.http_port, args.fail_rate, args.host)
+    print(f"SMTP stand-in on {args.host}:{args.smtp_port}, webhook stand-in on {args.host}:{args.http_port}")
+    while True:
+        await asyncio.sleep(5)
+        print(
+            f"emails={smtp.messages} (rejected {smtp.rejected}, connections {smtp.connections}) "
+            f"webhook notifications={webhook.notifications} in {webhook.requests} requests "
+            f"(rejected {webhook.rejected}, connections {webhook.connections})"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline SMTP and webhook stand-ins for the notification service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--smtp-port", type=int, default=2525)
+    parser.add_argument("--http-port", type=int, default=8025)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,150 @@
+import asyncio
+import contextlib
+import hashlib
+import os
+import shutil
+import uuid
+from typing import AsyncIterable, AsyncIterator, List, Optional
+
+from .storage import CHUNK_SIZE, ObjectInfo, ObjectNotFound, check_key
+
+
+def link_or_copy(source: str, dest: str) -> None:
+    """Hard-links source to dest (no extra disk space), copying across filesystems."""
+    tmp = temp_path(dest)
+    try:
+        os.link(source, tmp)
+    except OSError as e:
+        if isinstance(e, FileNotFoundError):
+            raise
+        shutil.copyfile(source, tmp)
+    os.replace(tmp, dest)
+
+
+def temp_path(path: str) -> str:
+    # Dot-prefixed names are never valid keys, so they can't collide with objects.
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{uuid.uuid4().hex}.tmp")
+
+
+class LocalStorage:
+    """
+    Objects as files under root. The last key segment's first four
+    characters shard it into two levels of subdirectories
+    ("outputs/3fa85f64.mp3" -> root/outputs/3f/a8/3fa85f64.mp3), which keeps
+    directories small when keys are hashes or UUIDs. Writes go to a
+    temporary file in the same directory that is renamed into place, so
+    readers only ever see complete objects.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        directory, _, name = check_key(key).rpartition("/")
+        shard = name[:4].ljust(4, "_")
+        return os.path.join(self.root, *filter(None, directory.split("/")), shard[:2], shard[2:], name)
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self._path(key)
+
+    @contextlib.asynccontextmanager
+    async def local_file(self, key: str):
+        path = self._path(key)
+        if not os.path.isfile(path):
+            raise ObjectNotFound(key)
+        yield path
+
+    def _info(self, key: str, path: str, sha256: Optional[str] = None) -> ObjectInfo:
+        stat = os.stat(path)
+        return ObjectInfo(key, stat.st_size, stat.st_mtime, sha256)
+
+    async def write(self, key: str, chunks: AsyncIterable[bytes]) -> ObjectInfo:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = temp_path(path)
+        digest = hashlib.sha256()
+        try:
+            with open(tmp, "wb") as f:
+                async for chunk in chunks:
+                    f.write(chunk)
+                    digest.update(chunk)
+                await asyncio.to_thread(os.fsync, f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp)
+            raise
+        return self._info(key, path, digest.hexdigest())
+
+    async def put_file(self, key: str, source: str) -> ObjectInfo:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        await asyncio.to_thread(link_or_copy, source, path)
+        return self._info(key, path)
+
+    async def read(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        try:
+            f = open(self._path(key), "rb")
+        except FileNotFoundError:
+            raise ObjectNotFound(key)
+        with f:
+            f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                chunk = await asyncio.to_thread(f.read, CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    async def stat(self, key: str) -> Optional[ObjectInfo]:
+        try:
+            return self._info(key, self._path(key))
+        except FileNotFoundError:
+            return None
+
+    async def copy(self, source: str, dest: str) -> bool:
+        """Hard-links where possible, so copies share the data on disk."""
+        if not os.path.isfile(self._path(source)):
+            return False
+        path = self._path(dest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            await asyncio.to_thread(link_or_copy, self._path(source), path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    async def touch(self, key: str) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(self._path(key))
+
+    async def delete(self, key: str) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._path(key))
+
+    def _list(self, prefix: str) -> List[ObjectInfo]:
+        top = os.path.join(self.root, *check_key(prefix.rstrip("/")).split("/"))
+        found = []
+        for directory, dirs, files in os.walk(top):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            # Strip the two shard levels back off to recover the key.
+            key_dir = os.path.relpath(directory, self.root).replace(os.sep, "/").split("/")[:-2]
+            for name in files:
+                if name.startswith("."):
+                    continue
+                key = "/".join(key_dir + [name])
+                try:
+                    found.append(self._info(key, os.path.join(directory, name)))
+                except FileNotFoundError:
+                    pass
+        return found
+
+    async def list(self, prefix: str) -> List[ObjectInfo]:
+        """Objects under the "directory" prefix (e.g. "cache/")."""
+        return await asyncio.to_thread(self._list, prefix)
+
+    async def close(self) -> None:
+        pass
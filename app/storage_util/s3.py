@@ -0,0 +1,283 @@
+import asyncio
+import contextlib
+import datetime
+import hashlib
+import hmac
+import os
+import time
+import uuid
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterable, AsyncIterator, Dict, List, Optional
+from urllib.parse import quote, urlsplit
+from xml.etree import ElementTree
+
+import httpx
+
+from .storage import CHUNK_SIZE, ObjectInfo, ObjectNotFound, StorageError, check_key
+
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+# Any S3-compatible service (MinIO, Ceph, R2, the local stand-in); AWS by default.
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", f"https://s3.{S3_REGION}.amazonaws.com")
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID")
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY")
+# Writes are uploaded in parts of this size (at least 5 MiB), which is also
+# the most a write holds in memory.
+S3_PART_SIZE = max(5 * 1024 ** 2, int(os.getenv("S3_PART_SIZE", 8 * 1024 ** 2)))
+S3_TIMEOUT_SECONDS = float(os.getenv("S3_TIMEOUT_SECONDS", 30))
+S3_MAX_CONNECTIONS = int(os.getenv("S3_MAX_CONNECTIONS", 32))
+
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+
+def canonical_query(query: Dict[str, str]) -> str:
+    return "&".join(f"{quote(k, safe='-_.~')}={quote(str(v), safe='-_.~')}" for k, v in sorted(query.items()))
+
+
+def sign_v4(
+    method: str,
+    path: str,
+    query: Dict[str, str],
+    headers: Dict[str, str],
+    payload_sha256: str,
+    access_key: str,
+    secret_key: str,
+    region: str,
+    service: str = "s3",
+) -> str:
+    """
+    Authorization header of an AWS Signature Version 4 request. path must be
+    URI-encoded already; headers (all of which are signed) must include host
+    and x-amz-date.
+    """
+    amz_date = headers.get("x-amz-date") or headers["X-Amz-Date"]
+    lowered = {name.lower(): " ".join(str(value).split()) for name, value in headers.items()}
+    signed_headers = ";".join(sorted(lowered))
+    canonical_request = "\n".join([
+        method,
+        path,
+        canonical_query(query),
+        "".join(f"{name}:{lowered[name]}\n" for name in sorted(lowered)),
+        signed_headers,
+        payload_sha256,
+    ])
+    scope = f"{amz_date[:8]}/{region}/{service}/aws4_request"
+    string_to_sign = "\n".join(
+        ["AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest()]
+    )
+    key = f"AWS4{secret_key}".encode()
+    for part in (amz_date[:8], region, service, "aws4_request"):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    return f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, SignedHeaders={signed_headers}, Signature={signature}"
+
+
+def xml_text(element: ElementTree.Element, tag: str) -> Optional[str]:
+    """Text of the first descendant named tag, whatever its XML namespace."""
+    for child in element.iter():
+        if child.tag == tag or child.tag.endswith("}" + tag):
+            return child.text
+    return None
+
+
+async def file_chunks(path: str) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := await asyncio.to_thread(f.read, CHUNK_SIZE):
+            yield chunk
+
+
+class S3Storage:
+    """
+    Objects in an S3 bucket, addressed path-style so any S3-compatible
+    endpoint works. Requests are signed with SigV4 and sent over a
+    keep-alive httpx pool. Writes are streamed as multipart uploads of
+    part_size parts (a single PUT when smaller), reads stream the response
+    body, and copies happen server-side.
+    """
+
+    def __init__(
+        self,
+        bucket: Optional[str] = S3_BUCKET,
+        endpoint: str = S3_ENDPOINT_URL,
+        region: str = S3_REGION,
+        access_key: Optional[str] = S3_ACCESS_KEY_ID,
+        secret_key: Optional[str] = S3_SECRET_ACCESS_KEY,
+        part_size: int = S3_PART_SIZE,
+        scratch_dir: Optional[str] = None,
+    ):
+        if not (bucket and access_key and secret_key):
+            raise RuntimeError("STORAGE_BACKEND=s3 needs S3_BUCKET, S3_ACCESS_KEY_ID and S3_SECRET_ACCESS_KEY")
+        self.bucket = bucket
+        self.endpoint = endpoint.rstrip("/")
+        self.region = region
+        self.part_size = part_size
+        self.scratch_dir = scratch_dir or os.path.join(os.getenv("TMPDIR", "/tmp"), "s3-scratch")
+        self._host = urlsplit(self.endpoint).netloc
+        self._access_key = access_key
+        self._secret_key = secret_key
+        self._client = httpx.AsyncClient(
+            timeout=S3_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=S3_MAX_CONNECTIONS, max_keepalive_connections=S3_MAX_CONNECTIONS),
+        )
+
+    async def _request(
+        self,
+        method: str,
+        key: str = "",
+        query: Optional[Dict[str, str]] = None,
+        body: bytes = b"",
+        headers: Optional[Dict[str, str]] = None,
+        stream: bool = False,
+        missing_ok: bool = False,
+    ) -> httpx.Response:
+        path = quote(f"/{self.bucket}/{check_key(key)}" if key else f"/{self.bucket}", safe="/-_.~")
+        query = query or {}
+        payload_sha256 = hashlib.sha256(body).hexdigest() if body else EMPTY_SHA256
+        headers = {
+            **(headers or {}),
+            "host": self._host,
+            "x-amz-date": time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()),
+            "x-amz-content-sha256": payload_sha256,
+        }
+        headers["authorization"] = sign_v4(
+            method, path, query, headers, payload_sha256, self._access_key, self._secret_key, self.region
+        )
+        url = self.endpoint + path + (f"?{canonical_query(query)}" if query else "")
+        try:
+            response = await self._client.send(
+                self._client.build_request(method, url, content=body, headers=headers), stream=stream
+            )
+            if response.status_code < 300 or (missing_ok and response.status_code == 404):
+                return response
+            if stream:
+                await response.aread()
+                await response.aclose()
+        except httpx.HTTPError as e:
+            raise StorageError(f"{method} {key or self.bucket}: {e}") from e
+        if response.status_code == 404:
+            raise ObjectNotFound(key)
+        raise StorageError(f"{method} {key or self.bucket}: HTTP {response.status_code} {response.text[:200]}")
+
+    def local_path(self, key: str) -> Optional[str]:
+        return None
+
+    @contextlib.asynccontextmanager
+    async def local_file(self, key: str):
+        """Downloads the object to the scratch directory for the duration of the block."""
+        os.makedirs(self.scratch_dir, exist_ok=True)
+        path = os.path.join(self.scratch_dir, f"{uuid.uuid4().hex}-{key.rpartition('/')[2]}")
+        try:
+            with open(path, "wb") as f:
+                async for chunk in self.read(key):
+                    f.write(chunk)
+            yield path
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+
+    async def _upload_part(self, key: str, upload_id: str, number: int, data: bytes) -> str:
+        response = await self._request("PUT", key, {"partNumber": str(number), "uploadId": upload_id}, data)
+        return response.headers["etag"]
+
+    async def write(self, key: str, chunks: AsyncIterable[bytes]) -> ObjectInfo:
+        digest = hashlib.sha256()
+        buffer = bytearray()
+        size = 0
+        upload_id = None
+        etags: List[str] = []
+        try:
+            async for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                buffer += chunk
+                while len(buffer) >= self.part_size:
+                    if upload_id is None:
+                        response = await self._request("POST", key, {"uploads": ""})
+                        upload_id = xml_text(ElementTree.fromstring(response.content), "UploadId")
+                    etags.append(await self._upload_part(key, upload_id, len(etags) + 1, bytes(buffer[:self.part_size])))
+                    del buffer[:self.part_size]
+            if upload_id is None:
+                await self._request("PUT", key, body=bytes(buffer))
+            else:
+                if buffer:
+                    etags.append(await self._upload_part(key, upload_id, len(etags) + 1, bytes(buffer)))
+                parts = "".join(
+                    f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+                    for number, etag in enumerate(etags, 1)
+                )
+                response = await self._request(
+                    "POST", key, {"uploadId": upload_id},
+                    f"<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>".encode(),
+                )
+                # S3 may report a failed completion in a 200 response.
+                if b"<Error>" in response.content:
+                    raise StorageError(f"completing upload of {key} failed: {response.text[:200]}")
+        except BaseException:
+            if upload_id is not None:
+                with contextlib.suppress(StorageError):
+                    await self._request("DELETE", key, {"uploadId": upload_id})
+            raise
+        return ObjectInfo(key, size, time.time(), digest.hexdigest())
+
+    async def put_file(self, key: str, source: str) -> ObjectInfo:
+        return await self.write(key, file_chunks(source))
+
+    async def read(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        if end is not None and end <= start:
+            return
+        headers = {"range": f"bytes={start}-{'' if end is None else end - 1}"} if start or end is not None else None
+        response = await self._request("GET", key, headers=headers, stream=True)
+        try:
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                yield chunk
+        except httpx.HTTPError as e:
+            raise StorageError(f"GET {key}: {e}") from e
+        finally:
+            await response.aclose()
+
+    async def stat(self, key: str) -> Optional[ObjectInfo]:
+        response = await self._request("HEAD", key, missing_ok=True)
+        if response.status_code == 404:
+            return None
+        modified = parsedate_to_datetime(response.headers["last-modified"]).timestamp()
+        return ObjectInfo(key, int(response.headers["content-length"]), modified)
+
+    async def copy(self, source: str, dest: str) -> bool:
+        """Server-side copy (up to 5 GiB, S3's limit for a single copy)."""
+        response = await self._request(
+            "PUT", dest, headers={"x-amz-copy-source": quote(f"/{self.bucket}/{check_key(source)}", safe="/-_.~")},
+            missing_ok=True,
+        )
+        if response.status_code == 404:
+            return False
+        if b"<Error>" in response.content:
+            raise StorageError(f"copying {source} to {dest} failed: {response.text[:200]}")
+        return True
+
+    async def touch(self, key: str) -> None:
+        """Copies the object onto itself, which is how S3 updates Last-Modified."""
+        source = quote(f"/{self.bucket}/{check_key(key)}", safe="/-_.~")
+        await self._request(
+            "PUT", key, headers={"x-amz-copy-source": source, "x-amz-metadata-directive": "REPLACE"}, missing_ok=True
+        )
+
+    async def delete(self, key: str) -> None:
+        await self._request("DELETE", key, missing_ok=True)
+
+    async def list(self, prefix: str) -> List[ObjectInfo]:
+        query = {"list-type": "2", "prefix": check_key(prefix.rstrip("/")) + "/"}
+        found = []
+        while True:
+            root = ElementTree.fromstring((await self._request("GET", query=query)).content)
+            for element in root.iter():
+                if not element.tag.endswith("Contents"):
+                    continue
+                modified = datetime.datetime.fromisoformat(xml_text(element, "LastModified")).timestamp()
+                found.append(ObjectInfo(xml_text(element, "Key"), int(xml_text(element, "Size")), modified))
+            token = xml_text(root, "NextContinuationToken")
+            if xml_text(root, "IsTruncated") != "true" or not token:
+                return found
+            query["continuation-token"] = token
+
+    async def close(self) -> None:
+        await self._client.aclose()
@@ -0,0 +1,222 @@
+"""
+Local stand-in for an S3-compatible object store, so the s3 storage backend
+can be run and tested offline. It implements the calls S3Storage makes
+(PUT/GET with Range/HEAD/DELETE object, server-side copy, multipart upload,
+ListObjectsV2) for any bucket name, keeping objects as files under --root.
+Requests must carry a SigV4 Authorization header, but signatures aren't
+verified.
+
+Usage: python -m app.storage_util.s3_stand_in --port 9000 --root /tmp/s3
+then run a service with STORAGE_BACKEND=s3 S3_ENDPOINT_URL=http://localhost:9000
+S3_BUCKET=media S3_ACCESS_KEY_ID=test S3_SECRET_ACCESS_KEY=test
+"""
+import argparse
+import asyncio
+import datetime
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+from email.utils import formatdate
+from typing import Optional
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+CHUNK_SIZE = 1024 * 1024
+LIST_PAGE_SIZE = 1000
+
+
+class S3StandIn:
+    def __init__(self, root: str):
+        self.root = root
+        self.requests = 0
+        self.connections = 0
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "uploads"), exist_ok=True)
+
+    def _object_path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, "objects", quote(f"{bucket}/{key}", safe=""))
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while request_line := await reader.readline():
+                method, target, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode(errors="replace").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                self.requests += 1
+                await self._dispatch(method, target, headers, reader, writer)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def _respond(self, writer, status: str, body: bytes = b"", headers: Optional[dict] = None, length=None) -> None:
+        lines = [f"HTTP/1.1 {status}", f"Content-Length: {len(body) if length is None else length}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+
+    async def _receive(self, reader, headers: dict, path: str) -> str:
+        """Streams the request body to path; returns its MD5 hex (S3's ETag)."""
+        remaining = int(headers.get("content-length", 0))
+        digest = hashlib.md5()
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            while remaining:
+                chunk = await reader.readexactly(min(CHUNK_SIZE, remaining))
+                f.write(chunk)
+                digest.update(chunk)
+                remaining -= len(chunk)
+        os.replace(tmp, path)
+        return digest.hexdigest()
+
+    async def _dispatch(self, method, target, headers, reader, writer) -> None:
+        url = urlsplit(target)
+        query = {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        bucket, _, key = unquote(url.path).lstrip("/").partition("/")
+        if not headers.get("authorization", "").startswith("AWS4-HMAC-SHA256 "):
+            await reader.readexactly(int(headers.get("content-length", 0)))
+            self._respond(writer, "403 Forbidden", b"<Error><Code>AccessDenied</Code></Error>")
+            return
+
+        if not key:
+            if method == "GET":
+                self._list(writer, bucket, query)
+            else:
+                self._respond(writer, "405 Method Not Allowed")
+            return
+
+        path = self._object_path(bucket, key)
+        upload_dir = os.path.join(self.root, "uploads", query.get("uploadId", "-"))
+        if method == "POST" and "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            os.makedirs(os.path.join(self.root, "uploads", upload_id))
+            self._respond(writer, "200 OK", f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId>"
+                                            f"</InitiateMultipartUploadResult>".encode())
+        elif method == "PUT" and "uploadId" in query:
+            if not os.path.isdir(upload_dir):
+                await reader.readexactly(int(headers.get("content-length", 0)))
+                self._respond(writer, "404 Not Found", b"<Error><Code>NoSuchUpload</Code></Error>")
+                return
+            etag = await self._receive(reader, headers, os.path.join(upload_dir, f"{int(query['partNumber']):05d}"))
+            self._respond(writer, "200 OK", headers={"ETag": f'"{etag}"'})
+        elif method == "POST" and "uploadId" in query:
+            await reader.readexactly(int(headers.get("content-length", 0)))
+            tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "wb") as out:
+                for part in sorted(os.listdir(upload_dir)):
+                    with open(os.path.join(upload_dir, part), "rb") as f:
+                        shutil.copyfileobj(f, out, CHUNK_SIZE)
+            os.replace(tmp, path)
+            shutil.rmtree(upload_dir)
+            self._respond(writer, "200 OK", b"<CompleteMultipartUploadResult></CompleteMultipartUploadResult>")
+        elif method == "DELETE" and "uploadId" in query:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            self._respond(writer, "204 No Content")
+        elif method == "PUT" and "x-amz-copy-source" in headers:
+            source_bucket, _, source_key = unquote(headers["x-amz-copy-source"]).lstrip("/").partition("/")
+            source_path = self._object_path(source_bucket, source_key)
+            try:
+                if source_path == path:
+                    os.utime(path)
+                else:
+                    shutil.copyfile(source_path, path)
+            except FileNotFoundError:
+                self._respond(writer, "404 Not Found", b"<Error><Code>NoSuchKey</Code></Error>")
+                return
+            self._respond(writer, "200 OK", b"<CopyObjectResult></CopyObjectResult>")
+        elif method == "PUT":
+            etag = await self._receive(reader, headers, path)
+            self._respond(writer, "200 OK", headers={"ETag": f'"{etag}"'})
+        elif method == "DELETE":
+            if os.path.exists(path):
+                os.remove(path)
+            self._respond(writer, "204 No Content")
+        elif method in ("GET", "HEAD"):
+            await self._get(writer, path, headers, head=method == "HEAD")
+        else:
+            self._respond(writer, "405 Method Not Allowed")
+
+    async def _get(self, writer, path: str, headers: dict, head: bool) -> None:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._respond(writer, "404 Not Found", b"" if head else b"<Error><Code>NoSuchKey</Code></Error>")
+            return
+        start, end, status = 0, stat.st_size, "200 OK"
+        extra = {"Last-Modified": formatdate(stat.st_mtime, usegmt=True), "Accept-Ranges": "bytes"}
+        spec = headers.get("range", "").removeprefix("bytes=")
+        if spec:
+            first, _, last = spec.partition("-")
+            if first:
+                start, end = int(first), min(stat.st_size, int(last) + 1 if last else stat.st_size)
+            else:
+                start = max(0, stat.st_size - int(last))
+            if start >= end:
+                self._respond(writer, "416 Range Not Satisfiable", headers={"Content-Range": f"bytes */{stat.st_size}"})
+                return
+            status = "206 Partial Content"
+            extra["Content-Range"] = f"bytes {start}-{end - 1}/{stat.st_size}"
+        self._respond(writer, status, headers=extra, length=end - start)
+        if head:
+            return
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                writer.write(chunk)
+                remaining -= len(chunk)
+                await writer.drain()
+
+    def _list(self, writer, bucket: str, query: dict) -> None:
+        prefix = f"{bucket}/{query.get('prefix', '')}"
+        after = query.get("continuation-token", "")
+        keys = sorted(
+            unquote(name) for name in os.listdir(os.path.join(self.root, "objects"))
+            if not name.endswith(".tmp") and unquote(name).startswith(prefix) and unquote(name) > f"{bucket}/{after}"
+        )
+        page, truncated = keys[:LIST_PAGE_SIZE], len(keys) > LIST_PAGE_SIZE
+        contents = []
+        for name in page:
+            stat = os.stat(os.path.join(self.root, "objects", quote(name, safe="")))
+            modified = datetime.datetime.fromtimestamp(stat.st_mtime, datetime.timezone.utc)
+            contents.append(
+                f"<Contents><Key>{escape(name.partition('/')[2])}</Key><Size>{stat.st_size}</Size>"
+                f"<LastModified>{modified.isoformat(timespec='milliseconds').replace('+00:00', 'Z')}</LastModified></Contents>"
+            )
+        token = f"<NextContinuationToken>{escape(page[-1].partition('/')[2])}</NextContinuationToken>" if truncated else ""
+        body = (
+            '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+            f"<IsTruncated>{'true' if truncated else 'false'}</IsTruncated>{token}{''.join(contents)}</ListBucketResult>"
+        )
+        self._respond(writer, "200 OK", body.encode(), {"Content-Type": "application/xml"})
+
+
+async def start_stand_in(port: int, root: Optional[str] = None, host: str = "127.0.0.1"):
+    """Starts the stand-in on the running loop; returns (stand-in, server)."""
+    stand_in = S3StandIn(root or tempfile.mkdtemp(prefix="s3-stand-in-"))
+    server = await asyncio.start_server(stand_in.handle, host, port)
+    return stand_in, server
+
+
+async def main(args) -> None:
+    stand_in, server = await start_stand_in(args.port, args.root, args.host)
+    print(f"S3 stand-in on {args.host}:{args.port}, objects under {stand_in.root}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline S3-compatible stand-in for the s3 storage backend.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--root", help="Directory for the objects (a temporary one by default).")
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,78 @@
+"""
+Object storage for service data (uploaded videos, converted MP3s).
+
+Objects are addressed by "/"-separated keys such as "outputs/<job id>.mp3".
+Every backend provides the same async interface, and object data is only
+ever handled in chunks:
+
+    await write(key, chunks)        store an async iterable of bytes atomically
+    await put_file(key, path)       store a local file
+    read(key, start=0, end=None)    async iterator over bytes [start, end)
+    await stat(key)                 ObjectInfo, or None if there is no such object
+    await copy(source, dest)        False if source doesn't exist
+    await touch(key)                mark as just used (its modified time); no error if it doesn't exist
+    await delete(key)               no error if it doesn't exist
+    await list(prefix)              ObjectInfo of every object under prefix
+    local_path(key)                 filesystem path of the object, if it has one
+    local_file(key)                 async context manager yielding a local path
+    await close()
+
+Backends: "local" (sharded directories, LocalStorage) and "s3" (any
+S3-compatible service, S3Storage).
+"""
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")  # local or s3
+# Root directory of the local backend; services pick a default of their own.
+STORAGE_ROOT = os.getenv("STORAGE_ROOT")
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class StorageError(Exception):
+    """Raised when the storage backend fails."""
+
+
+class ObjectNotFound(StorageError):
+    """Raised when reading an object that doesn't exist."""
+
+
+@dataclass
+class ObjectInfo:
+    key: str
+    size: int
+    modified: float  # Unix time
+    # Only known when the data went through write().
+    sha256: Optional[str] = None
+
+
+def check_key(key: str) -> str:
+    parts = key.split("/")
+    if not key or key.startswith("/") or any(part in ("", ".", "..") or part.startswith(".") for part in parts):
+        raise ValueError(f"invalid storage key {key!r}")
+    return key
+
+
+def content_key(prefix: str, digest: str, suffix: str = "") -> str:
+    """
+    Key of content-addressed data: identical content maps to the same key,
+    so it is stored once and can be looked up by hash.
+    """
+    return check_key(f"{prefix}/{digest}{suffix}")
+
+
+def create_storage(default_root: str, scratch_dir: Optional[str] = None, backend: str = STORAGE_BACKEND):
+    """
+    Storage for a service. The local backend keeps objects under STORAGE_ROOT
+    or default_root; scratch_dir is where remote objects are downloaded when
+    a caller needs them as local files.
+    """
+    if backend == "local":
+        from .local import LocalStorage
+        return LocalStorage(STORAGE_ROOT or default_root)
+    if backend == "s3":
+        from .s3 import S3Storage
+        return S3Storage(scratch_dir=scratch_dir)
+    raise ValueError(f"unknown STORAGE_BACKEND {backend!r}")
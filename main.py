@@ -10,6 +10,68 @@ import argparse
 load_dotenv()
 
 
+def split_db_pool(max_connections, workers):
+    """
+    Splits a total DB connection budget across uvicorn workers, keeping the
+    1:2 pool_size:max_overflow ratio of the single-worker defaults.
+    Raises ValueError if the budget is less than one connection per worker.
+    """
+    if workers > max_connections:
+        raise ValueError(
+            f"--db-max-connections {max_connections} is less than one connection for each of the "
+            f"{workers} workers: raise it or lower --workers"
+        )
+    per_worker = max_connections // workers
+    pool_size = max(1, per_worker // 3)
+    return pool_size, per_worker - pool_size
+
+
+def bulk_register(args):
+    import asyncio
+    import json
+    from app.auth_service.api.auth.bulk_register import parse_user_records, provision_users
+
+    fmt = args.format or ("csv" if args.file.endswith(".csv") else "jsonl")
+    counts = {}
+
+    async def run(f):
+        records = parse_user_records(f, fmt)
+        async for result in provision_users(records, batch_size=args.batch_size):
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            sys.stdout.write(json.dumps(result) + "\n")
+
+    if args.file == "-":
+        asyncio.run(run(sys.stdin.buffer))
+    else:
+        with open(args.file, "rb") as f:
+            asyncio.run(run(f))
+    print(f"bulk-register finished: {counts}", file=sys.stderr)
+
+
+def migrate(args):
+    import asyncio
+    from app.db_util.db_conn import dispose_engine
+    from app.db_util.migrations import HEAD, MIGRATIONS, current_version, migrate as apply_migrations
+
+    async def run():
+        try:
+            version = await current_version()
+            if args.status:
+                print(f"schema version {version}, latest {HEAD}")
+                for migration in MIGRATIONS:
+                    if migration.version > version:
+                        print(f"pending: {migration.version} {migration.description}")
+                return
+            applied = await apply_migrations(args.to)
+            for migration in applied:
+                print(f"applied: {migration.version} {migration.description}")
+            print(f"schema version {applied[-1].version if applied else version}")
+        finally:
+            await dispose_engine()
+
+    asyncio.run(run())
+
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(
@@ -20,24 +82,129 @@ if __name__ == "__main__":
     parser.add_argument(
         '--service',
         choices=['auth', 'notification', 'convert'],
-        required=True,
         help="The service to run. Must be either 'auth' or 'notification' or 'convert."
     )
 
     parser.add_argument(
         '--port',
         type=int, 
-        required=True,
         help="On which port to run the service."
     )
 
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=int(os.getenv("UVICORN_WORKERS", os.cpu_count() or 1)),
+        help="Number of worker processes (default: UVICORN_WORKERS or the CPU count)."
+    )
+
+    parser.add_argument(
+        '--loop',
+        choices=['auto', 'asyncio', 'uvloop'],
+        default=os.getenv("UVICORN_LOOP", "asyncio"),
+        help="Event loop implementation; uvloop must be installed."
+    )
+
+    parser.add_argument(
+        '--http',
+        choices=['auto', 'h11', 'httptools'],
+        default=os.getenv("UVICORN_HTTP", "auto"),
+        help="HTTP protocol implementation; httptools must be installed."
+    )
+
+    parser.add_argument(
+        '--backlog',
+        type=int,
+        default=int(os.getenv("UVICORN_BACKLOG", 2048)),
+        help="Maximum number of pending connections."
+    )
+
+    parser.add_argument(
+        '--keep-alive',
+        type=int,
+        default=int(os.getenv("UVICORN_KEEP_ALIVE", 5)),
+        help="Seconds to keep idle connections open."
+    )
+
+    parser.add_argument(
+        '--limit-concurrency',
+        type=int,
+        default=int(os.getenv("UVICORN_LIMIT_CONCURRENCY", 0)) or None,
+        help="Per-worker cap on concurrent connections/tasks before answering 503."
+    )
+
+    parser.add_argument(
+        '--db-max-connections',
+        type=int,
+        # Leaves headroom under Postgres' default max_connections=100 for the
+        # other services and admin sessions.
+        default=int(os.getenv("DB_MAX_CONNECTIONS", 40)),
+        help="Total DB connections this service may open, split across workers.\n"
+             "Ignored if DB_POOL_SIZE/DB_MAX_OVERFLOW are set explicitly."
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+
+    bulk_parser = subparsers.add_parser(
+        'bulk-register',
+        help="Register users from a JSONL or CSV file ('-' for stdin) straight into the database."
+    )
+    bulk_parser.add_argument('file', help="JSONL/CSV file with user_name, password and email per row.")
+    bulk_parser.add_argument('--format', choices=['jsonl', 'csv'], help="Defaults to csv for *.csv files, jsonl otherwise.")
+    bulk_parser.add_argument('--batch-size', type=int, default=500, help="Users hashed and inserted per batch.")
+
+    migrate_parser = subparsers.add_parser(
+        'migrate',
+        help="Apply the pending database schema migrations; run before starting new service versions."
+    )
+    migrate_parser.add_argument('--to', type=int, help="Stop at this schema version (default: the latest).")
+    migrate_parser.add_argument('--status', action='store_true', help="Only show the current version and pending migrations.")
+
     args = parser.parse_args()
-    
+
+    if args.command == 'bulk-register':
+        bulk_register(args)
+        sys.exit(0)
+
+    if args.command == 'migrate':
+        migrate(args)
+        sys.exit(0)
+
+    if args.service is None or args.port is None:
+        parser.error("--service and --port are required to run a service")
+
+    # Workers are spawned from this process and inherit its environment, which
+    # is where app/db_util/db_conn.py picks its pool size up from.
+    if "DB_POOL_SIZE" not in os.environ and "DB_MAX_OVERFLOW" not in os.environ:
+        try:
+            pool_size, max_overflow = split_db_pool(args.db_max_connections, args.workers)
+        except ValueError as e:
+            parser.error(str(e))
+        os.environ["DB_POOL_SIZE"] = str(pool_size)
+        os.environ["DB_MAX_OVERFLOW"] = str(max_overflow)
+    # Same for the CPU-bound pools of each worker (password hashing, ffmpeg
+    # conversions and the segments of a parallel conversion): together they
+    # should use the cores once, not once per worker.
+    cpus_per_worker = str(max(1, (os.cpu_count() or 1) // args.workers))
+    for name in ("PASSWORD_HASH_WORKERS", "CONVERT_WORKERS", "CONVERT_SEGMENT_WORKERS"):
+        os.environ.setdefault(name, cpus_per_worker)
+
+    uvicorn_options = dict(
+        host="0.0.0.0",
+        port=args.port,
+        workers=args.workers,
+        loop=args.loop,
+        http=args.http,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        limit_concurrency=args.limit_concurrency,
+    )
+
     if args.service == 'auth':
-        uvicorn.run("app.auth_service.main:app", host="0.0.0.0", port=args.port, loop="asyncio")
+        uvicorn.run("app.auth_service.main:app", **uvicorn_options)
     elif args.service == 'notification':
-        uvicorn.run("app.notification.main:app", host="0.0.0.0", port=args.port, loop="asyncio")
+        uvicorn.run("app.notification.main:app", **uvicorn_options)
     elif args.service == 'convert':
-        uvicorn.run("app.convert.main:app", host="0.0.0.0", port=args.port, loop="asyncio")
+        uvicorn.run("app.convert_service.main:app", **uvicorn_options)
     else:
         raise NotImplementedError(f"Error: Unhandled service type: {args.service}")
\ No newline at end of file
@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from typing import Dict, List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from app.auth_util.passwords import argon2_context, calibrate_time_cost  # noqa: E402
+
+# time_cost:memory_cost(KiB):parallelism. passlib's defaults first, then
+# OWASP's recommended argon2id settings.
+DEFAULT_SETS = ["3:65536:4", "2:19456:1", "1:47104:1", "3:12288:1", "2:65536:1"]
+
+
+def parse_set(spec: str) -> Tuple[int, int, int]:
+    time_cost, memory_cost, parallelism = (int(part) for part in spec.split(":"))
+    return time_cost, memory_cost, parallelism
+
+
+def hash_for(context, seconds: float, counts: List[int], index: int) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        context.hash("benchmark password")
+        counts[index] += 1
+
+
+def run_threads(context, threads: int, seconds: float) -> float:
+    """Hashes per second with `threads` threads hashing concurrently."""
+    counts = [0] * threads
+    workers = [threading.Thread(target=hash_for, args=(context, seconds, counts, i)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def bench(sets: List[str], threads: int, seconds: float) -> List[Dict]:
+    cores = os.cpu_count() or 1
+    results = []
+    for spec in sets:
+        time_cost, memory_cost, parallelism = parse_set(spec)
+        context = argon2_context(time_cost, memory_cost, parallelism)
+        context.hash("warm-up")
+        single = run_threads(context, 1, seconds)
+        loaded = run_threads(context, threads, seconds)
+        results.append({
+            "time_cost": time_cost,
+            "memory_cost_kib": memory_cost,
+            "parallelism": parallelism,
+            "latency_ms": round(1000 / single, 1),
+            "hashes_per_s_1_thread": round(single, 2),
+            f"hashes_per_s_{threads}_threads": round(loaded, 2),
+            # Login throughput each core adds when every worker thread is busy.
+            "hashes_per_s_per_core": round(loaded / min(threads, cores), 2),
+        })
+        print(json.dumps(results[-1]))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="argon2 hashing throughput per parameter set.")
+    parser.add_argument("--sets", nargs="+", default=DEFAULT_SETS,
+                        help="Parameter sets as time_cost:memory_cost_kib:parallelism.")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1,
+                        help="Concurrent hashing threads for the loaded run (PASSWORD_HASH_WORKERS).")
+    parser.add_argument("--seconds", type=float, default=5, help="Duration of each run.")
+    parser.add_argument("--calibrate-ms", type=float, nargs="*", default=[],
+                        help="Also report the time cost ARGON2_TARGET_MS would pick for each set's memory/parallelism.")
+    parser.add_argument("--output", help="Write results as JSON to this file.")
+    args = parser.parse_args()
+
+    results = bench(args.sets, args.threads, args.seconds)
+    calibration = []
+    for target_ms in args.calibrate_ms:
+        for spec in args.sets:
+            _, memory_cost, parallelism = parse_set(spec)
+            calibration.append({
+                "target_ms": target_ms,
+                "memory_cost_kib": memory_cost,
+                "parallelism": parallelism,
+                "time_cost": calibrate_time_cost(target_ms / 1000, memory_cost, parallelism),
+            })
+            print(json.dumps(calibration[-1]))
+    report = {
+        "host": {"platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": {"threads": args.threads, "seconds": args.seconds},
+        "results": results,
+        "calibration": calibration,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
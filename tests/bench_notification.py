@@ -0,0 +1,138 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+# The dispatcher looks addresses up in the users table; default to a
+# throwaway SQLite database so the benchmark runs offline.
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='notify-bench-')}/bench.db")
+
+from app.db_util.db_conn import AsyncSessionLocal, dispose_engine  # noqa: E402
+from app.db_util.migrations import migrate  # noqa: E402
+from app.db_util.models import User  # noqa: E402
+from app.notification.api.notify.channels import SmtpChannel, WebhookChannel  # noqa: E402
+from app.notification.api.notify.dispatcher import NotificationDispatcher  # noqa: E402
+from app.notification.stand_in import start_stand_ins  # noqa: E402
+
+
+async def create_users(count: int):
+    await migrate()
+    ids = [uuid.uuid4() for _ in range(count)]
+    async with AsyncSessionLocal() as db:
+        db.add_all(
+            User(id=user_id, username=f"bench-{user_id.hex}", email=f"bench-{user_id.hex}@example.com", password_hash="x")
+            for user_id in ids
+        )
+        await db.commit()
+    return [str(user_id) for user_id in ids]
+
+
+async def run(args) -> dict:
+    smtp, webhook, servers = await start_stand_ins(args.smtp_port, args.http_port, args.fail_rate)
+    channels = []
+    if "email" in args.channels:
+        channels.append(SmtpChannel("127.0.0.1", args.smtp_port, pool_size=args.concurrency))
+    if "webhook" in args.channels:
+        channels.append(WebhookChannel(f"http://127.0.0.1:{args.http_port}/hook", pool_size=args.concurrency))
+    dispatcher = NotificationDispatcher(
+        channels,
+        coalesce_seconds=args.coalesce_seconds,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+    )
+    user_ids = await create_users(args.users)
+    # Time of the first flush that handed notifications to delivery, i.e. the
+    # end of the first coalescing window.
+    first_flush = []
+    flush_due = dispatcher._flush_due
+
+    async def timed_flush_due(everything: bool = False) -> None:
+        coalescing = len(dispatcher._coalescing)
+        await flush_due(everything)
+        if not first_flush and len(dispatcher._coalescing) < coalescing:
+            first_flush.append(time.perf_counter())
+
+    dispatcher._flush_due = timed_flush_due
+    dispatcher.start()
+
+    # Bursts: each user finishes several conversions close together, spread
+    # over --submit-seconds so later events can land in later windows.
+    events = [
+        {"job_id": str(uuid.uuid4()), "user_id": random.choice(user_ids), "status": "done", "error": None}
+        for _ in range(args.events)
+    ]
+    submits = range(0, len(events), args.submit_batch)
+    pause = args.submit_seconds / len(submits)
+    start = time.perf_counter()
+    for offset in submits:
+        dispatcher.submit(events[offset:offset + args.submit_batch])
+        await asyncio.sleep(pause)
+    submitted = time.perf_counter() - start
+    # Let the flush loop close every window on its own, as in production;
+    # drain() would flush them early.
+    deadline = time.monotonic() + args.timeout
+    while dispatcher._pending and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    delivery = elapsed - (first_flush[0] - start) if first_flush else None
+
+    await dispatcher.stop()
+    for server in servers:
+        server.close()
+        await server.wait_closed()
+    await dispose_engine()
+
+    messages = smtp.messages if "email" in args.channels else webhook.notifications
+    return {
+        "events": args.events,
+        "users": args.users,
+        "submit_s": round(submitted, 3),
+        # Includes the coalescing windows, which are pure waiting.
+        "elapsed_s": round(elapsed, 3),
+        # From the first flush until the last notification was delivered.
+        "delivery_s": round(delivery, 3) if delivery is not None else None,
+        "undelivered_events": dispatcher._pending,
+        "events_per_s": round(args.events / elapsed, 1),
+        "messages": messages,
+        "coalescing_ratio": round(args.events / messages, 2) if messages else None,
+        "emails": smtp.messages,
+        "smtp_connections": smtp.connections,
+        "smtp_rejected": smtp.rejected,
+        "webhook_notifications": webhook.notifications,
+        "webhook_requests": webhook.requests,
+        "webhook_connections": webhook.connections,
+        "webhook_rejected": webhook.rejected,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput benchmark of notification delivery against local stand-ins.")
+    parser.add_argument("--events", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--channels", nargs="+", choices=["email", "webhook"], default=["email", "webhook"])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--submit-batch", type=int, default=200, help="Events per submit call (one ingest request).")
+    parser.add_argument("--coalesce-seconds", type=float, default=1.0)
+    parser.add_argument("--submit-seconds", type=float, default=2.0, help="Spread the submits over this long.")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of deliveries the stand-ins reject.")
+    parser.add_argument("--smtp-port", type=int, default=2526)
+    parser.add_argument("--http-port", type=int, default=8026)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", help="Write results as JSON to this file.")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"host": {"platform": platform.platform(), "cpus": os.cpu_count()},
+                       "settings": vars(args), "result": result}, f, indent=2)
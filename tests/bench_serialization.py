@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from sqlalchemy import create_engine, select  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.auth_service.api.auth.user_auth import USER_RESPONSE_COLUMNS, Token_Response, User_Response  # noqa: E402
+from app.db_util.db_conn import Base  # noqa: E402
+from app.db_util.models import User  # noqa: E402
+
+PASSWORD_HASH = "$argon2id$v=19$m=65536,t=3,p=4$" + "x" * 22 + "$" + "y" * 43
+ACCESS_TOKEN = "eyJhbGciOiJFZERTQSIsImtpZCI6IjIwMjYxMDE3LWFiY2QifQ." + "p" * 180 + "." + "s" * 86
+
+
+def sample_user(n: int = 0) -> User:
+    return User(
+        id=uuid.uuid4(), username=f"bench_user_{n}", email=f"bench_user_{n}@bench.local", password_hash=PASSWORD_HASH,
+        role="user", is_active=True, created_at=datetime.now(timezone.utc),
+    )
+
+
+def serialization_cases() -> Dict[str, Dict[str, Callable[[], bytes]]]:
+    """
+    Per endpoint, the response body as it was built before (ORM object or
+    hand-built dict through jsonable_encoder and JSONResponse, which is what
+    FastAPI does for a return value without a response model) and now.
+    """
+    user = sample_user()
+    lean = User_Response.from_row(user)
+    token = Token_Response(ACCESS_TOKEN, "bearer", 900, "r" * 43)
+    register_dict = {
+        "id": str(user.id), "username": user.username, "email": user.email,
+        "active": user.is_active, "role": user.role, "cerated_at": user.created_at,
+    }
+    login_dict = {"access_token": ACCESS_TOKEN, "token_type": "bearer"}
+    return {
+        "me": {
+            "before": lambda: JSONResponse(jsonable_encoder(user)).body,
+            "after": lambda: ORJSONResponse(lean).body,
+        },
+        "register": {
+            "before": lambda: JSONResponse(jsonable_encoder(register_dict)).body,
+            "after": lambda: ORJSONResponse(lean).body,
+        },
+        "login": {
+            "before": lambda: JSONResponse(jsonable_encoder(login_dict)).body,
+            "after": lambda: ORJSONResponse(token).body,
+        },
+    }
+
+
+def load_cases(rows: int) -> Dict[str, Callable[[], object]]:
+    """/me's user lookup: the full ORM entity before, the response columns now."""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[User.__table__])
+    users = [sample_user(n) for n in range(rows)]
+    ids = [user.id for user in users]
+    with Session(engine) as session:
+        session.add_all(users)
+        session.commit()
+    counter = iter(range(10 ** 12))
+
+    def entity():
+        with Session(engine) as session:
+            return session.execute(select(User).where(User.id == ids[next(counter) % rows])).scalar_one()
+
+    def columns():
+        with Session(engine) as session:
+            row = session.execute(select(*USER_RESPONSE_COLUMNS).where(User.id == ids[next(counter) % rows])).one()
+            return User_Response.from_row(row)
+
+    return {"before": entity, "after": columns}
+
+
+def time_us(fn: Callable, number: int, repeat: int) -> float:
+    """Best per-call time in microseconds over `repeat` runs of `number` calls."""
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+
+
+def bench(number: int, repeat: int, rows: int) -> List[Dict]:
+    results = []
+    for endpoint, case in serialization_cases().items():
+        before, after = time_us(case["before"], number, repeat), time_us(case["after"], number, repeat)
+        results.append({
+            "case": f"serialize {endpoint}",
+            "before_us": round(before, 2),
+            "after_us": round(after, 2),
+            "speedup": round(before / after, 1),
+            "before_bytes": len(case["before"]()),
+            "after_bytes": len(case["after"]()),
+        })
+        print(json.dumps(results[-1]))
+    case = load_cases(rows)
+    before = time_us(case["before"], number // 10 or 1, repeat)
+    after = time_us(case["after"], number // 10 or 1, repeat)
+    results.append({
+        "case": "load me",
+        "before_us": round(before, 2),
+        "after_us": round(after, 2),
+        "speedup": round(before / after, 1),
+    })
+    print(json.dumps(results[-1]))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-request response serialization cost of the auth endpoints, before and after.")
+    parser.add_argument("--number", type=int, default=20000, help="Calls per timing run (a tenth of that for the DB loads).")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs; the best one counts.")
+    parser.add_argument("--rows", type=int, default=1000, help="Users in the in-memory SQLite table for the load case.")
+    parser.add_argument("--output", help="Write results as JSON to this file.")
+    args = parser.parse_args()
+
+    results = bench(args.number, args.repeat, args.rows)
+    report = {
+        "host": {"platform": platform.platform(), "python": platform.python_version()},
+        "settings": {"number": args.number, "repeat": args.repeat, "rows": args.rows},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
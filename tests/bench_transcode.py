@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from app.convert_service.api.convert.convert_mp4 import FFMPEG_BIN, transcode_file  # noqa: E402
+from app.convert_service.api.convert.parallel_transcode import transcode_file_parallel  # noqa: E402
+
+
+def make_input(path: str, seconds: int) -> None:
+    """Synthetic AAC-in-MP4 input: a tone under noise, so the encoder has real work to do."""
+    subprocess.run(
+        [
+            FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+            "-f", "lavfi", "-i", f"anoisesrc=d={seconds}:a=0.1",
+            "-filter_complex", "[0][1]amix=inputs=2",
+            "-c:a", "aac", "-b:a", "128k", "-ar", "44100", path,
+        ],
+        check=True,
+    )
+
+
+async def timed(coro) -> float:
+    start = time.perf_counter()
+    await coro
+    return time.perf_counter() - start
+
+
+async def bench(durations: List[int], bitrate: str, segment_seconds: float, workers: int, repeat: int) -> List[Dict]:
+    workdir = tempfile.mkdtemp(prefix="transcode-bench-")
+    results = []
+    try:
+        for seconds in durations:
+            source = os.path.join(workdir, f"in-{seconds}.mp4")
+            make_input(source, seconds)
+            single, parallel = [], []
+            for _ in range(repeat):
+                single.append(await timed(transcode_file(source, os.path.join(workdir, "single.mp3"), bitrate)))
+                parallel.append(await timed(transcode_file_parallel(
+                    source, os.path.join(workdir, "parallel.mp3"), bitrate,
+                    segment_seconds=segment_seconds, workers=workers,
+                )))
+            best_single, best_parallel = min(single), min(parallel)
+            results.append({
+                "duration_s": seconds,
+                "single_s": round(best_single, 3),
+                "parallel_s": round(best_parallel, 3),
+                "speedup": round(best_single / best_parallel, 2),
+                "single_bytes": os.path.getsize(os.path.join(workdir, "single.mp3")),
+                "parallel_bytes": os.path.getsize(os.path.join(workdir, "parallel.mp3")),
+            })
+            print(json.dumps(results[-1]))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare single-process and segment-parallel MP3 transcoding.")
+    parser.add_argument("--durations", type=int, nargs="+", default=[60, 300, 900, 1800],
+                        help="Input durations in seconds.")
+    parser.add_argument("--bitrate", default="192k")
+    parser.add_argument("--segment-seconds", type=float, default=120)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per path; the best time is reported.")
+    parser.add_argument("--output", help="Write results as JSON to this file.")
+    args = parser.parse_args()
+
+    results = asyncio.run(bench(args.durations, args.bitrate, args.segment_seconds, args.workers, args.repeat))
+    report = {
+        "host": {"platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": {"bitrate": args.bitrate, "segment_seconds": args.segment_seconds, "workers": args.workers},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,318 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from test_api import AuthAPITester, TestUser
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ["register", "login", "refresh", "me"]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict:
+    latencies = sorted(latencies)
+    total = len(latencies) + errors
+    return {
+        "requests": total,
+        "ok": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(latencies[-1], 2) if latencies else 0.0,
+        },
+    }
+
+
+class AuthLoadTester(AuthAPITester):
+    """
+    Load generator for the register, login, refresh and me endpoints.
+
+    Closed-loop mode runs `concurrency` workers back to back. Open-loop mode
+    (rate > 0) starts requests on a fixed schedule whether or not earlier ones
+    finished, and measures latency from the scheduled start so a slow server
+    can't hide its queueing delay.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:8000", user_pool_size: int = 20):
+        super().__init__(base_url)
+        self.login_endpoint = f"{self.base_url}/auth/login"
+        self.me_endpoint = f"{self.base_url}/auth/me"
+        self.refresh_endpoint = f"{self.base_url}/auth/refresh"
+        self.user_pool_size = user_pool_size
+        self.users: List[TestUser] = []
+        self.tokens: List[str] = []
+        # Refresh tokens of idle sessions; a refresh takes one out and puts
+        # the rotated one back, since two concurrent uses of a refresh token
+        # would revoke its session.
+        self.refresh_tokens: List[str] = []
+        self._counter = 0
+
+    async def _login(self, session: aiohttp.ClientSession, user: TestUser) -> None:
+        async with session.post(self.login_endpoint, json=user.__dict__) as response:
+            response.raise_for_status()
+            body = await response.json()
+        self.tokens.append(body["access_token"])
+        self.refresh_tokens.append(body["refresh_token"])
+
+    async def setup(self, session: aiohttp.ClientSession, scenario: str, sessions: int = 0):
+        if scenario == "register":
+            return
+        if not self.users:
+            for i in range(self.user_pool_size):
+                user = TestUser(f"bench_{uuid.uuid4().hex[:10]}", "benchpass123")
+                user.email = f"{user.user_name}@bench.local"
+                async with session.post(self.register_endpoint, json=user.__dict__) as response:
+                    response.raise_for_status()
+                await self._login(session, user)
+                self.users.append(user)
+        if scenario == "refresh":
+            # One session per concurrent request.
+            while len(self.refresh_tokens) < sessions:
+                missing = sessions - len(self.refresh_tokens)
+                await asyncio.gather(*(self._login(session, user) for user in self.users[:missing]))
+
+    async def _request(self, session: aiohttp.ClientSession, scenario: str) -> bool:
+        self._counter += 1
+        if scenario == "register":
+            user_name = f"bench_{uuid.uuid4().hex[:12]}"
+            payload = {"user_name": user_name, "password": "benchpass123", "email": f"{user_name}@bench.local"}
+            request = session.post(self.register_endpoint, json=payload)
+        elif scenario == "login":
+            request = session.post(self.login_endpoint, json=self.users[self._counter % len(self.users)].__dict__)
+        elif scenario == "refresh":
+            if not self.refresh_tokens:
+                return False  # more requests in flight than sessions (open-loop overload)
+            refresh_token = self.refresh_tokens.pop()
+            async with session.post(self.refresh_endpoint, json={"refresh_token": refresh_token}) as response:
+                if response.status != 200:
+                    return False
+                self.refresh_tokens.append((await response.json())["refresh_token"])
+                return True
+        else:
+            token = self.tokens[self._counter % len(self.tokens)]
+            request = session.get(self.me_endpoint, headers={"Authorization": f"Bearer {token}"})
+        async with request as response:
+            await response.read()
+            return response.status == 200
+
+    async def _closed_loop(self, session, scenario, concurrency, requests, duration):
+        latencies, errors = [], 0
+        deadline = time.perf_counter() + duration if duration else None
+        remaining = requests
+
+        async def worker():
+            nonlocal errors, remaining
+            while True:
+                if deadline is not None:
+                    if time.perf_counter() >= deadline:
+                        return
+                elif remaining <= 0:
+                    return
+                else:
+                    remaining -= 1
+                start = time.perf_counter()
+                try:
+                    ok = await self._request(session, scenario)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    ok = False
+                if ok:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, errors, time.perf_counter() - start
+
+    async def _open_loop(self, session, scenario, rate, requests, duration):
+        latencies, errors = [], 0
+        total = int(rate * duration) if duration else requests
+        start = time.perf_counter()
+
+        async def fire(scheduled):
+            nonlocal errors
+            try:
+                ok = await self._request(session, scenario)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - scheduled) * 1000)
+            else:
+                errors += 1
+
+        tasks = []
+        for i in range(total):
+            scheduled = start + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(fire(scheduled)))
+        await asyncio.gather(*tasks)
+        return latencies, errors, time.perf_counter() - start
+
+    async def run(self, scenario: str, concurrency: int = 10, requests: int = 200,
+                  duration: Optional[float] = None, warmup: int = 20, rate: float = 0) -> Dict:
+        connector = aiohttp.TCPConnector(limit=max(concurrency, 100))
+        timeout = aiohttp.ClientTimeout(total=60)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            await self.setup(session, scenario, sessions=concurrency)
+            if warmup:
+                await self._closed_loop(session, scenario, min(concurrency, warmup), warmup, None)
+            if rate:
+                latencies, errors, elapsed = await self._open_loop(session, scenario, rate, requests, duration)
+            else:
+                latencies, errors, elapsed = await self._closed_loop(session, scenario, concurrency, requests, duration)
+
+        result = {"scenario": scenario, "concurrency": concurrency, "rate": rate}
+        result.update(summarize(latencies, errors, elapsed))
+        return result
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> List[str]:
+    """Returns a message for every run whose p95 or throughput regressed by more than threshold %."""
+    def key(run):
+        return run["scenario"], run["concurrency"], run["rate"]
+
+    old_runs = {key(run): run for run in baseline["runs"]}
+    regressions = []
+    for run in current["runs"]:
+        old = old_runs.get(key(run))
+        if old is None:
+            continue
+        name = "{} c={} rate={}".format(*key(run))
+        old_p95, new_p95 = old["latency_ms"]["p95"], run["latency_ms"]["p95"]
+        if old_p95 and (new_p95 - old_p95) / old_p95 * 100 > threshold:
+            regressions.append(f"{name}: p95 {old_p95}ms -> {new_p95}ms")
+        old_rps, new_rps = old["throughput_rps"], run["throughput_rps"]
+        if old_rps and (old_rps - new_rps) / old_rps * 100 > threshold:
+            regressions.append(f"{name}: throughput {old_rps} -> {new_rps} req/s")
+    return regressions
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_local_service(workdir: str) -> tuple:
+    """Starts the auth service on a free port backed by a throwaway SQLite database."""
+    port = _free_port()
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(workdir, 'bench.db')}")
+    env.setdefault("JWT_KEYS_DIR", os.path.join(workdir, "keys"))
+    # Every request comes from one address and a handful of users; keep the
+    # rate limits out of the measurements.
+    env.setdefault("RATE_LIMIT_IP_PER_MINUTE", "0")
+    env.setdefault("RATE_LIMIT_USER_PER_MINUTE", "0")
+    subprocess.run([sys.executable, "main.py", "migrate"], cwd=REPO_ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+    process = subprocess.Popen(
+        [sys.executable, "main.py", "--service", "auth", "--port", str(port)],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("auth service did not start within 30s")
+
+
+async def main(args) -> Dict:
+    process = None
+    workdir = tempfile.mkdtemp(prefix="auth-bench-")
+    base_url = args.base_url
+    if args.spawn:
+        process, base_url = start_local_service(workdir)
+
+    tester = AuthLoadTester(base_url=base_url, user_pool_size=args.user_pool)
+    runs = []
+    try:
+        for scenario in args.scenario:
+            for concurrency in args.concurrency:
+                print(f"🚀 {scenario}: concurrency={concurrency} rate={args.rate or 'closed-loop'}")
+                result = await tester.run(
+                    scenario, concurrency=concurrency, requests=args.requests,
+                    duration=args.duration, warmup=args.warmup, rate=args.rate,
+                )
+                latency = result["latency_ms"]
+                print(f"   {result['throughput_rps']} req/s, p50 {latency['p50']}ms, "
+                      f"p95 {latency['p95']}ms, p99 {latency['p99']}ms, errors {result['errors']}")
+                runs.append(result)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "base_url": base_url,
+            "spawned": bool(args.spawn),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "requests": args.requests,
+            "duration": args.duration,
+            "warmup": args.warmup,
+        },
+        "runs": runs,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the auth service endpoints.")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--spawn", action="store_true", help="Start a local auth service backed by SQLite.")
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 10, 50])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per run (ignored with --duration).")
+    parser.add_argument("--duration", type=float, help="Seconds per run instead of a request count.")
+    parser.add_argument("--warmup", type=int, default=20, help="Requests sent and discarded before each run.")
+    parser.add_argument("--rate", type=float, default=0, help="Open-loop mode: requests per second.")
+    parser.add_argument("--user-pool", type=int, default=20, help="Users created up front for login/me.")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Baseline results file to check for regressions.")
+    parser.add_argument("--threshold", type=float, default=10, help="Allowed regression in percent.")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Results saved to '{args.output}'")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        for line in regressions:
+            print(f"❌ {line}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against baseline")
@@ -0,0 +1,183 @@
+"""
+Cold start checks for the auth service: import time, time from process
+start to the first answered request (on a migrated throwaway SQLite
+database, needs aiosqlite), and that the migrations produce the schema the
+models describe.
+
+Run with pytest, or directly for a JSON report:
+
+    python tests/test_startup.py --runs 5 --output startup.json
+
+Exits non-zero when a median is over its budget.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from urllib.error import URLError
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+IMPORT_BUDGET_SECONDS = float(os.getenv("STARTUP_IMPORT_BUDGET_SECONDS", 1.5))
+FIRST_REQUEST_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", 3.0))
+
+# Imports the app in a fresh interpreter and reports how long that took and
+# whether anything expensive was built on the way.
+IMPORT_PROBE = """
+import json, time
+start = time.perf_counter()
+import app.auth_service.main
+seconds = time.perf_counter() - start
+from app.db_util import db_conn
+from app.auth_util import passwords
+print(json.dumps({
+    "seconds": seconds,
+    "engine_created": db_conn._engine is not None,
+    "crypt_context_created": passwords._pwd_context is not None,
+}))
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _env(workdir: str) -> dict:
+    env = dict(os.environ)
+    env["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(workdir, 'startup.db')}"
+    env.setdefault("JWT_KEYS_DIR", os.path.join(workdir, "keys"))
+    return env
+
+
+def migrate_database(workdir: str) -> None:
+    subprocess.run([sys.executable, "main.py", "migrate"], cwd=REPO_ROOT, env=_env(workdir),
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+def measure_import(workdir: str) -> dict:
+    env = _env(workdir)
+    # Without a database URL: importing must not need one.
+    del env["DATABASE_URL"]
+    output = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=REPO_ROOT, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def measure_first_request(workdir: str, timeout: float = 30) -> float:
+    """Seconds from spawning `main.py --service auth` to its first answered request."""
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "main.py", "--service", "auth", "--port", str(port), "--workers", "1"],
+        cwd=REPO_ROOT, env=_env(workdir), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"auth service exited with {process.returncode} during startup")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    response.read()
+                return time.perf_counter() - start
+            except (URLError, ConnectionError):
+                time.sleep(0.01)
+        raise RuntimeError(f"auth service did not answer within {timeout:g}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def schema_differences(workdir: str) -> list:
+    """Tables, columns and indexes the models have but the migrated database lacks, or vice versa."""
+    from sqlalchemy import create_engine, inspect
+
+    from app.db_util.db_conn import Base
+    from app.db_util import models  # noqa: F401  registers the tables on Base
+
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'startup.db')}")
+    try:
+        inspector = inspect(engine)
+        differences = []
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                differences.append(f"missing table {table.name}")
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            expected = {column.name for column in table.columns}
+            differences += [f"{table.name}: missing column {name}" for name in sorted(expected - columns)]
+            differences += [f"{table.name}: extra column {name}" for name in sorted(columns - expected)]
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            expected = {index.name for index in table.indexes}
+            differences += [f"{table.name}: missing index {name}" for name in sorted(expected - indexes)]
+        return differences
+    finally:
+        engine.dispose()
+
+
+def run(runs: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix="startup-") as workdir:
+        migrate_database(workdir)
+        imports = [measure_import(workdir) for _ in range(runs)]
+        first_requests = [measure_first_request(workdir) for _ in range(runs)]
+        differences = schema_differences(workdir)
+    import_seconds = statistics.median(probe["seconds"] for probe in imports)
+    first_request_seconds = statistics.median(first_requests)
+    return {
+        "runs": runs,
+        "import_seconds": round(import_seconds, 3),
+        "import_budget_seconds": IMPORT_BUDGET_SECONDS,
+        "first_request_seconds": round(first_request_seconds, 3),
+        "first_request_budget_seconds": FIRST_REQUEST_BUDGET_SECONDS,
+        "engine_created_at_import": any(probe["engine_created"] for probe in imports),
+        "crypt_context_created_at_import": any(probe["crypt_context_created"] for probe in imports),
+        "schema_differences": differences,
+        "ok": (
+            import_seconds <= IMPORT_BUDGET_SECONDS
+            and first_request_seconds <= FIRST_REQUEST_BUDGET_SECONDS
+            and not differences
+        ),
+    }
+
+
+def test_import_is_lazy(tmp_path):
+    probe = measure_import(str(tmp_path))
+    assert not probe["engine_created"]
+    assert not probe["crypt_context_created"]
+
+
+def test_migrations_match_models(tmp_path):
+    migrate_database(str(tmp_path))
+    assert schema_differences(str(tmp_path)) == []
+
+
+def test_cold_start_within_budget(tmp_path):
+    workdir = str(tmp_path)
+    migrate_database(workdir)
+    runs = 3
+    import_seconds = statistics.median(measure_import(workdir)["seconds"] for _ in range(runs))
+    first_request_seconds = statistics.median(measure_first_request(workdir) for _ in range(runs))
+    assert import_seconds <= IMPORT_BUDGET_SECONDS, f"import took {import_seconds:.2f}s"
+    assert first_request_seconds <= FIRST_REQUEST_BUDGET_SECONDS, f"first request after {first_request_seconds:.2f}s"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Auth service cold start time against its budget.")
+    parser.add_argument("--runs", type=int, default=3, help="Cold starts measured; the median is compared.")
+    parser.add_argument("--output", help="Write the report as JSON to this file.")
+    args = parser.parse_args()
+
+    report = run(args.runs)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report["ok"] else 1)